@@ -1,20 +1,17 @@
 import streamlit as st
 import os
-from local_storage import initialize_local_storage, read_data, push_data, update_data, write_data
-from inventory_manager import inventory_management_page
-from sales_interface import sales_interface_page
-from turned_away_tracker import turned_away_tracker_page, add_turned_away_entry
-from export_manager import export_data_page, generate_export
-from statistics_page import statistics_page
+from storage import initialize_storage, read_data, commit_batch, get_backend_name
+from turned_away_tracker import add_turned_away_entry
+from utils import item_details
 from datetime import datetime, timedelta
 import uuid
 
-# Initialize Local Storage
+# Initialize the configured storage backend
 try:
-    initialize_local_storage()
-    st.success("Local storage initialized successfully!")
+    initialize_storage()
+    st.success("Storage initialized successfully!")
 except Exception as e:
-    st.error(f"Failed to initialize local storage: {str(e)}")
+    st.error(f"Failed to initialize storage: {str(e)}")
     st.stop()
 
 def main():
@@ -37,12 +34,37 @@ def main():
     import datetime
     st.sidebar.info(f"Date: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M')}")
     
-    # Route to appropriate page
+    # Show how far behind the live Firebase data the local mirrors may be
+    if get_backend_name() == "firebase":
+        from firebase_config import get_mirror_stats, get_outbox_stats, OUTBOX_ENABLED
+        for collection, stats in get_mirror_stats().items():
+            if stats['staleness_seconds'] is not None:
+                status = "live" if stats['listening'] else "polling"
+                st.sidebar.caption(f"{collection}: synced {stats['staleness_seconds']:.0f}s ago ({status})")
+        
+        # Writes waiting in the offline queue
+        if OUTBOX_ENABLED:
+            outbox = get_outbox_stats()
+            if outbox['depth']:
+                message = f"Outbox: {outbox['depth']} waiting, oldest {outbox['oldest_seconds']:.0f}s"
+                if outbox['failures']:
+                    st.sidebar.warning(f"{message} (offline, retrying in {outbox['retry_in_seconds']:.0f}s)")
+                else:
+                    st.sidebar.caption(message)
+            elif outbox['last_flush_latency_seconds'] is not None:
+                st.sidebar.caption(f"Outbox: all sent, last in {outbox['last_flush_latency_seconds']:.1f}s")
+            if outbox['rejected']:
+                st.sidebar.error(f"Outbox: {outbox['rejected']} writes rejected by Firebase")
+    
+    # Route to appropriate page. The other pages (and pandas, plotly and
+    # openpyxl behind them) are imported on first visit, not at cold start.
     if page == "Main Sales Panel":
         main_sales_panel()
     elif page == "Inventory Management":
+        from inventory_manager import inventory_management_page
         inventory_management_page()
     elif page == "Statistics & Analytics":
+        from statistics_page import statistics_page
         statistics_page()
 
 def main_sales_panel():
@@ -116,12 +138,13 @@ def add_item_to_cart(item_id, item_data, quantity):
             st.rerun()
             return
     
-    # Add new item to cart
+    # Add new item to cart, copying the fields reports need from the inventory
     cart_item = {
         'id': item_id,
         'name': item_data['name'],
         'price': item_data['price'],
-        'quantity': quantity
+        'quantity': quantity,
+        **item_details(item_data)
     }
     
     st.session_state.cart.append(cart_item)
@@ -224,11 +247,13 @@ def display_cart_and_controls():
     
     with col1:
         if st.button("📥 Today's Data", width="stretch"):
+            from export_manager import generate_export
             today = datetime.now().date()
             generate_export(today, today, True, True, False)
     
     with col2:
         if st.button("📋 Full Report", width="stretch"):
+            from export_manager import generate_export
             today = datetime.now().date()
             week_start = today - timedelta(days=today.weekday())
             generate_export(week_start, today, True, True, True)
@@ -249,11 +274,11 @@ def complete_transaction(payment_method, customer_notes, total, confirmation_num
         'type': 'sale'
     }
     
-    # Save transaction
-    if push_data('transactions', transaction_data):
-        # Update inventory stock
-        update_inventory_stock()
-        
+    # Save the sale and every stock decrement as one atomic commit
+    operations = [{'op': 'push', 'collection': 'transactions', 'data': transaction_data}]
+    operations += stock_decrement_operations()
+    
+    if commit_batch(operations):
         st.success(f"✅ Transaction completed successfully!")
         st.success(f"Transaction ID: {transaction_id}")
         st.success(f"Total: ${total:.2f}")
@@ -268,28 +293,21 @@ def complete_transaction(payment_method, customer_notes, total, confirmation_num
     else:
         st.error("❌ Failed to complete transaction. Please try again.")
 
-def update_inventory_stock():
-    """Update inventory stock after sale"""
-    inventory = read_data('inventory')
-    
-    if not inventory:
-        return
-    
-    for cart_item in st.session_state.cart:
-        item_id = cart_item['id']
-        quantity_sold = cart_item['quantity']
-        
-        if item_id in inventory:
-            current_stock = inventory[item_id].get('stock', 0)
-            new_stock = max(0, current_stock - quantity_sold)
-            
-            inventory[item_id].update({
-                'stock': new_stock,
-                'updated_at': datetime.now().isoformat()
-            })
-    
-    # Write updated inventory back to storage
-    write_data('inventory', inventory)
+def stock_decrement_operations():
+    """Build the stock decrements for the items in the cart"""
+    updated_at = datetime.now().isoformat()
+    return [
+        {
+            'op': 'increment',
+            'collection': 'inventory',
+            'key': cart_item['id'],
+            'field': 'stock',
+            'amount': -cart_item['quantity'],
+            'minimum': 0,
+            'data': {'updated_at': updated_at}
+        }
+        for cart_item in st.session_state.cart
+    ]
 
 if __name__ == "__main__":
     main()
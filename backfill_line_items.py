@@ -0,0 +1,60 @@
+import streamlit as st
+from storage import initialize_storage, read_data, read_range, read_rollups, commit_batch
+from utils import item_details
+
+# Dates bounding every day with sales, for listing the days through the rollups
+ALL_DATES = ('0000-01-01', '9999-12-31')
+
+# Sales rewritten per commit; a commit locks every record it rewrites at once
+BATCH_SIZE = 200
+
+def needs_details(item):
+    """Check whether a sold item predates category and SKU being stored on it"""
+    return isinstance(item, dict) and 'category' not in item
+
+def backfill_items(items, inventory):
+    """Fill in category and SKU from the inventory; items since deleted get "Other" """
+    return [{**item, **item_details(inventory.get(item.get('id')) or {})} if needs_details(item) else item
+            for item in items]
+
+def backfill_line_items():
+    """Store category and SKU on the items of older sales, one day at a time
+    
+    Sales made before items carried these fields are given the ones the
+    inventory has now. Only one day of sales is held at once, and it is
+    written back in commits of at most BATCH_SIZE sales, so the job can be
+    stopped and rerun.
+    """
+    inventory = read_data('inventory') or {}
+    days = sorted(read_rollups('transactions', *ALL_DATES))
+    counts = {'days': len(days), 'transactions': 0, 'items': 0}
+    
+    for day in days:
+        operations = []
+        missing_items = []
+        for key, transaction in read_range('transactions', day, day).items():
+            items = transaction.get('items')
+            missing = sum(1 for item in items if needs_details(item)) if isinstance(items, list) else 0
+            if missing:
+                operations.append({
+                    'op': 'update',
+                    'collection': 'transactions',
+                    'key': key,
+                    'data': {'items': backfill_items(items, inventory)}
+                })
+                missing_items.append(missing)
+        
+        for start in range(0, len(operations), BATCH_SIZE):
+            if commit_batch(operations[start:start + BATCH_SIZE]) is None:
+                st.error(f"Failed to backfill sales of {day}")
+                return counts
+            # Count only what was written
+            counts['transactions'] += len(operations[start:start + BATCH_SIZE])
+            counts['items'] += sum(missing_items[start:start + BATCH_SIZE])
+    return counts
+
+if __name__ == "__main__":
+    # One-off job for the configured backend: python backfill_line_items.py
+    initialize_storage()
+    counts = backfill_line_items()
+    print(f"Filled in {counts['items']} items of {counts['transactions']} transactions over {counts['days']} days")
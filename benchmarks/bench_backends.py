@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Side-by-side timings of the storage backends through the storage protocol
+Run from the project root: python benchmarks/bench_backends.py [backend ...]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage
+
+SALES = 2000
+DAYS = 10
+
+SAMPLE_SALE = {
+    'items': [{'id': 'item-1', 'name': 'Soda', 'price': 4.0, 'quantity': 2}],
+    'total': 8.0,
+    'payment_method': 'Cash',
+    'customer_notes': '',
+    'timestamp': '2025-08-29T12:00:00.000000',
+    'date': '2025-08-29',
+    'time': '12:00:00',
+    'type': 'sale'
+}
+
+def timed(label, function, count=1):
+    """Run function, print its time per call and return its result"""
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<28} {elapsed / count * 1000:9.3f} ms")
+    return result
+
+def run(name):
+    """Time the common page operations against one backend"""
+    print(name)
+    backend = storage.get_backend(name)
+    backend.initialize_storage()
+    backend.write_data('inventory', {'item-1': {'name': 'Soda', 'price': 4.0, 'stock': SALES * 2}})
+    
+    def push_sales():
+        for number in range(SALES):
+            sale = dict(SAMPLE_SALE, date=f"2025-08-{10 + number % DAYS:02d}")
+            backend.push_data('transactions', sale)
+    
+    def commit_sales():
+        for _ in range(SALES // 10):
+            backend.commit_batch([
+                {'op': 'push', 'collection': 'transactions', 'data': SAMPLE_SALE},
+                {'op': 'increment', 'collection': 'inventory', 'key': 'item-1', 'field': 'stock', 'amount': -2, 'minimum': 0}
+            ])
+    
+    timed("push_data", push_sales, SALES)
+    timed("commit_batch (sale + stock)", commit_sales, SALES // 10)
+    transactions = timed("read_data", lambda: backend.read_data('transactions'))
+    timed("read_range (one day)", lambda: backend.read_range('transactions', '2025-08-10', '2025-08-10'))
+    timed("read_records (100 keys)", lambda: backend.read_records('transactions', list(transactions)[:100]))
+    timed("count_data", lambda: backend.count_data('transactions'))
+    timed("group_index (payment)", lambda: backend.group_index('transactions', 'payment_method'))
+    assert backend.count_data('transactions') == SALES + SALES // 10
+    assert backend.read_data('inventory')['item-1']['stock'] == SALES * 2 - 2 * (SALES // 10)
+
+def main():
+    names = sys.argv[1:] or ['json', 'sqlite', 'memory']
+    with tempfile.TemporaryDirectory() as data_dir:
+        # Point the file-backed stores at scratch space before they are imported
+        os.environ['POS_SQLITE_PATH'] = os.path.join(data_dir, 'bench.sqlite3')
+        import local_storage
+        local_storage.DATA_DIR = data_dir
+        local_storage.clear_read_cache()
+        
+        print(f"{SALES} sales over {DAYS} days")
+        for name in names:
+            run(name)
+
+if __name__ == "__main__":
+    main()
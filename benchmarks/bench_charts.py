@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Statistics charts over growing date ranges: one bar per day and one pie
+slice per reason (as before) against bucketed, top-N figures, by build time
+and by the size of the figure JSON sent to the browser
+Run from the project root: python benchmarks/bench_charts.py [backend ...]
+"""
+
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import plotly.io
+import storage
+
+FIRST_DAY = date(2023, 1, 1)
+DAYS = 3 * 365
+SALES_PER_DAY = 40
+TURNED_AWAY_PER_DAY = 10
+# Free-text reasons: a few common ones and a long tail typed once or twice
+REASONS = ['Wrong payment type', 'Too expensive', 'Just looking', 'Out of stock'] + [f"Other: note {number}" for number in range(2000)]
+RANGES = (('30 days', 30), ('1 year', 365), ('3 years', DAYS))
+
+def make_records():
+    """A sale and turned-away history of DAYS days"""
+    sales, turned_away = {}, {}
+    for day_number in range(DAYS):
+        day = str(FIRST_DAY + timedelta(days=day_number))
+        for number in range(SALES_PER_DAY):
+            sales[f"sale-{day}-{number}"] = {
+                'items': [{'id': 'item-1', 'name': 'Soda', 'price': 4.0, 'quantity': 1, 'category': 'Drink'}],
+                'total': 4.0, 'payment_method': 'Cash', 'customer_notes': '',
+                'timestamp': f"{day}T12:{number:02d}:00", 'date': day, 'time': f"12:{number:02d}:00", 'type': 'sale'
+            }
+        for number in range(TURNED_AWAY_PER_DAY):
+            reason = REASONS[number % 4] if number < 6 else REASONS[4 + (day_number * 4 + number) % (len(REASONS) - 4)]
+            turned_away[f"away-{day}-{number}"] = {'reason': reason, 'timestamp': f"{day}T13:00:00",
+                                                   'date': day, 'time': "13:00:00", 'type': 'turned_away'}
+    return sales, turned_away
+
+def old_figures(statistics_page, start_date, end_date):
+    """The charts as built before: a bar per day and a slice per reason"""
+    _, sales = statistics_page.load_sales_frames.__wrapped__(start_date, end_date)
+    daily = sales.groupby('date', observed=True).agg(count=('total', 'size'), revenue=('total', 'sum')).sort_index()
+    dates = daily.index.astype(str).tolist()
+    reason_counts = Counter(statistics_page.load_turned_away_rollups.__wrapped__(start_date, end_date)[1]['reasons'])
+    return [
+        statistics_page.px.bar(x=dates, y=daily['count'].tolist()),
+        statistics_page.px.bar(x=dates, y=daily['revenue'].tolist()),
+        statistics_page.px.pie(values=list(reason_counts.values()), names=list(reason_counts.keys()))
+    ]
+
+def new_figures(statistics_page, start_date, end_date, cached):
+    """The bucketed, top-N charts, straight or through the version-keyed cache"""
+    build_sales = statistics_page.build_sales_figures if cached else statistics_page.build_sales_figures.__wrapped__
+    build_reasons = statistics_page.build_reason_figure if cached else statistics_page.build_reason_figure.__wrapped__
+    _, count_fig, revenue_fig = build_sales(start_date, end_date)
+    return [count_fig, revenue_fig, build_reasons(start_date, end_date)]
+
+def measure(build):
+    """Build figures, returning the time taken in ms and their JSON size in KB"""
+    start = time.perf_counter()
+    figures = build()
+    elapsed = (time.perf_counter() - start) * 1000
+    # The size of what st.plotly_chart sends
+    return elapsed, sum(len(plotly.io.to_json(figure, validate=False)) for figure in figures) / 1024
+
+def run(name):
+    """Time chart building against one backend over each range"""
+    os.environ['POS_STORAGE_BACKEND'] = name
+    import statistics_page
+    backend = storage.get_backend(name)
+    backend.initialize_storage()
+    sales, turned_away = make_records()
+    backend.write_data('transactions', sales)
+    backend.write_data('turned_away', turned_away)
+    end_date = FIRST_DAY + timedelta(days=DAYS - 1)
+    
+    print(f"{name}: {SALES_PER_DAY} sales and {TURNED_AWAY_PER_DAY} turned away per day")
+    print(f"  {'range':<8} {'before':>20} {'bucketed':>20} {'cached rerun':>14}")
+    for label, days in RANGES:
+        start_date = end_date - timedelta(days=days - 1)
+        old_ms, old_kb = measure(lambda: old_figures(statistics_page, start_date, end_date))
+        new_ms, new_kb = measure(lambda: new_figures(statistics_page, start_date, end_date, False))
+        new_figures(statistics_page, start_date, end_date, True)
+        cached_ms, _ = measure(lambda: new_figures(statistics_page, start_date, end_date, True))
+        print(f"  {label:<8} {old_ms:7.0f} ms {old_kb:6.0f} KB {new_ms:7.0f} ms {new_kb:6.0f} KB {cached_ms:10.1f} ms")
+
+def main():
+    # Scratch space, so the real data/ is never touched
+    os.chdir(tempfile.mkdtemp())
+    for name in sys.argv[1:] or ['json', 'sqlite']:
+        run(name)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Commit latency and throughput of local_storage.push_data
+Run from the project root: python benchmarks/bench_commit.py
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import local_storage
+
+THREADS = 16
+PUSHES_PER_THREAD = 200
+
+SAMPLE_SALE = {
+    'items': [{'id': 'item-1', 'name': 'Soda', 'price': 4.0, 'quantity': 2}],
+    'total': 8.0,
+    'payment_method': 'Cash',
+    'customer_notes': '',
+    'timestamp': '2025-08-29T12:00:00.000000',
+    'date': '2025-08-29',
+    'time': '12:00:00',
+    'type': 'sale'
+}
+
+def run(group_commit):
+    """Push from several threads at once and report latency percentiles"""
+    local_storage.GROUP_COMMIT = group_commit
+    latencies = []
+    latencies_lock = threading.Lock()
+    
+    def worker():
+        mine = []
+        for _ in range(PUSHES_PER_THREAD):
+            start = time.perf_counter()
+            local_storage.push_data('bench_transactions', SAMPLE_SALE)
+            mine.append(time.perf_counter() - start)
+        with latencies_lock:
+            latencies.extend(mine)
+    
+    with tempfile.TemporaryDirectory() as data_dir:
+        local_storage.DATA_DIR = data_dir
+        local_storage.clear_read_cache()
+        threads = [threading.Thread(target=worker) for _ in range(THREADS)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        assert len(local_storage.read_data('bench_transactions')) == THREADS * PUSHES_PER_THREAD
+    
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000
+    label = "group commit" if group_commit else "fsync per push"
+    print(f"{label:>15}: {len(latencies) / elapsed:8.0f} commits/s   p50 {p50:6.2f} ms   p99 {p99:6.2f} ms")
+
+def main():
+    print(f"{THREADS} threads x {PUSHES_PER_THREAD} pushes")
+    run(group_commit=False)
+    run(group_commit=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Peak memory and time of writing an Excel export as the season grows: pandas
+DataFrames through pd.ExcelWriter into a BytesIO (as before) against rows
+streamed into a write-only workbook in a spooled temp file. The snapshot of
+records both start from is read before tracing, so only the writing counts.
+Times include tracemalloc's overhead
+Run from the project root: python benchmarks/bench_export_memory.py
+"""
+
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+FIRST_DAY = date(2026, 5, 1)
+SALES_PER_DAY = 100
+TURNED_AWAY_PER_DAY = 20
+SEASONS = (30, 90, 180)
+
+def make_snapshot(days):
+    """An export snapshot of a season of days days"""
+    transactions, turned_away = {}, {}
+    for day_number in range(days):
+        day = str(FIRST_DAY + timedelta(days=day_number))
+        for number in range(SALES_PER_DAY):
+            transactions[f"sale-{day}-{number}"] = {
+                'id': f"sale-{day}-{number}",
+                'items': [{'id': 'item-1', 'name': 'Soda', 'price': 4.0, 'quantity': 2},
+                          {'id': 'item-2', 'name': 'Water', 'price': 2.5, 'quantity': 1}],
+                'total': 10.5, 'payment_method': 'Zelle' if number % 3 else 'Cash',
+                'confirmation_number': f"Z{number:06d}" if number % 3 else '', 'customer_notes': '',
+                'timestamp': f"{day}T{10 + number % 8:02d}:{number % 60:02d}:00", 'date': day,
+                'time': f"{10 + number % 8:02d}:{number % 60:02d}:00", 'type': 'sale'
+            }
+        for number in range(TURNED_AWAY_PER_DAY):
+            turned_away[f"away-{day}-{number}"] = {
+                'reason': ['Wrong payment type', 'Too expensive', 'Just looking'][number % 3],
+                'timestamp': f"{day}T13:00:00", 'date': day, 'time': "13:00:00", 'type': 'turned_away'
+            }
+    inventory = {f"item-{number}": {'id': f"item-{number}", 'name': f"Item {number}", 'category': 'Drinks',
+                                    'price': 2.5, 'stock': 40, 'active': True} for number in range(50)}
+    return {'transactions': transactions, 'turned_away': turned_away, 'inventory': inventory}
+
+def old_export(export_manager, snapshot, start_date, end_date):
+    """The export as written before: DataFrames into a BytesIO, then getvalue()"""
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        sheets = [
+            ('Transactions', export_manager.TRANSACTION_COLUMNS, export_manager.get_transactions_rows(snapshot['transactions'])),
+            ('Turned Away', export_manager.TURNED_AWAY_COLUMNS, export_manager.get_turned_away_rows(snapshot['turned_away'])),
+            ('Inventory', export_manager.INVENTORY_COLUMNS, export_manager.get_inventory_rows(snapshot['inventory'])),
+            ('Summary', ['Metric', 'Value'], export_manager.get_summary_rows(
+                start_date, end_date, snapshot['transactions'], snapshot['turned_away'], snapshot['inventory'])),
+            ('Turned Away Stats', ['Statistic', 'Value'], export_manager.get_turned_away_stats_rows(
+                start_date, end_date, snapshot['turned_away']))
+        ]
+        for title, columns, rows in sheets:
+            pd.DataFrame(list(rows), columns=columns).to_excel(writer, sheet_name=title, index=False)
+    output.seek(0)
+    return output.getvalue()
+
+def new_export(export_manager, snapshot, start_date, end_date):
+    """The streaming export, read once from the spool as the download does"""
+    with tempfile.SpooledTemporaryFile(max_size=export_manager.EXPORT_SPOOL_BYTES) as output:
+        export_manager.write_export(output, snapshot, start_date, end_date, True, True, True)
+        output.seek(0)
+        return output.read()
+
+def measure(export):
+    """Run an export, returning its peak traced memory in MB, time in s and file size in MB"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    data = export()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 2**20, elapsed, len(data) / 2**20
+
+def main():
+    import export_manager
+    print(f"{SALES_PER_DAY} sales and {TURNED_AWAY_PER_DAY} turned away per day (peak memory traced, excluding the snapshot)")
+    print(f"  {'season':<8} {'file':>8} {'before':>22} {'streamed':>22}")
+    for days in SEASONS:
+        snapshot = make_snapshot(days)
+        start_date, end_date = FIRST_DAY, FIRST_DAY + timedelta(days=days - 1)
+        old_mb, old_s, size = measure(lambda: old_export(export_manager, snapshot, start_date, end_date))
+        new_mb, new_s, _ = measure(lambda: new_export(export_manager, snapshot, start_date, end_date))
+        print(f"  {days:>3} days {size:6.1f} MB {old_mb:8.1f} MB {old_s:7.1f} s {new_mb:10.1f} MB {new_s:7.1f} s")
+
+if __name__ == "__main__":
+    main()
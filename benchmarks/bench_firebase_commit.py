@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Round trips and stock consistency of a Firebase sale, against the local
+Realtime Database stand-in (benchmarks/rtdb_standin.py)
+Run from the project root: python benchmarks/bench_firebase_commit.py
+"""
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rtdb_standin
+
+THREADS = 8
+SALES_PER_THREAD = 25
+LATENCY = 0.02
+ITEMS = ['item-1', 'item-2', 'item-3']
+START_STOCK = 100000
+
+SAMPLE_SALE = {
+    'items': [{'id': item, 'name': item, 'price': 4.0, 'quantity': 2} for item in ITEMS],
+    'total': 24.0,
+    'payment_method': 'Cash',
+    'customer_notes': '',
+    'timestamp': '2025-08-29T12:00:00.000000',
+    'date': '2025-08-29',
+    'time': '12:00:00',
+    'type': 'sale'
+}
+
+def separate_writes(firebase_config):
+    """The old sale path: push the transaction, then read and write each item's stock"""
+    firebase_config.push_data('transactions', SAMPLE_SALE)
+    for item in ITEMS:
+        stock = firebase_config.db.reference(f"inventory/{item}/stock").get()
+        firebase_config.update_data('inventory', item, {'stock': max(0, stock - 2)})
+
+def batched(firebase_config):
+    """The commit_batch sale path"""
+    firebase_config.commit_batch([{'op': 'push', 'collection': 'transactions', 'data': SAMPLE_SALE}] + [
+        {'op': 'increment', 'collection': 'inventory', 'key': item, 'field': 'stock', 'amount': -2, 'minimum': 0}
+        for item in ITEMS
+    ])
+
+def run(label, sale, firebase_config, database, threads):
+    """Sell from several threads at once, then check requests per sale and final stock"""
+    firebase_config.write_data('inventory', {item: {'name': item, 'stock': START_STOCK} for item in ITEMS})
+    firebase_config.delete_data('transactions')
+    firebase_config._etags.clear()
+    requests_before = database.total_requests()
+    
+    def worker():
+        for _ in range(SALES_PER_THREAD):
+            sale(firebase_config)
+    
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    
+    sales = threads * SALES_PER_THREAD
+    requests = database.total_requests() - requests_before
+    recorded = firebase_config.count_data('transactions')
+    # Read the server's copy: the local mirror may still be catching up
+    stock = {item: record['stock'] for item, record in database.get(['inventory']).items()}
+    # Stock should drop by exactly the recorded sales
+    expected = START_STOCK - 2 * recorded
+    lost = sum(stock[item] - expected for item in ITEMS)
+    print(f"  {label:>16}: {requests / sales:5.2f} requests/sale   {elapsed / sales * 1000:7.1f} ms/sale   "
+          f"{recorded}/{sales} sales recorded   {lost // 2} lost stock updates")
+
+def main():
+    server, database = rtdb_standin.start(latency=LATENCY)
+    os.environ['FIREBASE_DATABASE_EMULATOR_HOST'] = f"localhost:{server.server_address[1]}"
+    os.environ['FIREBASE_DATABASE_URL'] = "https://pos-bench.firebaseio.com"
+    # Time the round trips themselves, not the outbox queueing them
+    os.environ['FIREBASE_OUTBOX'] = "0"
+    
+    import firebase_config
+    firebase_config.initialize_storage()
+    
+    for threads in (1, THREADS):
+        print(f"{threads} thread(s) x {SALES_PER_THREAD} sales of {len(ITEMS)} items, {LATENCY * 1000:.0f} ms per request")
+        run("separate writes", separate_writes, firebase_config, database, threads)
+        run("commit_batch", batched, firebase_config, database, threads)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Cold-start import cost of the app and its pages, from python -X importtime
+Each measurement runs in a fresh interpreter, so nothing is already cached.
+Run from the project root: python benchmarks/bench_import.py [runs]
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# streamlit itself imports the (small) plotly package, so look for plotly.express
+HEAVY = ('pandas', 'numpy', 'plotly.express', 'openpyxl', 'firebase_admin')
+
+# What the cashier's first screen pays for, and what each page adds on top
+TARGETS = [
+    ("storage (json backend)", "import storage"),
+    ("app (sales panel)", "import app"),
+    ("statistics page", "import app, statistics_page"),
+    ("export page", "import app, export_manager"),
+    ("firebase backend", "import app, firebase_config"),
+]
+
+# First paint of the sales panel, as a browser session would trigger it
+FIRST_PAINT = f"""
+import time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({os.path.join(ROOT, 'app.py')!r}, default_timeout=60).run()
+assert not at.exception, at.exception
+print(time.perf_counter() - start)
+"""
+
+def parse_importtime(stderr):
+    """Total import time in ms, and the name of every module imported"""
+    total = 0
+    names = set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        names.add(name.strip())
+        if not name.startswith("  "):
+            # Top-level imports are not indented, and include their children
+            total += int(cumulative) / 1000
+    return total, names
+
+def run(code, data_dir):
+    """Run code in a fresh interpreter with -X importtime"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=data_dir, capture_output=True, text=True,
+        env=dict(os.environ, PYTHONPATH=ROOT, POS_STORAGE_BACKEND=os.getenv("POS_STORAGE_BACKEND", "json"))
+    )
+    if result.returncode:
+        raise RuntimeError(result.stderr[-2000:])
+    return result
+
+def measure_import(code, data_dir, runs):
+    """Best-of-runs total import time and the heavy packages pulled in"""
+    best = None
+    for _ in range(runs):
+        total, names = parse_importtime(run(code, data_dir).stderr)
+        best = total if best is None else min(best, total)
+    loaded = [name for name in HEAVY if name in names]
+    return best, loaded
+
+def measure_first_paint(data_dir, runs):
+    """Best-of-runs wall time from interpreter start to the sales panel rendered"""
+    times = [float(run(FIRST_PAINT, data_dir).stdout.split()[-1]) for _ in range(runs)]
+    return min(times)
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    # Run in scratch space so initialize_storage does not touch the real data/
+    with tempfile.TemporaryDirectory() as data_dir:
+        print(f"best of {runs} cold starts")
+        for label, code in TARGETS:
+            total, loaded = measure_import(code, data_dir, runs)
+            print(f"  {label:<24} {total:8.1f} ms   heavy: {', '.join(loaded) or '-'}")
+        print(f"  {'first paint (AppTest)':<24} {measure_first_paint(data_dir, runs) * 1000:8.1f} ms")
+
+if __name__ == "__main__":
+    main()
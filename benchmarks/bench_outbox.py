@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Sale latency and delivery of the Firebase outbox through an uplink outage,
+against the local Realtime Database stand-in (benchmarks/rtdb_standin.py)
+Run from the project root: python benchmarks/bench_outbox.py
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rtdb_standin
+
+SALES_PER_PHASE = 100
+LATENCY = 0.05
+START_STOCK = 10000
+
+def sale(item):
+    """The operations of a one-item sale, as sales_interface builds them"""
+    return [
+        {'op': 'push', 'collection': 'transactions', 'data': {
+            'items': [{'id': item, 'name': item, 'price': 4.0, 'quantity': 1}],
+            'total': 4.0, 'payment_method': 'Cash', 'date': '2025-08-29',
+            'timestamp': '2025-08-29T12:00:00', 'type': 'sale'
+        }},
+        {'op': 'increment', 'collection': 'inventory', 'key': item, 'field': 'stock', 'amount': -1, 'minimum': 0}
+    ]
+
+def sell(firebase_config, label, sales=SALES_PER_PHASE):
+    """Ring up a phase of sales and report how long the cashier waited"""
+    latencies = []
+    for number in range(sales):
+        start = time.perf_counter()
+        assert firebase_config.commit_batch(sale(f"item-{number % 3}")) is not None
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    stats = firebase_config.get_outbox_stats()
+    print(f"  {label:<22} sale p50 {latencies[len(latencies) // 2] * 1000:6.2f} ms   "
+          f"max {latencies[-1] * 1000:6.2f} ms   queued {stats['depth']}")
+
+def wait_for_drain(firebase_config, timeout=120):
+    """Wait until the flusher has delivered everything"""
+    start = time.perf_counter()
+    while firebase_config.get_outbox_stats()['depth'] and time.perf_counter() - start < timeout:
+        time.sleep(0.05)
+    return time.perf_counter() - start
+
+def main():
+    server, database = rtdb_standin.start(latency=LATENCY)
+    os.environ['FIREBASE_DATABASE_EMULATOR_HOST'] = f"localhost:{server.server_address[1]}"
+    os.environ['FIREBASE_DATABASE_URL'] = "https://pos-bench.firebaseio.com"
+    
+    with tempfile.TemporaryDirectory() as data_dir:
+        import local_storage
+        local_storage.DATA_DIR = data_dir
+        
+        import firebase_config
+        firebase_config.initialize_storage()
+        firebase_config.write_data('inventory', {f"item-{n}": {'name': f"item-{n}", 'stock': START_STOCK} for n in range(3)})
+        
+        print(f"{SALES_PER_PHASE} sales per phase, {LATENCY * 1000:.0f} ms per request")
+        sell(firebase_config, "online")
+        print(f"    drained in {wait_for_drain(firebase_config):.2f} s")
+        
+        database.online = False
+        sell(firebase_config, "uplink down")
+        time.sleep(10)
+        stats = firebase_config.get_outbox_stats()
+        print(f"    still queued {stats['depth']}, {stats['failures']} failed flushes, "
+              f"retry in {stats['retry_in_seconds']:.1f} s")
+        
+        # Back up, but the first write's response is lost on the way back
+        database.online = True
+        database.lose_responses = 1
+        firebase_config._outbox_state['retry_at'] = 0
+        firebase_config._outbox_state['wake'].set()
+        print(f"    uplink restored, drained in {wait_for_drain(firebase_config):.2f} s, "
+              f"last flush latency {firebase_config.get_outbox_stats()['last_flush_latency_seconds']:.2f} s")
+        
+        # Every response of a flush lost, past the client's own retries: the
+        # sales must be found by their markers, not sent (or counted) twice
+        database.lose_responses = 8
+        sell(firebase_config, "responses lost")
+        print(f"    drained in {wait_for_drain(firebase_config):.2f} s")
+        
+        # A sale's stock transactions land but its update is refused past the
+        # client's retries, and more sales queue behind it before the resend:
+        # the resent batch must skip only the increments that already landed
+        failures = firebase_config.get_outbox_stats()['failures']
+        database.refuse_updates = 8
+        sell(firebase_config, "update refused", 1)
+        while firebase_config.get_outbox_stats()['failures'] == failures:
+            time.sleep(0.05)
+        sell(firebase_config, "queued behind it")
+        firebase_config._outbox_state['retry_at'] = 0
+        firebase_config._outbox_state['wake'].set()
+        print(f"    drained in {wait_for_drain(firebase_config):.2f} s")
+        
+        sales = 4 * SALES_PER_PHASE + 1
+        recorded = len(database.get(['transactions']) or {})
+        sold = sum(START_STOCK - record['stock'] for record in database.get(['inventory']).values())
+        rolled_up = database.get(['_rollups', 'transactions', '2025-08-29'])['count']
+        print(f"  {recorded}/{sales} sales in Firebase, stock down by {sold}, {rolled_up} in the rollup, "
+              f"{len(database.get(['_outbox_applied']) or {})} markers of the last batch left to clear")
+        assert recorded == sales and sold == sales and rolled_up == sales
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Statistics page computations with and without the version-keyed cache
+(storage.cache_by_version): a cold build, a rerun with nothing changed, and
+a rerun after one sale
+Run from the project root: python benchmarks/bench_page_cache.py [backend ...]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage
+
+SALES = 20000
+DAYS = 30
+RERUNS = 20
+
+def make_sale(number):
+    """A two-item sale spread over DAYS days"""
+    day = f"2025-08-{1 + number % DAYS:02d}"
+    return {
+        'id': f"sale-{number}",
+        'items': [
+            {'id': 'item-1', 'name': 'Soda', 'price': 4.0, 'quantity': 1 + number % 3},
+            {'id': 'item-2', 'name': 'Chips', 'price': 2.5, 'quantity': 1}
+        ],
+        'total': 4.0 * (1 + number % 3) + 2.5,
+        'payment_method': ('Cash', 'Card', 'Zelle')[number % 3],
+        'customer_notes': '',
+        'timestamp': f"{day}T{10 + number % 8:02d}:00:00.000000",
+        'date': day,
+        'time': f"{10 + number % 8:02d}:00:00",
+        'type': 'sale'
+    }
+
+def timed(label, function, count=1):
+    """Run function count times and print the time per call"""
+    start = time.perf_counter()
+    for _ in range(count):
+        function()
+    print(f"  {label:<34} {(time.perf_counter() - start) / count * 1000:9.2f} ms")
+
+def run(name):
+    """Time the statistics page's data loading against one backend"""
+    os.environ['POS_STORAGE_BACKEND'] = name
+    import statistics_page
+    backend = storage.get_backend(name)
+    backend.initialize_storage()
+    backend.write_data('inventory', {
+        'item-1': {'name': 'Soda', 'category': 'Drink', 'price': 4.0, 'stock': 10 ** 6},
+        'item-2': {'name': 'Chips', 'category': 'Snack', 'price': 2.5, 'stock': 10 ** 6}
+    })
+    backend.write_data('transactions', {f"sale-{number}": make_sale(number) for number in range(SALES)})
+    statistics_page.load_sales_frames.clear()
+    
+    start_date, end_date = '2025-08-01', '2025-08-30'
+    uncached = statistics_page.load_sales_frames.__wrapped__
+    print(f"{name}: {SALES} sales over {DAYS} days")
+    timed("uncached build (every rerun before)", lambda: uncached(start_date, end_date))
+    timed("cold (first render)", lambda: statistics_page.load_sales_frames(start_date, end_date))
+    timed("warm rerun", lambda: statistics_page.load_sales_frames(start_date, end_date), RERUNS)
+    timed("get_version of the two collections",
+          lambda: [storage.get_version(collection) for collection in ('transactions', 'inventory')], RERUNS)
+    
+    def sell_then_render():
+        storage.commit_batch([
+            {'op': 'push', 'collection': 'transactions', 'data': make_sale(SALES)},
+            {'op': 'increment', 'collection': 'inventory', 'key': 'item-1', 'field': 'stock', 'amount': -1, 'minimum': 0}
+        ])
+        return statistics_page.load_sales_frames(start_date, end_date)
+    
+    timed("rerun after a sale (rebuilt)", sell_then_render)
+    line_items, sales = statistics_page.load_sales_frames(start_date, end_date)
+    assert len(sales) == SALES + 1, len(sales)
+
+def main():
+    # Scratch space, so the real data/ is never touched
+    os.chdir(tempfile.mkdtemp())
+    for name in sys.argv[1:] or ['json', 'sqlite', 'memory']:
+        run(name)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Range reads as the history grows: a one-hour timestamp window and a one-day
+date range through read_range, against scanning every record with in_range
+(how the pages used to filter)
+Run from the project root: python benchmarks/bench_range.py [backend ...]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage
+from storage_common import in_range
+
+SALES_PER_DAY = 2000
+HISTORY_SIZES = (10000, 50000, 100000, 200000, 400000)
+RERUNS = 10
+
+def make_sale(number):
+    """A one-item sale; SALES_PER_DAY of them per day, spread over twelve hours"""
+    day_number, slot = divmod(number, SALES_PER_DAY)
+    day = time.strftime("%Y-%m-%d", time.gmtime(day_number * 86400))
+    seconds = 8 * 3600 + slot * 12 * 3600 // SALES_PER_DAY
+    clock = f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+    return {
+        'items': [{'id': 'item-1', 'name': 'Soda', 'price': 4.0, 'quantity': 1}],
+        'total': 4.0,
+        'payment_method': 'Cash',
+        'timestamp': f"{day}T{clock}.000000",
+        'date': day,
+        'time': clock,
+        'type': 'sale'
+    }
+
+def timed(function, count=RERUNS):
+    """Run function count times, returning the last result and the time per call in ms"""
+    start = time.perf_counter()
+    for _ in range(count):
+        result = function()
+    return result, (time.perf_counter() - start) / count * 1000
+
+def run(name):
+    """Time range reads against one backend at each history size"""
+    backend = storage.get_backend(name)
+    backend.initialize_storage()
+    print(f"{name}: {SALES_PER_DAY} sales per day")
+    print(f"  {'records':>8} {'hour window':>12} {'one day':>10} {'full scan':>10}")
+    for size in HISTORY_SIZES:
+        backend.write_data('transactions', {f"sale-{number:07d}": make_sale(number) for number in range(size)})
+        # The newest day, as the statistics page shows by default
+        day = make_sale(size - 1)['date']
+        hour_start, hour_end = f"{day}T12:00", f"{day}T12:59"
+        backend.read_range('transactions', hour_start, hour_end, 'timestamp')
+        
+        hour, hour_ms = timed(lambda: backend.read_range('transactions', hour_start, hour_end, 'timestamp'))
+        whole_day, day_ms = timed(lambda: backend.read_range('transactions', day, day))
+        scanned, scan_ms = timed(lambda: {key: record for key, record in backend.read_data('transactions').items()
+                                          if in_range(record.get('timestamp'), hour_start, hour_end)}, 1)
+        assert set(hour) == set(scanned), (len(hour), len(scanned))
+        assert len(whole_day) == SALES_PER_DAY, len(whole_day)
+        print(f"  {size:>8} {hour_ms:>9.2f} ms {day_ms:>7.2f} ms {scan_ms:>7.0f} ms")
+
+def main():
+    # Scratch space, so the real data/ is never touched
+    os.chdir(tempfile.mkdtemp())
+    for name in sys.argv[1:] or ['json', 'memory']:
+        run(name)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Transaction Details tab: building the full table of a range (as before)
+against finding the matching keys from the indexes and reading one page
+Run from the project root: python benchmarks/bench_transaction_browser.py [backend ...]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage
+
+SALES_PER_DAY = 2000
+DAYS = 60
+PAGE_SIZE = 25
+
+def make_sale(number):
+    """A one-item sale; every tenth is a Zelle payment with a confirmation number"""
+    day_number, slot = divmod(number, SALES_PER_DAY)
+    day = f"2025-{6 + day_number // 30:02d}-{1 + day_number % 30:02d}"
+    seconds = 8 * 3600 + slot * 12 * 3600 // SALES_PER_DAY
+    clock = f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+    zelle = number % 10 == 0
+    return {
+        'id': f"{number:08x}-sale",
+        'items': [{'id': f"item-{number % 4}", 'name': f"Item {number % 4}", 'price': 4.0, 'quantity': 1,
+                   'category': 'Drink', 'sku': ''}],
+        'total': 4.0,
+        'payment_method': 'Zelle' if zelle else 'Cash',
+        'confirmation_number': f"{number:010d}" if zelle else '',
+        'customer_notes': '',
+        'timestamp': f"{day}T{clock}.000000",
+        'date': day,
+        'time': clock,
+        'type': 'sale'
+    }
+
+def timed(label, function):
+    """Run function twice and print how long the first (cold) and second (warm) calls took"""
+    times = []
+    for _ in range(2):
+        start = time.perf_counter()
+        result = function()
+        times.append((time.perf_counter() - start) * 1000)
+    print(f"  {label:<36} {times[0]:9.1f} ms {times[1]:9.1f} ms")
+    return result
+
+def run(name):
+    """Time the old full table and the paged browser against one backend"""
+    os.environ['POS_STORAGE_BACKEND'] = name
+    import statistics_page
+    backend = storage.get_backend(name)
+    backend.initialize_storage()
+    backend.write_data('inventory', {f"item-{number}": {'name': f"Item {number}", 'category': 'Drink'}
+                                     for number in range(4)})
+    backend.write_data('transactions', {f"sale-{number:07d}": make_sale(number)
+                                        for number in range(SALES_PER_DAY * DAYS)})
+    start_date, end_date = '2025-06-01', '2025-07-30'
+    find_keys = statistics_page.find_transaction_keys.__wrapped__
+    
+    print(f"{name}: {SALES_PER_DAY * DAYS} sales in range")
+    print(f"  {'':<36} {'cold':>12} {'warm':>12}")
+    
+    def full_table():
+        line_items = statistics_page.build_line_items(storage.read_range('transactions', start_date, end_date))
+        sales = statistics_page.summarize_transactions(line_items)
+        return sales.sort_values(['date', 'time'], ascending=False, key=lambda column: column.astype(str))
+    
+    rows = timed("full table (before)", full_table)
+    keys = timed("keys, newest first", lambda: find_keys(start_date, end_date, 'Newest first', 'All', 'Transaction ID', ''))
+    timed("keys, Zelle only", lambda: find_keys(start_date, end_date, 'Newest first', 'Zelle', 'Transaction ID', ''))
+    found = timed("keys, ID prefix search", lambda: find_keys(start_date, end_date, 'Newest first', 'All', 'Transaction ID', '0001a'))
+    timed("keys, confirmation prefix search",
+          lambda: find_keys(start_date, end_date, 'Newest first', 'All', 'Zelle Confirmation', '000001'))
+    page = timed(f"one page of {PAGE_SIZE}", lambda: statistics_page.load_transaction_page(keys[:PAGE_SIZE]))
+    print(f"  rows sent to the browser: {len(rows)} before, {len(page)} now; ID search found {len(found)}")
+    assert list(page.index) == list(rows.index[:PAGE_SIZE])
+
+def main():
+    # Scratch space, so the real data/ is never touched
+    os.chdir(tempfile.mkdtemp())
+    for name in sys.argv[1:] or ['json', 'sqlite', 'memory']:
+        run(name)
+
+if __name__ == "__main__":
+    main()
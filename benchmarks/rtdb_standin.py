@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Firebase Realtime Database REST API
+Covers what firebase_config uses: get (shallow, ETag, orderBy queries), set
+(conditional on if-match), push, multi-location update with server
+increments, delete, and streaming listeners. Like the real database it
+refuses orderBy queries on children without an .indexOn rule, taking the
+rules from database.rules.json. Counts requests so benchmarks can report
+round trips.
+
+Run from the project root: python benchmarks/rtdb_standin.py [port]
+Then point the app at it with FIREBASE_DATABASE_EMULATOR_HOST=localhost:<port>.
+"""
+
+import hashlib
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+RULES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "database.rules.json")
+
+class Database:
+    """JSON tree with the write semantics of the Realtime Database"""
+    
+    def __init__(self, latency=0, rules=None):
+        self.root = None
+        self.latency = latency
+        self.online = True
+        self.lose_responses = 0
+        self.refuse_updates = 0
+        self.indexes = collect_indexes((rules or {}).get('rules', {}), [])
+        self.lock = threading.RLock()
+        self.requests = {}
+        self.listeners = []
+    
+    def get(self, segments):
+        node = self.root
+        for segment in segments:
+            if not isinstance(node, dict) or segment not in node:
+                return None
+            node = node[segment]
+        return node
+    
+    def set(self, segments, value):
+        value = prune(value)
+        if not segments:
+            self.root = value
+            return
+        if not isinstance(self.root, dict):
+            self.root = {}
+        node = self.root
+        for segment in segments[:-1]:
+            if not isinstance(node.get(segment), dict):
+                node[segment] = {}
+            node = node[segment]
+        if value is None:
+            node.pop(segments[-1], None)
+        else:
+            node[segments[-1]] = value
+        self.root = prune(self.root)
+    
+    def notify(self, segments):
+        """Send a put event for a changed location to every listener above or below it"""
+        for listen_segments, events in self.listeners:
+            if segments[:len(listen_segments)] == listen_segments:
+                path = '/' + '/'.join(segments[len(listen_segments):])
+                events.put(('put', {'path': path, 'data': self.get(segments)}))
+            elif listen_segments[:len(segments)] == segments:
+                events.put(('put', {'path': '/', 'data': self.get(listen_segments)}))
+    
+    def resolve(self, segments, value):
+        """Replace server values ({'.sv': ...}) with what they stand for"""
+        if isinstance(value, dict) and '.sv' in value:
+            server_value = value['.sv']
+            if server_value == 'timestamp':
+                return int(time.time() * 1000)
+            if isinstance(server_value, dict) and 'increment' in server_value:
+                current = self.get(segments)
+                return (current if isinstance(current, (int, float)) else 0) + server_value['increment']
+        if isinstance(value, dict):
+            return {key: self.resolve(segments + [key], child) for key, child in value.items()}
+        return value
+    
+    def count(self, method):
+        with self.lock:
+            self.requests[method] = self.requests.get(method, 0) + 1
+    
+    def total_requests(self):
+        with self.lock:
+            return sum(self.requests.values())
+
+def collect_indexes(rules, segments):
+    """Map each rules path to the fields it declares in .indexOn"""
+    indexes = {}
+    for name, child in rules.items():
+        if name == '.indexOn':
+            indexes[tuple(segments)] = set([child] if isinstance(child, str) else child)
+        elif isinstance(child, dict) and not name.startswith('.'):
+            indexes.update(collect_indexes(child, segments + [name]))
+    return indexes
+
+def prune(value):
+    """Drop nulls and empty objects, as the database does"""
+    if isinstance(value, dict):
+        pruned = {key: prune(child) for key, child in value.items()}
+        pruned = {key: child for key, child in pruned.items() if child is not None}
+        return pruned or None
+    return value
+
+def etag_of(value):
+    """Content hash used as the ETag of a location"""
+    return hashlib.sha1(json.dumps(value, sort_keys=True).encode('utf-8')).hexdigest()
+
+def split_path(path):
+    """Split a URL or update path into segments"""
+    path = path[:-len('.json')] if path.endswith('.json') else path
+    return [segment for segment in path.split('/') if segment]
+
+def query(value, params):
+    """Apply orderBy/equalTo/startAt/endAt/limitTo* to a location's children"""
+    if 'orderBy' not in params or not isinstance(value, dict):
+        return value
+    order_by = json.loads(params['orderBy'])
+    
+    def sort_value(item):
+        key, child = item
+        if order_by == '$key':
+            return key
+        if order_by == '$value':
+            return child
+        for segment in order_by.split('/'):
+            child = child.get(segment) if isinstance(child, dict) else None
+        return child
+    
+    items = [(item, sort_value(item)) for item in value.items()]
+    if 'equalTo' in params:
+        target = json.loads(params['equalTo'])
+        items = [(item, sort) for item, sort in items if sort == target]
+    if 'startAt' in params:
+        start = json.loads(params['startAt'])
+        items = [(item, sort) for item, sort in items if sort is not None and sort >= start]
+    if 'endAt' in params:
+        end = json.loads(params['endAt'])
+        items = [(item, sort) for item, sort in items if sort is not None and sort <= end]
+    items.sort(key=lambda pair: (pair[1] is not None, str(type(pair[1])), pair[1] if pair[1] is not None else 0, pair[0][0]))
+    if 'limitToFirst' in params:
+        items = items[:int(params['limitToFirst'])]
+    if 'limitToLast' in params:
+        items = items[-int(params['limitToLast']):]
+    return {key: child for (key, child), _ in items}
+
+def make_handler(database):
+    """Build a request handler bound to one database"""
+    
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+        
+        def log_message(self, format, *args):
+            pass
+        
+        def reply(self, status, body=None, headers=None):
+            payload = b"" if status == 204 else json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        
+        def parse(self):
+            url = urlparse(self.path)
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            length = int(self.headers.get('Content-Length') or 0)
+            body = json.loads(self.rfile.read(length)) if length else None
+            database.count(self.command)
+            if database.latency:
+                # Simulated uplink delay
+                time.sleep(database.latency)
+            if not database.online:
+                self.reply(503, {'error': 'Service unavailable'})
+                return None, None, None
+            return split_path(url.path), params, body
+        
+        def lose_response(self):
+            """Report failure for a write that did apply, if asked to"""
+            with database.lock:
+                if database.lose_responses > 0:
+                    database.lose_responses -= 1
+                    return True
+            return False
+        
+        def refuse_update(self):
+            """Fail a multi-location update before it applies, if asked to"""
+            with database.lock:
+                if database.refuse_updates > 0:
+                    database.refuse_updates -= 1
+                    return True
+            return False
+        
+        def stream(self, segments):
+            """Serve a listener: the current value, then a put event per change"""
+            events = queue.Queue()
+            with database.lock:
+                events.put(('put', {'path': '/', 'data': database.get(segments)}))
+                database.listeners.append((segments, events))
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            try:
+                while True:
+                    try:
+                        event_type, data = events.get(timeout=30)
+                    except queue.Empty:
+                        event_type, data = 'keep-alive', None
+                    self.wfile.write(f"event: {event_type}\ndata: {json.dumps(data)}\n\n".encode('utf-8'))
+                    self.wfile.flush()
+            except OSError:
+                pass
+            finally:
+                with database.lock:
+                    database.listeners.remove((segments, events))
+        
+        def do_GET(self):
+            segments, params, _ = self.parse()
+            if segments is None:
+                return
+            if self.headers.get('Accept') == 'text/event-stream':
+                self.stream(segments)
+                return
+            with database.lock:
+                value = database.get(segments)
+            if params.get('shallow') == 'true' and isinstance(value, dict):
+                value = {key: True for key in value}
+            if 'orderBy' in params:
+                order_by = json.loads(params['orderBy'])
+                if not order_by.startswith('$') and order_by not in database.indexes.get(tuple(segments), ()):
+                    path = '/' + '/'.join(segments)
+                    self.reply(400, {'error': f'Index not defined, add ".indexOn": "{order_by}", for path "{path}", to the rules'})
+                    return
+            value = query(value, params)
+            headers = {'ETag': etag_of(value)} if self.headers.get('X-Firebase-ETag') == 'true' else None
+            self.reply(200, value, headers)
+        
+        def do_PUT(self):
+            segments, params, body = self.parse()
+            if segments is None:
+                return
+            with database.lock:
+                current = database.get(segments)
+                expected = self.headers.get('if-match')
+                if expected is not None and expected != etag_of(current):
+                    self.reply(412, current, {'ETag': etag_of(current)})
+                    return
+                database.set(segments, database.resolve(segments, body))
+                database.notify(segments)
+                value = database.get(segments)
+            if self.lose_response():
+                self.reply(503, {'error': 'Service unavailable'})
+                return
+            self.reply(204 if params.get('print') == 'silent' else 200, value, {'ETag': etag_of(value)})
+        
+        def do_PATCH(self):
+            segments, params, body = self.parse()
+            if segments is None:
+                return
+            if self.refuse_update():
+                self.reply(503, {'error': 'Service unavailable'})
+                return
+            with database.lock:
+                # All paths are resolved against the old tree, then applied together
+                changes = [(segments + split_path(path), database.resolve(segments + split_path(path), value))
+                           for path, value in body.items()]
+                for path, value in changes:
+                    database.set(path, value)
+                for path, _ in changes:
+                    database.notify(path)
+            if self.lose_response():
+                self.reply(503, {'error': 'Service unavailable'})
+                return
+            self.reply(204 if params.get('print') == 'silent' else 200, body)
+        
+        def do_POST(self):
+            segments, _, body = self.parse()
+            if segments is None:
+                return
+            key = f"{int(time.time() * 1000):013d}-{uuid.uuid4().hex[:8]}"
+            with database.lock:
+                database.set(segments + [key], database.resolve(segments + [key], body))
+                database.notify(segments + [key])
+            self.reply(200, {'name': key})
+        
+        def do_DELETE(self):
+            segments, _, _ = self.parse()
+            if segments is None:
+                return
+            with database.lock:
+                database.set(segments, None)
+                database.notify(segments)
+            self.reply(200, None)
+    
+    return Handler
+
+def start(port=0, latency=0, rules_path=RULES_PATH):
+    """Serve a fresh database in a background thread, returning (server, database)"""
+    rules = None
+    if rules_path and os.path.exists(rules_path):
+        with open(rules_path, 'r', encoding='utf-8') as f:
+            rules = json.load(f)
+    database = Database(latency, rules)
+    server = ThreadingHTTPServer(("localhost", port), make_handler(database))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, database
+
+if __name__ == "__main__":
+    server, _ = start(int(sys.argv[1]) if len(sys.argv) > 1 else 9000)
+    print(f"Realtime Database stand-in on localhost:{server.server_address[1]}")
+    threading.Event().wait()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Stress test for concurrent stock decrements
+Fires sales from several processes, each running several threads, against
+one data directory and checks that every decrement landed exactly once.
+Run from the project root: python benchmarks/stress_stock.py
+"""
+
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import local_storage
+
+PROCESSES = 4
+THREADS_PER_PROCESS = 8
+SALES_PER_THREAD = 100
+ITEMS = 5
+INITIAL_STOCK = 1000000
+
+def make_sale(rng, item_ids):
+    """Build the operations for one random sale"""
+    cart = [(item_id, rng.randint(1, 3)) for item_id in rng.sample(item_ids, rng.randint(1, 2))]
+    sale = {
+        'items': [{'id': item_id, 'name': item_id, 'price': 1.0, 'quantity': quantity}
+                  for item_id, quantity in cart],
+        'total': float(sum(quantity for _, quantity in cart)),
+        'payment_method': 'Cash',
+        'date': '2025-08-29',
+        'time': '12:00:00',
+        'timestamp': '2025-08-29T12:00:00',
+        'type': 'sale'
+    }
+    operations = [{'op': 'push', 'collection': 'transactions', 'data': sale}]
+    operations += [
+        {'op': 'increment', 'collection': 'inventory', 'key': item_id, 'field': 'stock',
+         'amount': -quantity, 'minimum': 0}
+        for item_id, quantity in cart
+    ]
+    return operations
+
+def worker_process(data_dir, seed, item_ids):
+    """Run a batch of selling threads in one process"""
+    local_storage.DATA_DIR = data_dir
+    failures = []
+    
+    def seller(thread_seed):
+        rng = random.Random(thread_seed)
+        for _ in range(SALES_PER_THREAD):
+            if not local_storage.commit_batch(make_sale(rng, item_ids)):
+                failures.append(1)
+    
+    threads = [threading.Thread(target=seller, args=(seed * 1000 + i,)) for i in range(THREADS_PER_PROCESS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if failures:
+        sys.exit(1)
+
+def main():
+    with tempfile.TemporaryDirectory() as data_dir:
+        local_storage.DATA_DIR = data_dir
+        item_ids = [f"item-{i}" for i in range(ITEMS)]
+        local_storage.write_data('inventory', {
+            item_id: {'id': item_id, 'name': item_id, 'price': 1.0, 'stock': INITIAL_STOCK, 'active': True}
+            for item_id in item_ids
+        })
+        
+        start = time.perf_counter()
+        processes = [
+            multiprocessing.Process(target=worker_process, args=(data_dir, seed, item_ids))
+            for seed in range(PROCESSES)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - start
+        
+        local_storage.clear_read_cache()
+        transactions = local_storage.read_data('transactions')
+        inventory = local_storage.read_data('inventory')
+        
+        sold = {item_id: 0 for item_id in item_ids}
+        for transaction in transactions.values():
+            for item in transaction['items']:
+                sold[item['id']] += item['quantity']
+        
+        expected_sales = PROCESSES * THREADS_PER_PROCESS * SALES_PER_THREAD
+        print(f"{len(transactions)} / {expected_sales} sales committed in {elapsed:.1f}s "
+              f"({len(transactions) / elapsed:.0f} sales/s)")
+        
+        ok = len(transactions) == expected_sales and all(p.exitcode == 0 for p in processes)
+        for item_id in item_ids:
+            expected_stock = INITIAL_STOCK - sold[item_id]
+            actual_stock = inventory[item_id]['stock']
+            status = "ok" if actual_stock == expected_stock else "LOST UPDATES"
+            ok = ok and actual_stock == expected_stock
+            print(f"  {item_id}: stock {actual_stock}, expected {expected_stock} {status}")
+        
+        sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,26 @@
 import streamlit as st
-from local_storage import read_data
+from storage import read_data, read_range, get_version
 import pandas as pd
 from datetime import datetime, timedelta
-import io
+import tempfile
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+
+# Collections every export reads, and how often to re-read them when one
+# changes mid-read before settling for the last read
+EXPORT_COLLECTIONS = ('transactions', 'turned_away', 'inventory')
+SNAPSHOT_ATTEMPTS = 3
+
+# Export sheet columns, and how much of a workbook is spooled in memory
+# before it moves to a temp file on disk
+TRANSACTION_COLUMNS = ['Transaction ID', 'Date', 'Time', 'Total', 'Payment Method', 'Confirmation Number',
+                       'Customer Notes', 'Items', 'Item Count', 'Timestamp']
+TURNED_AWAY_COLUMNS = ['Date', 'Time', 'Reason', 'Timestamp']
+INVENTORY_COLUMNS = ['Item ID', 'Name', 'Category', 'Price', 'Stock', 'SKU', 'Description', 'Status',
+                     'Created', 'Updated']
+EXPORT_SPOOL_BYTES = 8 * 1024 * 1024
+HEADER_FONT = Font(bold=True)
 
 def export_data_page():
     """Export data to Excel"""
@@ -63,180 +81,171 @@ def generate_export(start_date, end_date, include_transactions, include_turned_a
     """Generate Excel export based on selected options"""
     
     try:
-        # Create Excel writer object
-        output = io.BytesIO()
+        # Every sheet comes from the same snapshot of the data
+        snapshot = read_export_snapshot(start_date, end_date)
         
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        # Stream the workbook into a temp file that moves to disk once large
+        with tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES) as output:
+            counts = write_export(output, snapshot, start_date, end_date,
+                                  include_transactions, include_turned_away, include_inventory)
             
-            # Export transactions
             if include_transactions:
-                transactions_df = get_transactions_dataframe(start_date, end_date)
-                if not transactions_df.empty:
-                    transactions_df.to_excel(writer, sheet_name='Transactions', index=False)
-                    st.success(f"✅ Exported {len(transactions_df)} transactions")
+                if counts['Transactions']:
+                    st.success(f"✅ Exported {counts['Transactions']} transactions")
                 else:
-                    # Create empty sheet with headers
-                    empty_df = pd.DataFrame(columns=['Transaction ID', 'Date', 'Time', 'Total', 'Payment Method', 'Items'])
-                    empty_df.to_excel(writer, sheet_name='Transactions', index=False)
                     st.info("ℹ️ No transactions found for the selected date range")
             
-            # Export turned away entries
             if include_turned_away:
-                turned_away_df = get_turned_away_dataframe(start_date, end_date)
-                if not turned_away_df.empty:
-                    turned_away_df.to_excel(writer, sheet_name='Turned Away', index=False)
-                    st.success(f"✅ Exported {len(turned_away_df)} turned away entries")
+                if counts['Turned Away']:
+                    st.success(f"✅ Exported {counts['Turned Away']} turned away entries")
                 else:
-                    # Create empty sheet with headers
-                    empty_df = pd.DataFrame(columns=['Date', 'Time', 'Reason'])
-                    empty_df.to_excel(writer, sheet_name='Turned Away', index=False)
                     st.info("ℹ️ No turned away entries found for the selected date range")
             
-            # Export inventory
             if include_inventory:
-                inventory_df = get_inventory_dataframe()
-                if not inventory_df.empty:
-                    inventory_df.to_excel(writer, sheet_name='Inventory', index=False)
-                    st.success(f"✅ Exported {len(inventory_df)} inventory items")
+                if counts['Inventory']:
+                    st.success(f"✅ Exported {counts['Inventory']} inventory items")
                 else:
-                    # Create empty sheet with headers
-                    empty_df = pd.DataFrame(columns=['Name', 'Category', 'Price', 'Stock', 'SKU', 'Status'])
-                    empty_df.to_excel(writer, sheet_name='Inventory', index=False)
                     st.info("ℹ️ No inventory items found")
             
-            # Generate summary sheet
-            generate_summary_sheet(writer, start_date, end_date)
+            # Prepare download; the one read is the copy Streamlit serves
+            output.seek(0)
             
-            # Generate turned away statistics sheet
-            generate_turned_away_stats_sheet(writer, start_date, end_date)
-        
-        # Prepare download
-        output.seek(0)
-        
-        filename = f"airshow_data_{start_date}_{end_date}.xlsx"
-        
-        st.download_button(
-            label="📥 Download Excel File",
-            data=output.getvalue(),
-            file_name=filename,
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
+            filename = f"airshow_data_{start_date}_{end_date}.xlsx"
+            
+            st.download_button(
+                label="📥 Download Excel File",
+                data=output.read(),
+                file_name=filename,
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            )
         
     except Exception as e:
         st.error(f"❌ Failed to generate export: {str(e)}")
 
-def get_transactions_dataframe(start_date, end_date):
-    """Get transactions data as DataFrame"""
-    transactions_data = read_data('transactions')
-    
-    if not transactions_data:
-        return pd.DataFrame()
-    
-    # Convert to list and filter by date range
-    transactions_list = []
-    
+def write_export(output, snapshot, start_date, end_date, include_transactions, include_turned_away, include_inventory):
+    """Stream the selected sheets of a snapshot into output as an Excel workbook
+    
+    The workbook is write-only, so each row goes to disk as it is appended and
+    no sheet is ever held whole in memory. Returns the rows written per sheet.
+    """
+    workbook = Workbook(write_only=True)
+    counts = {}
+    
+    if include_transactions:
+        counts['Transactions'] = write_sheet(workbook, 'Transactions', TRANSACTION_COLUMNS,
+                                             get_transactions_rows(snapshot['transactions']))
+    
+    if include_turned_away:
+        counts['Turned Away'] = write_sheet(workbook, 'Turned Away', TURNED_AWAY_COLUMNS,
+                                            get_turned_away_rows(snapshot['turned_away']))
+    
+    if include_inventory:
+        counts['Inventory'] = write_sheet(workbook, 'Inventory', INVENTORY_COLUMNS,
+                                          get_inventory_rows(snapshot['inventory']))
+    
+    # Summary and turned away statistics sheets
+    summary_rows = [['Report Generated', datetime.now().strftime('%Y-%m-%d %H:%M:%S')]]
+    summary_rows += get_summary_rows(start_date, end_date, snapshot['transactions'],
+                                     snapshot['turned_away'], snapshot['inventory'])
+    counts['Summary'] = write_sheet(workbook, 'Summary', ['Metric', 'Value'], summary_rows)
+    counts['Turned Away Stats'] = write_sheet(workbook, 'Turned Away Stats', ['Statistic', 'Value'],
+                                              get_turned_away_stats_rows(start_date, end_date, snapshot['turned_away']))
+    
+    workbook.save(output)
+    return counts
+
+def write_sheet(workbook, title, columns, rows):
+    """Append a sheet with a bold header row and then rows, returning how many rows were written"""
+    sheet = workbook.create_sheet(title)
+    header = []
+    for column in columns:
+        cell = WriteOnlyCell(sheet, value=column)
+        cell.font = HEADER_FONT
+        header.append(cell)
+    sheet.append(header)
+    
+    count = 0
+    for row in rows:
+        sheet.append(row)
+        count += 1
+    return count
+
+def read_export_snapshot(start_date, end_date):
+    """Read each collection an export needs once, as one consistent snapshot
+    
+    The reads are retried when a collection's version moves while they run,
+    so a sale landing mid-export cannot leave its transaction out of one
+    read and its stock change in another.
+    """
+    for _ in range(SNAPSHOT_ATTEMPTS):
+        versions = [get_version(collection) for collection in EXPORT_COLLECTIONS]
+        snapshot = {
+            'transactions': read_range('transactions', start_date, end_date),
+            'turned_away': read_range('turned_away', start_date, end_date),
+            'inventory': read_data('inventory') or {}
+        }
+        if versions == [get_version(collection) for collection in EXPORT_COLLECTIONS]:
+            break
+    return snapshot
+
+def get_transactions_rows(transactions_data):
+    """Yield the rows of the transactions sheet, in TRANSACTION_COLUMNS order"""
     for transaction_id, transaction in transactions_data.items():
-        transaction_date = datetime.strptime(transaction.get('date', ''), '%Y-%m-%d').date()
+        # Flatten items for easier Excel viewing
+        items_str = "; ".join([f"{item['name']} x{item['quantity']} @ ${item['price']:.2f}" 
+                             for item in transaction.get('items', [])])
         
-        if start_date <= transaction_date <= end_date:
-            # Flatten items for easier Excel viewing
-            items_str = "; ".join([f"{item['name']} x{item['quantity']} @ ${item['price']:.2f}" 
-                                 for item in transaction.get('items', [])])
-            
-            # Include confirmation number for Zelle payments
-            payment_info = transaction.get('payment_method', '')
-            if transaction.get('payment_method') == 'Zelle' and transaction.get('confirmation_number'):
-                payment_info += f" (Conf: {transaction.get('confirmation_number')})"
-            
-            transactions_list.append({
-                'Transaction ID': transaction.get('id', transaction_id),
-                'Date': transaction.get('date', ''),
-                'Time': transaction.get('time', ''),
-                'Total': f"${transaction.get('total', 0):.2f}",
-                'Payment Method': payment_info,
-                'Confirmation Number': transaction.get('confirmation_number', ''),
-                'Customer Notes': transaction.get('customer_notes', ''),
-                'Items': items_str,
-                'Item Count': len(transaction.get('items', [])),
-                'Timestamp': transaction.get('timestamp', '')
-            })
-    
-    return pd.DataFrame(transactions_list)
-
-def get_turned_away_dataframe(start_date, end_date):
-    """Get turned away data as DataFrame"""
-    turned_away_data = read_data('turned_away')
-    
-    if not turned_away_data:
-        return pd.DataFrame()
-    
-    # Convert to list and filter by date range
-    turned_away_list = []
-    
-    for entry_id, entry in turned_away_data.items():
-        entry_date = datetime.strptime(entry.get('date', ''), '%Y-%m-%d').date()
+        # Include confirmation number for Zelle payments
+        payment_info = transaction.get('payment_method', '')
+        if transaction.get('payment_method') == 'Zelle' and transaction.get('confirmation_number'):
+            payment_info += f" (Conf: {transaction.get('confirmation_number')})"
         
-        if start_date <= entry_date <= end_date:
-            turned_away_list.append({
-                'Date': entry.get('date', ''),
-                'Time': entry.get('time', ''),
-                'Reason': entry.get('reason', ''),
-                'Timestamp': entry.get('timestamp', '')
-            })
-    
-    return pd.DataFrame(turned_away_list)
+        yield [
+            transaction.get('id', transaction_id),
+            transaction.get('date', ''),
+            transaction.get('time', ''),
+            f"${transaction.get('total', 0):.2f}",
+            payment_info,
+            transaction.get('confirmation_number', ''),
+            transaction.get('customer_notes', ''),
+            items_str,
+            len(transaction.get('items', [])),
+            transaction.get('timestamp', '')
+        ]
 
-def get_inventory_dataframe():
-    """Get inventory data as DataFrame"""
-    inventory_data = read_data('inventory')
-    
-    if not inventory_data:
-        return pd.DataFrame()
-    
-    # Convert to list
-    inventory_list = []
-    
+def get_turned_away_rows(turned_away_data):
+    """Yield the rows of the turned away sheet, in TURNED_AWAY_COLUMNS order"""
+    for entry in turned_away_data.values():
+        yield [entry.get('date', ''), entry.get('time', ''), entry.get('reason', ''), entry.get('timestamp', '')]
+
+def get_inventory_rows(inventory_data):
+    """Yield the rows of the inventory sheet, in INVENTORY_COLUMNS order"""
     for item_id, item in inventory_data.items():
-        inventory_list.append({
-            'Item ID': item.get('id', item_id),
-            'Name': item.get('name', ''),
-            'Category': item.get('category', ''),
-            'Price': f"${item.get('price', 0):.2f}",
-            'Stock': item.get('stock', 0),
-            'SKU': item.get('sku', ''),
-            'Description': item.get('description', ''),
-            'Status': 'Active' if item.get('active', True) else 'Inactive',
-            'Created': item.get('created_at', '')[:10] if item.get('created_at') else '',
-            'Updated': item.get('updated_at', '')[:10] if item.get('updated_at') else ''
-        })
-    
-    return pd.DataFrame(inventory_list)
+        yield [
+            item.get('id', item_id),
+            item.get('name', ''),
+            item.get('category', ''),
+            f"${item.get('price', 0):.2f}",
+            item.get('stock', 0),
+            item.get('sku', ''),
+            item.get('description', ''),
+            'Active' if item.get('active', True) else 'Inactive',
+            item.get('created_at', '')[:10] if item.get('created_at') else '',
+            item.get('updated_at', '')[:10] if item.get('updated_at') else ''
+        ]
 
-def generate_summary_sheet(writer, start_date, end_date):
-    """Generate a summary sheet with key metrics"""
-    
-    # Get data
-    transactions_data = read_data('transactions')
-    turned_away_data = read_data('turned_away')
-    inventory_data = read_data('inventory')
-    
+def get_summary_rows(start_date, end_date, transactions_data, turned_away_data, inventory_data):
+    """Get the key metric rows of the summary sheet"""
     summary_data = []
     
     # Date range info
-    summary_data.append(['Report Generated', datetime.now().strftime('%Y-%m-%d %H:%M:%S')])
     summary_data.append(['Date Range', f"{start_date} to {end_date}"])
     summary_data.append(['', ''])
     
     # Transaction summary
     if transactions_data:
-        date_filtered_transactions = []
-        total_revenue = 0
-        
-        for transaction in transactions_data.values():
-            transaction_date = datetime.strptime(transaction.get('date', ''), '%Y-%m-%d').date()
-            if start_date <= transaction_date <= end_date:
-                date_filtered_transactions.append(transaction)
-                total_revenue += transaction.get('total', 0)
+        date_filtered_transactions = list(transactions_data.values())
+        total_revenue = sum(transaction.get('total', 0) for transaction in date_filtered_transactions)
         
         summary_data.append(['SALES SUMMARY', ''])
         summary_data.append(['Total Transactions', len(date_filtered_transactions)])
@@ -247,12 +256,7 @@ def generate_summary_sheet(writer, start_date, end_date):
     
     # Turned away summary
     if turned_away_data:
-        date_filtered_turned_away = []
-        
-        for entry in turned_away_data.values():
-            entry_date = datetime.strptime(entry.get('date', ''), '%Y-%m-%d').date()
-            if start_date <= entry_date <= end_date:
-                date_filtered_turned_away.append(entry)
+        date_filtered_turned_away = list(turned_away_data.values())
         
         summary_data.append(['TURNED AWAY SUMMARY', ''])
         summary_data.append(['Total Turned Away', len(date_filtered_turned_away)])
@@ -269,39 +273,15 @@ def generate_summary_sheet(writer, start_date, end_date):
         summary_data.append(['Active Items', active_items])
         summary_data.append(['Total Inventory Value', f"${total_stock_value:.2f}"])
     
-    # Create DataFrame and export
-    summary_df = pd.DataFrame(summary_data, columns=['Metric', 'Value'])
-    summary_df.to_excel(writer, sheet_name='Summary', index=False)
+    return summary_data
 
-def generate_turned_away_stats_sheet(writer, start_date, end_date):
-    """Generate detailed turned away statistics sheet"""
-    
-    # Get turned away data
-    turned_away_data = read_data('turned_away')
-    
-    if not turned_away_data:
-        # Create empty sheet with message
-        empty_stats = pd.DataFrame([['No turned away data available', '']], 
-                                 columns=['Statistic', 'Value'])
-        empty_stats.to_excel(writer, sheet_name='Turned Away Stats', index=False)
-        return
-    
-    # Filter by date range
-    date_filtered_turned_away = []
-    for entry in turned_away_data.values():
-        try:
-            entry_date = datetime.strptime(entry.get('date', ''), '%Y-%m-%d').date()
-            if start_date <= entry_date <= end_date:
-                date_filtered_turned_away.append(entry)
-        except:
-            continue
+def get_turned_away_stats_rows(start_date, end_date, turned_away_data):
+    """Get the rows of the detailed turned away statistics sheet"""
+    date_filtered_turned_away = list(turned_away_data.values())
     
     if not date_filtered_turned_away:
-        # Create empty sheet with message
-        empty_stats = pd.DataFrame([['No turned away data for selected date range', '']], 
-                                 columns=['Statistic', 'Value'])
-        empty_stats.to_excel(writer, sheet_name='Turned Away Stats', index=False)
-        return
+        # Sheet with just a message
+        return [['No turned away data for selected date range', '']]
     
     # Calculate statistics
     stats_data = []
@@ -364,15 +344,9 @@ def generate_turned_away_stats_sheet(writer, start_date, end_date):
         stats_data.append(['', ''])
         stats_data.append(['TIME ANALYSIS', ''])
         
-        # Group by hour
-        hour_counts = {}
-        for entry in times_with_data:
-            try:
-                time_str = entry.get('time', '')
-                hour = int(time_str.split(':')[0])
-                hour_counts[hour] = hour_counts.get(hour, 0) + 1
-            except:
-                continue
+        # Group by hour, parsing every time string in one pass
+        hours = pd.to_numeric(pd.Series([entry['time'] for entry in times_with_data]).str.split(':').str[0], errors='coerce')
+        hour_counts = hours.dropna().astype(int).value_counts().to_dict()
         
         if hour_counts:
             peak_hour = max(hour_counts.items(), key=lambda x: x[1])
@@ -384,6 +358,4 @@ def generate_turned_away_stats_sheet(writer, start_date, end_date):
             for hour in sorted(hour_counts.keys()):
                 stats_data.append([f"{hour:02d}:00", hour_counts[hour]])
     
-    # Create DataFrame and export
-    stats_df = pd.DataFrame(stats_data, columns=['Statistic', 'Value'])
-    stats_df.to_excel(writer, sheet_name='Turned Away Stats', index=False)
+    return stats_data
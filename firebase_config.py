@@ -1,8 +1,79 @@
 import firebase_admin
-from firebase_admin import credentials, db
+from firebase_admin import credentials, db, exceptions
 import os
 import json
+import random
+import secrets
+import threading
+import time
+import copy
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
+from urllib.parse import unquote
+from local_storage import append_log, read_store
+from storage_common import (
+    ROLLUP_COLLECTIONS, UNDATED_PARTITION, group_records, in_range, get_partition_name, build_rollup,
+    add_rollup, rollup_records
+)
+
+# Keep these collections mirrored in memory by streaming listeners. The
+# growing collections are left out and read by server-side range queries.
+MIRROR_ENABLED = os.getenv("FIREBASE_MIRROR", "1") != "0"
+MIRROR_COLLECTIONS = tuple(
+    name.strip() for name in os.getenv("FIREBASE_MIRROR_COLLECTIONS", "inventory,turned_away").split(',') if name.strip()
+)
+# Longest a mirror may go without an event before reads re-fetch it
+MIRROR_MAX_STALENESS = float(os.getenv("FIREBASE_MIRROR_MAX_STALENESS", "60"))
+# How long the first read waits for a new listener's initial snapshot
+MIRROR_START_TIMEOUT = 5
+# Backoff between attempts to connect a listener that failed to start
+MIRROR_RETRY_BASE = 1
+MIRROR_RETRY_MAX = 60
+
+# Fields range queries may order by; each needs an .indexOn rule (database.rules.json)
+RANGE_FIELDS = ('date', 'timestamp')
+# How long records from a range query may answer follow-up reads of the same keys
+RANGE_CACHE_SECONDS = 30
+
+_range_results = {}
+_range_results_lock = threading.Lock()
+
+# Per-day rollups live at _rollups/<collection>/<date>, kept in step by an
+# increment in every commit, and are always mirrored: they are one small row per day
+ROLLUPS = "_rollups"
+_verified_rollups = set()
+
+_mirrors = {}
+_mirrors_lock = threading.Lock()
+
+# Writes this process made to each collection, for get_version
+_versions = {}
+_versions_lock = threading.Lock()
+
+# Queue writes in a durable local outbox (data/_outbox) and deliver them from
+# a background thread, so sales go through while the uplink is down
+OUTBOX_ENABLED = os.getenv("FIREBASE_OUTBOX", "1") != "0"
+OUTBOX = "_outbox"
+# Entries Firebase refused outright, kept for inspection instead of blocking the queue
+OUTBOX_REJECTED = "_outbox_rejected"
+# Where each delivered entry leaves a marker, making redelivery detectable
+OUTBOX_APPLIED = "_outbox_applied"
+# Each record the outbox increments keeps, per outbox, the ids of the queued
+# entries that already changed it in this field, so a resent batch skips
+# their increments. OUTBOX_WRITER holds this data directory's outbox id
+INCREMENT_MARKERS = "_outbox_increments"
+OUTBOX_WRITER = "_outbox_writer"
+OUTBOX_BATCH_SIZE = 50
+OUTBOX_BASE_BACKOFF = 1
+OUTBOX_MAX_BACKOFF = 60
+OUTBOX_POLL_SECONDS = 5
+
+_outbox_state = {
+    'wake': threading.Event(), 'thread': None, 'writer': None, 'uncertain': set(), 'delivered': set(),
+    'failures': 0, 'last_error': None, 'retry_at': 0,
+    'flushed': 0, 'rejected': 0, 'isolate': False, 'last_flush_latency': None, 'last_flush_at': None
+}
+_outbox_lock = threading.Lock()
 
 def initialize_firebase():
     """Initialize Firebase connection"""
@@ -25,7 +96,7 @@ def initialize_firebase():
             firebase_admin.initialize_app(cred, {
                 'databaseURL': database_url
             })
-            
+        
         except Exception as e:
             st.error(f"Firebase initialization failed: {str(e)}")
             st.info("Please ensure FIREBASE_SERVICE_ACCOUNT_KEY and FIREBASE_DATABASE_URL environment variables are set correctly.")
@@ -35,51 +106,955 @@ def get_database_ref(path):
     """Get a reference to a specific path in the database"""
     return db.reference(path)
 
-def write_data(path, data):
+def initialize_storage():
+    """Initialize Firebase as the storage backend"""
+    initialize_firebase()
+    if OUTBOX_ENABLED:
+        # Deliver anything queued before the last shutdown
+        start_outbox()
+    return True
+
+def split_path(path):
+    """Split a database path into segments"""
+    return [segment for segment in path.split('/') if segment]
+
+def set_path(node, segments, value):
+    """Set a value inside a JSON tree, returning the new tree"""
+    if not segments:
+        return copy.deepcopy(value)
+    if not isinstance(node, dict):
+        node = {}
+    child = set_path(node.get(segments[0]), segments[1:], value)
+    if child is None or child == {}:
+        node.pop(segments[0], None)
+    else:
+        node[segments[0]] = child
+    return node
+
+def apply_mirror_event(mirror, event):
+    """Apply a streamed put or patch event to a mirror"""
+    with mirror['lock']:
+        segments = split_path(event.path)
+        if event.event_type == 'put':
+            mirror['data'] = set_path(mirror['data'], segments, event.data)
+        elif event.event_type == 'patch':
+            for path, value in event.data.items():
+                mirror['data'] = set_path(mirror['data'], segments + split_path(path), value)
+        mirror['synced_at'] = time.monotonic()
+        mirror['events'] += 1
+        mirror['version'] += 1
+    mirror['ready'].set()
+    mirror['settled'].set()
+
+def start_mirror(collection):
+    """Start a listener that keeps a collection's mirror current
+    
+    'ready' is set once the mirror holds data, 'settled' once it holds data
+    or its listener failed to connect, so reads never wait on a dead one.
+    """
+    mirror = {
+        'data': None, 'lock': threading.Lock(), 'ready': threading.Event(), 'settled': threading.Event(),
+        'synced_at': 0, 'events': 0, 'version': 0, 'refreshes': 0, 'max_staleness': 0,
+        'registration': None, 'listen_failed': False, 'listen_failures': 0, 'retry_at': 0
+    }
+    start_listener(mirror, collection)
+    return mirror
+
+def start_listener(mirror, collection):
+    """Connect a mirror's listener in the background, scheduling a retry if that fails"""
+    def callback(event):
+        try:
+            apply_mirror_event(mirror, event)
+        except Exception:
+            # A bad event must not kill the listener; the next refresh repairs the mirror
+            mirror['synced_at'] = 0
+    
+    def listen():
+        try:
+            # listen() connects before it returns, so an unreachable uplink raises here
+            registration = db.reference(collection).listen(callback)
+            with mirror['lock']:
+                mirror['registration'] = registration
+                mirror['listen_failures'] = 0
+        except Exception:
+            with mirror['lock']:
+                mirror['listen_failures'] += 1
+                backoff = min(MIRROR_RETRY_MAX, MIRROR_RETRY_BASE * 2 ** (mirror['listen_failures'] - 1))
+                mirror['retry_at'] = time.monotonic() + random.uniform(backoff / 2, backoff)
+                mirror['listen_failed'] = True
+            mirror['settled'].set()
+    
+    mirror['listen_failed'] = False
+    # Listener threads inherit daemon status, so they never hold the process open
+    threading.Thread(target=listen, daemon=True).start()
+
+def refresh_mirror(mirror, collection):
+    """Re-fetch a mirror whose listener has been quiet past the staleness bound"""
+    events = mirror['events']
+    data = db.reference(collection).get()
+    with mirror['lock']:
+        # An event that landed during the fetch is newer than what we got
+        if mirror['events'] == events:
+            mirror['data'] = data
+            mirror['version'] += 1
+        mirror['synced_at'] = time.monotonic()
+        mirror['refreshes'] += 1
+    mirror['ready'].set()
+    mirror['settled'].set()
+
+def get_mirror(collection):
+    """Get a current mirror of a collection, or None to read from the network"""
+    if not MIRROR_ENABLED or (collection not in MIRROR_COLLECTIONS and collection != ROLLUPS):
+        return None
+    
+    with _mirrors_lock:
+        if collection not in _mirrors:
+            _mirrors[collection] = start_mirror(collection)
+        mirror = _mirrors[collection]
+        if mirror['listen_failed'] and time.monotonic() >= mirror['retry_at']:
+            start_listener(mirror, collection)
+    
+    if not mirror['settled'].wait(MIRROR_START_TIMEOUT):
+        return None
+    
+    if not mirror['ready'].is_set():
+        # The listener failed before the first snapshot: read from the network
+        return None
+    
+    listening = is_listening(mirror['registration'])
+    if not listening or time.monotonic() - mirror['synced_at'] > MIRROR_MAX_STALENESS:
+        try:
+            refresh_mirror(mirror, collection)
+        except Exception:
+            # Offline: keep serving the last known state; the stats show its age
+            pass
+    
+    with mirror['lock']:
+        mirror['max_staleness'] = max(mirror['max_staleness'], time.monotonic() - mirror['synced_at'])
+    return mirror
+
+def is_listening(registration):
+    """Check whether a listener registration's stream is still running
+    
+    ListenerRegistration has no public check, so this looks for its private
+    thread; without one the listener counts as stopped and reads re-fetch.
+    """
+    thread = getattr(registration, '_thread', None)
+    return isinstance(thread, threading.Thread) and thread.is_alive()
+
+def read_mirror(mirror):
+    """Copy a mirror's records out for the caller"""
+    with mirror['lock']:
+        data = mirror['data']
+        return copy.deepcopy(data) if isinstance(data, dict) else {}
+
+def write_mirror(path, value):
+    """Apply this process's own write to the mirror without waiting for its echo"""
+    segments = split_path(path)
+    with _mirrors_lock:
+        mirror = _mirrors.get(segments[0])
+    if mirror is not None and mirror['ready'].is_set():
+        with mirror['lock']:
+            mirror['data'] = set_path(mirror['data'], segments[1:], value)
+            mirror['version'] += 1
+
+def write_mirror_result(path, old, new):
+    """Apply a transaction's result to the mirror unless the mirror has already moved past it
+    
+    Concurrent commits finish in any order, so a result only lands on the
+    value it replaced; otherwise the listener's in-order events bring the
+    mirror up to date.
+    """
+    segments = split_path(path)
+    with _mirrors_lock:
+        mirror = _mirrors.get(segments[0])
+    if mirror is not None and mirror['ready'].is_set():
+        with mirror['lock']:
+            current = mirror['data']
+            for segment in segments[1:]:
+                current = current.get(segment) if isinstance(current, dict) else None
+            if current == old:
+                mirror['data'] = set_path(mirror['data'], segments[1:], new)
+                mirror['version'] += 1
+
+def bump_version(collection):
+    """Count a write this process made to a collection"""
+    with _versions_lock:
+        _versions[collection] = _versions.get(collection, 0) + 1
+
+def get_version(collection):
+    """Get a token that changes whenever a collection does
+    
+    A mirrored collection changes with its mirror. Others count this
+    process's writes and, when they have rollups, the rollup mirror's
+    changes, which is how other terminals' sales show up. As their reads go
+    to the network they also turn over every RANGE_CACHE_SECONDS.
+    """
+    mirror = get_mirror(collection)
+    if mirror is not None:
+        with mirror['lock']:
+            return ('mirror', mirror['version'])
+    
+    rollups = get_mirror(ROLLUPS) if collection in ROLLUP_COLLECTIONS else None
+    rollups_version = None
+    if rollups is not None:
+        with rollups['lock']:
+            rollups_version = rollups['version']
+    with _versions_lock:
+        local_version = _versions.get(collection, 0)
+    return ('network', local_version, rollups_version, int(time.time() // RANGE_CACHE_SECONDS))
+
+def get_mirror_stats():
+    """Staleness and event counts of each mirror, for monitoring"""
+    stats = {}
+    with _mirrors_lock:
+        mirrors = dict(_mirrors)
+    for collection, mirror in mirrors.items():
+        with mirror['lock']:
+            registration = mirror['registration']
+            stats[collection] = {
+                'staleness_seconds': time.monotonic() - mirror['synced_at'] if mirror['synced_at'] else None,
+                'max_served_staleness_seconds': mirror['max_staleness'],
+                'staleness_bound_seconds': MIRROR_MAX_STALENESS,
+                'events': mirror['events'],
+                'refreshes': mirror['refreshes'],
+                'listening': is_listening(registration),
+                'listen_failures': mirror['listen_failures']
+            }
+    return stats
+
+def read_data(collection):
+    """Read data from the collection's mirror, or from Firebase"""
+    try:
+        mirror = get_mirror(collection)
+        if mirror is not None:
+            return read_mirror(mirror)
+        return db.reference(collection).get() or {}
+    except Exception as e:
+        st.error(f"Failed to read data from {collection}: {str(e)}")
+        return {}
+
+def remember_range(collection, records):
+    """Keep a range query's records to answer follow-up reads of the same keys"""
+    with _range_results_lock:
+        _range_results[collection] = (time.monotonic(), records)
+
+def recent_range(collection):
+    """Get the records of the collection's last range query, if still fresh"""
+    with _range_results_lock:
+        read_at, records = _range_results.get(collection, (0, {}))
+    return records if time.monotonic() - read_at <= RANGE_CACHE_SECONDS else {}
+
+def read_records(collection, keys):
+    """Read just the given records from the mirror, or from Firebase"""
+    try:
+        mirror = get_mirror(collection)
+        data = {}
+        if mirror is not None:
+            with mirror['lock']:
+                records = mirror['data'] if isinstance(mirror['data'], dict) else {}
+                for key in keys:
+                    if key in records:
+                        data[key] = copy.deepcopy(records[key])
+            return data
+        
+        # Keys from a range just read need no further round trips
+        recent = recent_range(collection)
+        for key in keys:
+            if key in recent:
+                data[key] = copy.deepcopy(recent[key])
+            else:
+                record = db.reference(f"{collection}/{key}").get()
+                if record is not None:
+                    data[key] = record
+        return data
+    except Exception as e:
+        st.error(f"Failed to read data from {collection}: {str(e)}")
+        return {}
+
+def read_range(collection, start_date, end_date, field='date'):
+    """Read the records whose date (or timestamp) is within [start_date, end_date]
+    
+    Mirrored collections are filtered locally. Others are queried with
+    order_by_child(field).start_at().end_at(), so only the matching records
+    are downloaded.
+    """
+    if field not in RANGE_FIELDS:
+        raise ValueError(f"Cannot range over {field}")
+    
+    start, end = str(start_date), str(end_date)
+    try:
+        mirror = get_mirror(collection)
+        if mirror is not None:
+            return {key: record for key, record in read_mirror(mirror).items()
+                    if isinstance(record, dict) and in_range(record.get(field), start, end)}
+        
+        # "\uf8ff" sorts after every other character, so a date end bound takes in
+        # every timestamp of that day
+        query = db.reference(collection).order_by_child(field).start_at(start).end_at(end + "\uf8ff")
+        records = dict(query.get() or {})
+        remember_range(collection, records)
+        return copy.deepcopy(records)
+    except Exception as e:
+        st.error(f"Failed to read data from {collection}: {str(e)}")
+        return {}
+
+def range_keys(collection, start_date, end_date, field='date'):
+    """Get the keys of the records whose field is within [start_date, end_date], in field order
+    
+    The query cannot return keys alone, so this sorts what read_range (and
+    its short-lived cache) returns.
+    """
+    records = read_range(collection, start_date, end_date, field)
+    return [key for _, key in sorted((str(record.get(field)), key) for key, record in records.items()
+                                     if isinstance(record, dict))]
+
+def count_data(collection):
+    """Count the records in a collection from the mirror, or with a shallow read"""
+    try:
+        mirror = get_mirror(collection)
+        if mirror is not None:
+            with mirror['lock']:
+                return len(mirror['data']) if isinstance(mirror['data'], dict) else 0
+        return len(db.reference(collection).get(shallow=True) or {})
+    except Exception as e:
+        st.error(f"Failed to read data from {collection}: {str(e)}")
+        return 0
+
+def write_data(collection, data):
     """Write data to Firebase"""
     try:
-        ref = db.reference(path)
-        ref.set(data)
+        if collection in ROLLUP_COLLECTIONS:
+            # Replace the records and their rollups in one update
+            rollups = encode_keys(rollup_records(collection, data))
+            db.reference().update({collection: data, f"{ROLLUPS}/{collection}": rollups})
+            write_mirror(f"{ROLLUPS}/{collection}", rollups)
+        else:
+            db.reference(collection).set(data)
+        write_mirror(collection, data)
+        bump_version(collection)
         return True
     except Exception as e:
-        st.error(f"Failed to write data: {str(e)}")
+        st.error(f"Failed to write data to {collection}: {str(e)}")
         return False
 
-def read_data(path):
-    """Read data from Firebase"""
+def push_data(collection, data):
+    """Push data to Firebase (generates unique key)"""
+    keys = commit_batch([{'op': 'push', 'collection': collection, 'data': data}])
+    return keys[0] if keys else None
+
+def update_data(collection, key, data):
+    """Update specific item in Firebase"""
+    return commit_batch([{'op': 'update', 'collection': collection, 'key': key, 'data': data}]) is not None
+
+def delete_data(collection, key=None):
+    """Delete data from Firebase"""
+    if key is not None:
+        return commit_batch([{'op': 'delete', 'collection': collection, 'key': key}]) is not None
+    
     try:
-        ref = db.reference(path)
-        return ref.get()
+        if collection in ROLLUP_COLLECTIONS:
+            db.reference().update({collection: None, f"{ROLLUPS}/{collection}": None})
+            write_mirror(f"{ROLLUPS}/{collection}", None)
+        else:
+            db.reference(collection).delete()
+        write_mirror(collection, None)
+        bump_version(collection)
+        return True
     except Exception as e:
-        st.error(f"Failed to read data: {str(e)}")
-        return None
+        st.error(f"Failed to delete data from {collection}: {str(e)}")
+        return False
 
-def push_data(path, data):
-    """Push data to Firebase (generates unique key)"""
+# Characters of Firebase push keys, in ascending sort order
+PUSH_CHARS = "-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz"
+
+# Last push key time and random part, so keys from one process keep sorting in order
+_push_state = {'time': 0, 'random': []}
+_push_lock = threading.Lock()
+
+# Last seen (value, ETag) per record path, so a transaction can skip its read
+_etags = {}
+_etags_lock = threading.Lock()
+
+def generate_push_key():
+    """Generate a chronologically sortable Firebase push key without a round trip"""
+    with _push_lock:
+        now = int(time.time() * 1000)
+        if now == _push_state['time']:
+            # Same millisecond: bump the random part so keys stay unique and ordered
+            random_part = _push_state['random']
+            position = 11
+            while random_part[position] == 63:
+                random_part[position] = 0
+                position -= 1
+            random_part[position] += 1
+        else:
+            _push_state['time'] = now
+            _push_state['random'] = [secrets.randbelow(64) for _ in range(12)]
+        
+        time_part = []
+        for _ in range(8):
+            time_part.append(PUSH_CHARS[now % 64])
+            now //= 64
+        return ''.join(reversed(time_part)) + ''.join(PUSH_CHARS[i] for i in _push_state['random'])
+
+def apply_increment(record, operation):
+    """Get a record with an increment operation applied"""
+    if 'delta' in operation:
+        # A rollup row, created by its first increment
+        return add_rollup(copy.deepcopy(record) if isinstance(record, dict) else {}, operation['delta']) or None
+    if not isinstance(record, dict):
+        return record
+    record = dict(record)
+    field = operation['field']
+    new_value = record.get(field, 0) + operation['amount']
+    if operation.get('minimum') is not None:
+        new_value = max(operation['minimum'], new_value)
+    record.update(operation.get('data', {}))
+    record[field] = new_value
+    return record
+
+def was_resent(response):
+    """Check whether the client retried a request, e.g. after its first response was lost"""
+    retries = getattr(getattr(response, 'raw', None), 'retries', None)
+    return bool(retries is not None and retries.history)
+
+def set_if_unchanged(ref, etag, value):
+    """ref.set_if_unchanged, also reporting whether the client had to resend the write
+    
+    Returns (success, current value, ETag, resent). Goes through the SDK's
+    private client because set_if_unchanged drops the response with its retry
+    history. An SDK without that client gets the public call, which never
+    reports a resend; increment markers still catch those.
+    """
+    if not (hasattr(ref, '_client') and hasattr(ref, '_add_suffix')):
+        success, current, etag = ref.set_if_unchanged(etag, value)
+        return success, current, etag, False
+    try:
+        response = ref._client.request('put', ref._add_suffix(), json=value, headers={'if-match': etag})
+        return True, value, response.headers.get('ETag'), was_resent(response)
+    except exceptions.FailedPreconditionError as error:
+        response = error.http_response
+        if response is not None and 'ETag' in response.headers:
+            return False, response.json(), response.headers['ETag'], was_resent(response)
+        raise
+
+def increment_record(path, operations, outbox_floor=None):
+    """Apply one record's increments in a Firebase transaction, returning (old, new) values
+    
+    Starts from the cached ETag when there is one, so an uncontended
+    increment is a single conditional write. A stale ETag just costs a retry
+    with the value the server sends back. With outbox_floor (the oldest
+    queued entry id) the operations carry their outbox entry ids: those the
+    record already lists are skipped, the rest are listed in the same write,
+    and ids below the floor are dropped. New is None if nothing was left.
+    """
+    writer = get_outbox_writer() if outbox_floor is not None else None
+    ref = db.reference(path)
+    with _etags_lock:
+        cached = _etags.get(path)
+    record, etag = cached if cached else ref.get(etag=True)
+    creates = any('delta' in operation for operation in operations)
+    
+    for attempt in range(25):
+        if record is None and not creates:
+            return None, None
+        markers = (record.get(INCREMENT_MARKERS) if isinstance(record, dict) else None) or {}
+        applied = markers.get(writer) if isinstance(markers.get(writer), dict) else {}
+        pending = [operation for operation in operations if operation.get('entry') not in applied]
+        if not pending:
+            # Every entry here landed with an earlier send of its batch
+            return record, None
+        new_record = record
+        for operation in pending:
+            new_record = apply_increment(new_record, operation)
+        if outbox_floor is not None and isinstance(new_record, dict):
+            # Entries older than the queue can never be resent
+            entries = {entry: True for entry in applied if entry >= outbox_floor}
+            entries.update((operation['entry'], True) for operation in pending)
+            new_record = dict(new_record, **{INCREMENT_MARKERS: dict(markers, **{writer: entries})})
+        success, current, etag, resent = set_if_unchanged(ref, etag, new_record)
+        # A write resent after its first response was lost finds its own value in
+        # place. Without a resend, an equal value is another register's write.
+        if success or (resent and current == new_record):
+            with _etags_lock:
+                _etags[path] = (new_record, etag)
+            return record, new_record
+        record = current
+        if attempt >= 2:
+            # Still colliding: back off with jitter, then start from a fresh read
+            time.sleep(random.uniform(0, min(0.5, 0.01 * 2 ** attempt)))
+            record, etag = ref.get(etag=True)
+    
+    with _etags_lock:
+        _etags.pop(path, None)
+    raise RuntimeError(f"Too many conflicting writes to {path}")
+
+def reverse_increments(operations, old, new):
+    """Increments that put back what one record's transaction changed"""
+    reverse = [{'delta': add_rollup({}, operation['delta'], -1)} for operation in operations if 'delta' in operation]
+    fields = {operation['field'] for operation in operations if 'delta' not in operation}
+    reverse.extend({'field': field, 'amount': (old or {}).get(field, 0) - new[field]} for field in fields)
+    return reverse
+
+def build_update(operations, markers=(), cleared_markers=()):
+    """Turn batch operations into one multi-location update, returning (paths, keys, increments)
+    
+    Each marker is an outbox entry id recorded under OUTBOX_APPLIED in the
+    same update, so a retry can tell the entry already landed. Markers of
+    entries already acknowledged are cleared along the way.
+    """
+    paths = {f"{OUTBOX_APPLIED}/{marker}": None for marker in cleared_markers}
+    paths.update({f"{OUTBOX_APPLIED}/{marker}": {'.sv': 'timestamp'} for marker in markers})
+    keys = []
+    increments = {}
+    for operation in operations:
+        collection = operation['collection']
+        
+        if operation['op'] == 'push':
+            key = operation.get('key') or generate_push_key()
+            paths[f"{collection}/{key}"] = operation['data']
+        
+        elif operation['op'] == 'update':
+            key = operation['key']
+            for field, value in operation['data'].items():
+                paths[f"{collection}/{key}/{field}"] = value
+        
+        elif operation['op'] == 'increment':
+            # Server-side increments would be applied twice if the SDK resent a
+            # update() whose response was lost, so every increment is a transaction
+            key = operation['key']
+            increments.setdefault(f"{collection}/{key}", []).append(operation)
+        
+        elif operation['op'] == 'delete':
+            key = operation['key']
+            paths[f"{collection}/{key}"] = None
+        
+        else:
+            raise ValueError(f"Unknown batch operation: {operation['op']}")
+        keys.append(key)
+    return paths, keys, increments
+
+def commit_operations(operations, markers=(), cleared_markers=(), outbox_floor=None):
+    """Apply batch operations (see local_storage.commit_batch) in one multi-location update, raising on failure
+    
+    Pushes get pre-generated keys and go in the same update() as field
+    updates and deletes, so the server applies them together in one round
+    trip. Increments (stock) run first as Firebase transactions, in parallel,
+    and are reversed if the update then fails. From the outbox (operations
+    tagged with their entry ids, see increment_record) they are marked
+    instead and left in place, so a resend skips the entries already applied.
+    """
+    paths, keys, increments = build_update(operations, markers, cleared_markers)
+    
+    # Records are independent, so their transactions run side by side
+    with ThreadPoolExecutor(max_workers=max(1, min(len(increments), 8))) as executor:
+        futures = [(path, executor.submit(increment_record, path, path_operations, outbox_floor))
+                   for path, path_operations in increments.items()]
+    
+    applied = []
+    error = None
+    for path, future in futures:
+        try:
+            old, new = future.result()
+            if new is not None:
+                applied.append((path, old, new))
+        except Exception as e:
+            error = error or e
+    
     try:
-        ref = db.reference(path)
-        new_ref = ref.push(data)
-        return new_ref.key
+        if error:
+            raise error
+        if paths:
+            db.reference().update(paths)
+    except Exception:
+        if outbox_floor is None:
+            # Put back exactly what the transactions took
+            for path, old, new in applied:
+                increment_record(path, reverse_increments(increments[path], old, new))
+        raise
+    
+    # Markers hold server timestamps, so those wait for the listener's echo
+    for path, value in paths.items():
+        if not (isinstance(value, dict) and '.sv' in value):
+            write_mirror(path, value)
+    for path, old, new in applied:
+        write_mirror_result(path, old, new)
+    return keys
+
+def apply_locally(operations):
+    """Show queued operations in the mirrors before they reach Firebase"""
+    for operation in operations:
+        path = f"{operation['collection']}/{operation['key']}"
+        if operation['op'] == 'push':
+            write_mirror(path, operation['data'])
+        elif operation['op'] == 'update':
+            for field, value in operation['data'].items():
+                write_mirror(f"{path}/{field}", value)
+        elif operation['op'] == 'increment':
+            segments = split_path(path)
+            with _mirrors_lock:
+                mirror = _mirrors.get(segments[0])
+            if mirror is not None and mirror['ready'].is_set():
+                with mirror['lock']:
+                    record = mirror['data']
+                    for segment in segments[1:]:
+                        record = record.get(segment) if isinstance(record, dict) else None
+                    record = apply_increment(record, operation)
+                write_mirror(path, record)
+        elif operation['op'] == 'delete':
+            write_mirror(path, None)
+
+def enqueue_operations(operations):
+    """Durably queue batch operations for the flusher, returning their keys"""
+    # Fix push keys now so every retry of this entry writes the same records
+    operations = [
+        dict(operation, key=operation.get('key') or generate_push_key()) if operation['op'] == 'push' else operation
+        for operation in operations
+    ]
+    for operation in operations:
+        if operation['op'] not in ('push', 'update', 'increment', 'delete'):
+            raise ValueError(f"Unknown batch operation: {operation['op']}")
+    
+    # Entry ids are push keys too, so they sort in queue order
+    entry_id = generate_push_key()
+    append_log(OUTBOX, {'op': 'set', 'key': entry_id, 'value': {
+        'operations': operations,
+        'enqueued_at': time.time()
+    }})
+    
+    apply_locally(operations)
+    start_outbox()
+    _outbox_state['wake'].set()
+    return [operation['key'] for operation in operations]
+
+def is_permanent_error(error):
+    """Check whether retrying a failed flush can never succeed"""
+    return isinstance(error, (ValueError, TypeError, exceptions.InvalidArgumentError, exceptions.PermissionDeniedError))
+
+def entry_paths(entry):
+    """The paths an entry writes outright and the records it increments"""
+    paths, _, increments = build_update(entry['operations'])
+    return list(paths), list(increments)
+
+def overlaps(paths, other_paths):
+    """Check whether any path equals or contains another"""
+    for path in paths:
+        for other in other_paths:
+            if path == other or path.startswith(other + '/') or other.startswith(path + '/'):
+                return True
+    return False
+
+def next_outbox_batch(pending, single=False):
+    """Take the oldest queued entries that can go in one update
+    
+    Increments of the same record combine into one transaction, but a write
+    touching a record another entry writes or increments would land out of
+    order, so it starts a new batch.
+    """
+    if single:
+        return list(pending.items())[:1]
+    batch = []
+    batch_writes = []
+    batch_increments = []
+    for entry_id, entry in pending.items():
+        writes, increments = entry_paths(entry)
+        if batch and (len(batch) >= OUTBOX_BATCH_SIZE or overlaps(writes, batch_writes + batch_increments)
+                      or overlaps(increments, batch_writes)):
+            break
+        batch.append((entry_id, entry))
+        batch_writes.extend(writes)
+        batch_increments.extend(increments)
+    return batch
+
+def landed_entries(entry_ids):
+    """Get which of the given outbox entries Firebase already applied"""
+    applied = db.reference(OUTBOX_APPLIED).order_by_key().start_at(min(entry_ids)).get() or {}
+    return set(applied) & set(entry_ids)
+
+def acknowledge(entry_ids):
+    """Drop flushed entries from the outbox; their markers go with the next update"""
+    for entry_id in entry_ids:
+        append_log(OUTBOX, {'op': 'del', 'key': entry_id})
+    with _outbox_lock:
+        _outbox_state['uncertain'].difference_update(entry_ids)
+        _outbox_state['delivered'].update(entry_ids)
+
+def flush_outbox():
+    """Send queued entries to Firebase until the outbox is empty, raising on failure"""
+    while True:
+        pending = read_store(OUTBOX)
+        if not pending:
+            return
+        with _outbox_lock:
+            single = _outbox_state['isolate']
+        batch = next_outbox_batch(pending, single)
+        entry_ids = [entry_id for entry_id, _ in batch]
+        
+        # An entry whose last attempt failed may still have landed: its marker says so
+        with _outbox_lock:
+            uncertain = [entry_id for entry_id in entry_ids if entry_id in _outbox_state['uncertain']]
+        if uncertain:
+            landed = landed_entries(uncertain)
+            if landed:
+                acknowledge(landed)
+                continue
+        
+        with _outbox_lock:
+            cleared = list(_outbox_state['delivered'])
+        
+        try:
+            # Increments carry their entry ids, which mark the records they change
+            operations = [dict(operation, entry=entry_id) if operation['op'] == 'increment' else operation
+                          for entry_id, entry in batch for operation in entry['operations']]
+            commit_operations(operations, entry_ids, cleared, min(pending))
+        except Exception as e:
+            if is_permanent_error(e):
+                if len(batch) == 1:
+                    # Set the bad entry aside so the rest of the queue can move
+                    append_log(OUTBOX_REJECTED, {'op': 'set', 'key': entry_ids[0], 'value': dict(batch[0][1], error=str(e))})
+                    append_log(OUTBOX, {'op': 'del', 'key': entry_ids[0]})
+                    with _outbox_lock:
+                        _outbox_state['isolate'] = False
+                        _outbox_state['rejected'] += 1
+                    continue
+                # Find the culprit by sending entries one at a time
+                with _outbox_lock:
+                    _outbox_state['isolate'] = True
+                continue
+            with _outbox_lock:
+                _outbox_state['uncertain'].update(entry_ids)
+            raise
+        
+        acknowledge(entry_ids)
+        with _outbox_lock:
+            _outbox_state['isolate'] = False
+            _outbox_state['delivered'].difference_update(cleared)
+            _outbox_state['flushed'] += len(entry_ids)
+            _outbox_state['last_flush_latency'] = time.time() - min(entry['enqueued_at'] for _, entry in batch)
+            _outbox_state['last_flush_at'] = time.time()
+
+def run_outbox():
+    """Flusher thread: drain the outbox whenever woken, backing off while Firebase is unreachable"""
+    state = _outbox_state
+    while True:
+        state['wake'].wait(OUTBOX_POLL_SECONDS)
+        # Hold off until the backoff expires, even if new writes arrive
+        delay = state['retry_at'] - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        state['wake'].clear()
+        
+        try:
+            flush_outbox()
+            with _outbox_lock:
+                state['failures'] = 0
+                state['last_error'] = None
+                state['retry_at'] = 0
+        except Exception as e:
+            with _outbox_lock:
+                state['failures'] += 1
+                state['last_error'] = str(e)
+                backoff = min(OUTBOX_MAX_BACKOFF, OUTBOX_BASE_BACKOFF * 2 ** (state['failures'] - 1))
+                state['retry_at'] = time.time() + random.uniform(backoff / 2, backoff)
+
+def get_outbox_writer():
+    """Get this data directory's outbox id, creating it on first use"""
+    with _outbox_lock:
+        if _outbox_state['writer'] is None:
+            writer = read_store(OUTBOX_WRITER).get('id')
+            if writer is None:
+                writer = generate_push_key()
+                append_log(OUTBOX_WRITER, {'op': 'set', 'key': 'id', 'value': writer})
+            _outbox_state['writer'] = writer
+        return _outbox_state['writer']
+
+def start_outbox():
+    """Start the flusher thread once per process"""
+    with _outbox_lock:
+        if _outbox_state['thread'] is None:
+            # Entries left by an earlier run may have landed before it stopped
+            _outbox_state['uncertain'].update(read_store(OUTBOX))
+            _outbox_state['thread'] = threading.Thread(target=run_outbox, daemon=True)
+            _outbox_state['thread'].start()
+
+def get_outbox_stats():
+    """Queue depth, age and flush latency of the outbox, for monitoring"""
+    pending = read_store(OUTBOX)
+    with _outbox_lock:
+        state = dict(_outbox_state)
+    oldest = min((entry['enqueued_at'] for entry in pending.values()), default=None)
+    return {
+        'depth': len(pending),
+        'oldest_seconds': time.time() - oldest if oldest is not None else None,
+        'last_flush_latency_seconds': state['last_flush_latency'],
+        'flushed': state['flushed'],
+        'rejected': state['rejected'],
+        'failures': state['failures'],
+        'last_error': state['last_error'],
+        'retry_in_seconds': max(0, state['retry_at'] - time.time())
+    }
+
+def commit_batch(operations):
+    """Apply pushes, updates, increments and deletes together (see local_storage.commit_batch)
+    
+    With the outbox on, the operations are queued durably and this returns at
+    once; the flusher thread delivers them.
+    """
+    try:
+        count = len(operations)
+        operations = list(operations) + rollup_operations(operations)
+        if OUTBOX_ENABLED:
+            keys = enqueue_operations(operations)[:count]
+        else:
+            keys = commit_operations(operations)[:count]
+        for collection in {operation['collection'] for operation in operations}:
+            bump_version(collection)
+        return keys
     except Exception as e:
-        st.error(f"Failed to push data: {str(e)}")
+        st.error(f"Failed to commit changes: {str(e)}")
         return None
 
-def update_data(path, data):
-    """Update data in Firebase"""
+def lookup_index(collection, field, value):
+    """Get the keys of the records whose field has value"""
+    if field == 'item_id' or get_mirror(collection) is not None:
+        # Item ids sit inside each record's items list, out of reach of a
+        # query; mirrored collections are cheaper to scan locally anyway
+        return group_index(collection, field).get(value, [])
     try:
-        ref = db.reference(path)
-        ref.update(data)
-        return True
+        return sorted((db.reference(collection).order_by_child(field).equal_to(value).get() or {}).keys())
     except Exception as e:
-        st.error(f"Failed to update data: {str(e)}")
-        return False
+        st.error(f"Failed to read data from {collection}: {str(e)}")
+        return []
 
-def delete_data(path):
-    """Delete data from Firebase"""
+def lookup_prefix(collection, field, prefix):
+    """Get the keys of the records whose field starts with prefix"""
+    if field == 'item_id' or get_mirror(collection) is not None:
+        return sorted({key for value, keys in group_index(collection, field).items()
+                       if str(value).startswith(prefix) for key in keys})
     try:
-        ref = db.reference(path)
-        ref.delete()
+        query = db.reference(collection).order_by_child(field).start_at(prefix).end_at(prefix + "\uf8ff")
+        return sorted((query.get() or {}).keys())
+    except Exception as e:
+        st.error(f"Failed to read data from {collection}: {str(e)}")
+        return []
+
+def group_index(collection, field, keys=None):
+    """Group record keys by a field"""
+    records = read_data(collection) if keys is None else read_records(collection, keys)
+    return group_records(collection, records, field)
+
+def encode_keys(value):
+    """Escape the characters Firebase refuses in keys (reasons are free text)"""
+    if not isinstance(value, dict):
+        return value
+    return {
+        ''.join(f"%{ord(char):02X}" if char in '%.$#[]/' or ord(char) < 32 or ord(char) == 127 else char
+                for char in key) or '%00': encode_keys(child)
+        for key, child in value.items()
+    }
+
+def decode_keys(value):
+    """Undo encode_keys, returning a fresh copy"""
+    if not isinstance(value, dict):
+        return value
+    return {('' if key == '%00' else unquote(key)): decode_keys(child) for key, child in value.items()}
+
+def decode_rollup(rollup):
+    """Decode a stored rollup row, leaving out its increment markers"""
+    rollup = decode_keys(rollup)
+    if isinstance(rollup, dict):
+        rollup.pop(INCREMENT_MARKERS, None)
+    return rollup
+
+def read_record(collection, key):
+    """Read one record's current value from the mirror or Firebase, raising on failure"""
+    mirror = get_mirror(collection)
+    if mirror is not None:
+        with mirror['lock']:
+            records = mirror['data'] if isinstance(mirror['data'], dict) else {}
+            return copy.deepcopy(records.get(key))
+    return db.reference(f"{collection}/{key}").get()
+
+def rollup_operations(operations):
+    """Increments that keep the per-day rollups in step with a batch (see storage_common.build_rollup)"""
+    deltas = {}
+    
+    def roll_up(collection, record, sign):
+        if isinstance(record, dict):
+            delta = deltas.setdefault((collection, get_partition_name(record)), {})
+            add_rollup(delta, build_rollup(collection, record), sign)
+    
+    for operation in operations:
+        collection = operation['collection']
+        if collection not in ROLLUP_COLLECTIONS:
+            continue
+        if operation['op'] == 'push':
+            roll_up(collection, operation['data'], 1)
+            continue
+        
+        # Edits of existing records swap their old contribution for the new one
+        previous = read_record(collection, operation['key'])
+        roll_up(collection, previous, -1)
+        if operation['op'] == 'update':
+            roll_up(collection, dict(previous or {}, **operation['data']), 1)
+        elif operation['op'] == 'increment':
+            roll_up(collection, apply_increment(previous, operation), 1)
+    
+    return [
+        {'op': 'increment', 'collection': f"{ROLLUPS}/{collection}", 'key': day, 'delta': encode_keys(delta)}
+        for (collection, day), delta in sorted(deltas.items()) if delta
+    ]
+
+def rebuild_rollups(collection):
+    """Recompute a collection's rollups from all of its records
+    
+    Increments committed by other terminals while this runs are lost, so
+    run it while the registers are quiet.
+    """
+    try:
+        rollups = encode_keys(rollup_records(collection, db.reference(collection).get() or {}))
+        db.reference(f"{ROLLUPS}/{collection}").set(rollups)
+        write_mirror(f"{ROLLUPS}/{collection}", rollups)
+        _verified_rollups.add(collection)
         return True
     except Exception as e:
-        st.error(f"Failed to delete data: {str(e)}")
+        st.error(f"Failed to rebuild rollups of {collection}: {str(e)}")
         return False
+
+def verify_rollups(collection):
+    """Build a collection's rollups once if the database has records but no rollups yet"""
+    if collection in _verified_rollups:
+        return
+    try:
+        missing = db.reference(f"{ROLLUPS}/{collection}").get(shallow=True) is None
+    except Exception:
+        # Offline: check again on a later read
+        return
+    if missing and count_data(collection):
+        rebuild_rollups(collection)
+    _verified_rollups.add(collection)
+
+def read_rollups(collection, start_date, end_date):
+    """Read a collection's daily rollups for the days within [start_date, end_date]
+    
+    Rollups are mirrored, so this is normally answered without a round trip.
+    """
+    start, end = str(start_date)[:10], str(end_date)[:10]
+    try:
+        verify_rollups(collection)
+        mirror = get_mirror(ROLLUPS)
+        if mirror is not None:
+            with mirror['lock']:
+                rollups = mirror['data'].get(collection) if isinstance(mirror['data'], dict) else None
+                rollups = {day: decode_rollup(rollup) for day, rollup in (rollups or {}).items()
+                           if start <= day <= end}
+        else:
+            query = db.reference(f"{ROLLUPS}/{collection}").order_by_key().start_at(start).end_at(end)
+            rollups = {day: decode_rollup(rollup) for day, rollup in (query.get() or {}).items()}
+        rollups.pop(UNDATED_PARTITION, None)
+        # A row emptied by later edits may still hold its markers
+        return {day: rollup for day, rollup in rollups.items() if rollup}
+    except Exception as e:
+        st.error(f"Failed to read data from {collection}: {str(e)}")
+        return {}
@@ -1,5 +1,5 @@
 import streamlit as st
-from local_storage import read_data, write_data, update_data, delete_data
+from storage import read_data, update_data
 import uuid
 from datetime import datetime
 
@@ -55,11 +55,8 @@ def add_new_item():
                     'active': True
                 }
                 
-                # Read existing inventory
-                inventory = read_data('inventory')
-                inventory[item_id] = item_data
-                
-                if write_data('inventory', inventory):
+                # Store just the new item
+                if update_data('inventory', item_id, item_data):
                     st.success(f"✅ Item '{item_name}' added successfully!")
                     st.rerun()
                 else:
@@ -136,25 +133,19 @@ def edit_items():
                     'updated_at': datetime.now().isoformat()
                 }
                 
-                # Update inventory item
-                inventory = read_data('inventory')
-                if selected_item in inventory:
-                    inventory[selected_item].update(updated_data)
-                    if write_data('inventory', inventory):
-                        st.success("✅ Item updated successfully!")
-                        st.rerun()
-                    else:
-                        st.error("❌ Failed to update item")
+                # Update just this inventory item
+                if update_data('inventory', selected_item, updated_data):
+                    st.success("✅ Item updated successfully!")
+                    st.rerun()
+                else:
+                    st.error("❌ Failed to update item")
             
             if deactivate_submitted:
-                inventory = read_data('inventory')
-                if selected_item in inventory:
-                    inventory[selected_item].update({'active': False, 'updated_at': datetime.now().isoformat()})
-                    if write_data('inventory', inventory):
-                        st.success("✅ Item deactivated successfully!")
-                        st.rerun()
-                    else:
-                        st.error("❌ Failed to deactivate item")
+                if update_data('inventory', selected_item, {'active': False, 'updated_at': datetime.now().isoformat()}):
+                    st.success("✅ Item deactivated successfully!")
+                    st.rerun()
+                else:
+                    st.error("❌ Failed to deactivate item")
 
 def view_inventory():
     """View all inventory items"""
@@ -1,12 +1,98 @@
+import bisect
+import copy
+import functools
 import json
+import marshal
 import os
+import shutil
+import tempfile
+import threading
+import time
+import zlib
 import streamlit as st
+from contextlib import ExitStack, contextmanager
 from datetime import datetime
 import uuid
+from storage_common import (
+    UNDATED_PARTITION, TIMELINE_FIELDS, INDEXED_FIELDS, ROLLUP_COLLECTIONS, get_partition_name, in_range,
+    new_timeline, timeline_set, timeline_range, extract_index_fields, build_rollup,
+    add_rollup, rollup_records
+)
+
+try:
+    import fcntl
+except ImportError:
+    # No flock on Windows: locks then only hold within this process
+    fcntl = None
 
 # Data directory
 DATA_DIR = "data"
 
+# Pushes are appended to data/<collection>.jsonl and folded back into the
+# JSON snapshot once the log outgrows both this floor and the snapshot itself
+COMPACT_MIN_BYTES = 256 * 1024
+
+# Time-series collections are stored as one partition per day under
+# data/<collection>/<YYYY-MM-DD>.json so range reads only open those days
+PARTITIONED_COLLECTIONS = ('transactions', 'turned_away')
+# Each collection's sorted partition list, reused while its directory is unchanged
+_partition_lists = {}
+# Directory mtimes are coarse, so a listing made this soon after a change is not reused
+PARTITION_LIST_RACY_SECONDS = 2
+
+# Secondary indexes of INDEXED_FIELDS, maintained on every commit and
+# stored as data/_index/<collection>.json(l): record key -> its store and
+# indexed field values
+_verified_indexes = set()
+
+# Per-day rollups of ROLLUP_COLLECTIONS, maintained on every commit and
+# stored as data/_rollups/<collection>.json(l)
+_verified_rollups = set()
+
+# Each commit adds to its own thread's shard of a day's rollup, keyed
+# "<day>~<shard>", so registers selling at once rarely wait on one rollup
+# lock; readers add a day's shards up. Rebuilt rollups use plain day keys.
+ROLLUP_SHARDS = 64
+
+# Let concurrent appends share one fsync instead of paying for one each
+GROUP_COMMIT = True
+
+# Named locks, held against other threads here and, through flock on
+# data/.locks/<name>.lock, against other processes. Stores are locked while
+# their files are rewritten; single records while their value is
+# read-modified-written, so sales of different items never wait on each other.
+# Records hash onto a fixed set of lock stripes, so the lock files stay
+# bounded however many records get written
+_named_locks = {}
+_named_locks_guard = threading.Lock()
+_held_locks = threading.local()
+LOCK_STRIPES = 1024
+
+# Group commit queues, one per collection log
+_commit_queues = {}
+
+# Multi-collection commits are made durable by one fsynced line in this
+# journal; the per-store log appends that follow skip their own fsync
+JOURNAL = "_journal"
+JOURNAL_CHECKPOINT_BYTES = 1024 * 1024
+# Tries at writing a journaled transaction through to its stores before
+# leaving it to recovery
+APPLY_ATTEMPTS = 4
+_journal_recovered = False
+_recovery_lock = threading.Lock()
+
+# Parsed collections shared by every session in this process, keyed by
+# collection and revalidated against the files with a stat() per read
+_read_cache = {}
+_cache_locks = {}
+_cache_locks_guard = threading.Lock()
+_generations = {}
+
+# Per-collection data versions that key page caches (storage.cache_by_version):
+# bumped by every write through this module
+_data_versions = {}
+_data_versions_lock = threading.Lock()
+
 def ensure_data_directory():
     """Ensure data directory exists"""
     if not os.path.exists(DATA_DIR):
@@ -17,24 +103,945 @@ def get_file_path(collection):
     ensure_data_directory()
     return os.path.join(DATA_DIR, f"{collection}.json")
 
+def get_log_path(collection):
+    """Get append-only log path for a collection"""
+    ensure_data_directory()
+    return os.path.join(DATA_DIR, f"{collection}.jsonl")
+
+def apply_log_entry(data, entry):
+    """Apply one log entry to a collection dict"""
+    op = entry.get('op')
+    if op == 'set':
+        data[entry['key']] = entry['value']
+    elif op == 'merge':
+        existing = data.get(entry['key'])
+        if isinstance(existing, dict):
+            existing.update(entry['value'])
+        else:
+            data[entry['key']] = dict(entry['value'])
+    elif op == 'del':
+        data.pop(entry['key'], None)
+
+def replay_log(collection, data, offset=0, apply=apply_log_entry):
+    """Replay the collection's log from offset on top of data, returning the new offset"""
+    log_path = get_log_path(collection)
+    if not os.path.exists(log_path):
+        return 0
+    
+    with open(log_path, 'rb') as f:
+        f.seek(offset)
+        chunk = f.read()
+    
+    # Leave a torn final line from an in-flight append for the next read
+    end = chunk.rfind(b"\n") + 1
+    for line in chunk[:end].splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            # Garbage left behind by an interrupted append
+            continue
+        apply(data, entry)
+    return offset + end
+
+@contextmanager
+def named_lock(name, exclusive=True):
+    """Hold a lock on name against other threads and other processes"""
+    with _named_locks_guard:
+        lock = _named_locks.setdefault(name, threading.RLock())
+    
+    with lock:
+        held = getattr(_held_locks, 'names', None)
+        if held is None:
+            held = _held_locks.names = set()
+        
+        # Re-entrant within a thread; flock would deadlock on a second fd
+        if fcntl is None or name in held:
+            yield
+            return
+        
+        lock_dir = os.path.join(DATA_DIR, ".locks")
+        os.makedirs(lock_dir, exist_ok=True)
+        fd = os.open(os.path.join(lock_dir, name.replace(os.sep, "~") + ".lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            held.add(name)
+            try:
+                yield
+            finally:
+                held.discard(name)
+        finally:
+            # Closing the descriptor releases the flock
+            os.close(fd)
+
+def store_lock(store, exclusive=True):
+    """Lock a store's files: exclusive to rewrite them, shared to append"""
+    return named_lock(f"store~{store}", exclusive)
+
+def record_lock_name(store, key):
+    """Name the lock stripe covering one record
+    
+    Rollup shards stripe separately from other records, as commits lock
+    them after the records they rewrite.
+    """
+    group = "shard" if store.startswith("_rollups/") else "record"
+    return f"{group}~{zlib.crc32(f'{store}~{key}'.encode('utf-8')) % LOCK_STRIPES}"
+
+def record_lock(store, key):
+    """Lock one record for a read-modify-write"""
+    return named_lock(record_lock_name(store, key))
+
+def fsync_directory(path):
+    """Flush a directory entry so a rename survives a power cut"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        # Directories cannot be opened on Windows
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def write_log_lines(collection, lines, sync=True):
+    """Append lines to the collection's log with one write and one fsync"""
+    with store_lock(collection, exclusive=False):
+        log_path = get_log_path(collection)
+        os.makedirs(os.path.dirname(log_path), exist_ok=True)
+        
+        # A single O_APPEND write keeps concurrent appenders from interleaving
+        fd = os.open(log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, b"".join(lines))
+            if sync:
+                os.fsync(fd)
+            return os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+
+def commit_log_line(collection, line):
+    """Durably append a line, batching with whatever other threads are committing"""
+    if not GROUP_COMMIT:
+        return write_log_lines(collection, [line])
+    
+    with _named_locks_guard:
+        queue = _commit_queues.setdefault(collection, {
+            'cond': threading.Condition(),
+            'pending': [],
+            'queued': 0,
+            'committed': 0,
+            'flushing': False,
+            'failures': [],
+            'log_size': 0
+        })
+    
+    cond = queue['cond']
+    with cond:
+        queue['pending'].append(line)
+        queue['queued'] += 1
+        ticket = queue['queued']
+        
+        while queue['committed'] < ticket:
+            if queue['flushing']:
+                # Another thread is writing; our line rides the next batch
+                cond.wait()
+                continue
+            
+            # Become the leader and write everything queued so far
+            queue['flushing'] = True
+            batch, queue['pending'] = queue['pending'], []
+            first, last = queue['committed'] + 1, queue['queued']
+            cond.release()
+            try:
+                log_size = write_log_lines(collection, batch)
+                error = None
+            except Exception as e:
+                log_size = None
+                error = e
+            finally:
+                cond.acquire()
+            
+            if error is not None:
+                queue['failures'] = [(first, last, error)] + queue['failures'][:7]
+            else:
+                queue['log_size'] = log_size
+            queue['committed'] = last
+            queue['flushing'] = False
+            cond.notify_all()
+        
+        for first, last, error in queue['failures']:
+            if first <= ticket <= last:
+                raise error
+        return queue['log_size']
+
+def append_log(collection, entry):
+    """Append one entry to the collection's log and compact when it grows"""
+    line = (json.dumps(entry) + "\n").encode('utf-8')
+    log_size = commit_log_line(collection, line)
+    maybe_compact(collection, log_size)
+
+def maybe_compact(collection, log_size):
+    """Compact a collection once its log outgrows its snapshot"""
+    file_path = get_file_path(collection)
+    snapshot_size = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+    if log_size > max(COMPACT_MIN_BYTES, snapshot_size):
+        with store_lock(collection):
+            # Re-check: another thread may have compacted while we waited
+            log_path = get_log_path(collection)
+            if os.path.exists(log_path) and os.path.getsize(log_path) > max(COMPACT_MIN_BYTES, snapshot_size):
+                compact_collection(collection)
+
+def apply_journal_entries(entries, sync):
+    """Append a committed transaction's entries to each store's log"""
+    lines_by_store = {}
+    for entry in entries:
+        line = {key: value for key, value in entry.items() if key not in ('store', 'before')}
+        lines_by_store.setdefault(entry['store'], []).append((json.dumps(line) + "\n").encode('utf-8'))
+    
+    log_sizes = {}
+    for store, lines in lines_by_store.items():
+        log_sizes[store] = write_log_lines(store, lines, sync=sync)
+    return log_sizes
+
+def pending_journal_transactions():
+    """Get the journaled transactions that have no done marker yet"""
+    pending = {}
+    for entry in read_journal():
+        if 'done' in entry:
+            pending.pop(entry['done'], None)
+        elif 'txn' in entry:
+            pending[entry['txn']] = entry['entries']
+    return pending
+
+def lock_records(stack, records):
+    """Lock the stripes of (store, key) records on an ExitStack in sorted order
+    
+    Commits lock the records they rewrite first and the rollup shards they
+    change after them, each group sorted by stripe; recovery takes the same
+    groups in the same order, so no two of them can wait on each other in a
+    cycle.
+    """
+    for name in sorted({record_lock_name(store, key) for store, key in records}):
+        stack.enter_context(named_lock(name))
+
+def journal_lock_groups(entries):
+    """Split a journaled transaction's entries into the records and the rollup shards its commit locked"""
+    rollup_stores = {get_rollup_store(collection) for collection in ROLLUP_COLLECTIONS}
+    index_stores = {get_index_store(collection) for collection in INDEXED_FIELDS}
+    records, shards = set(), set()
+    for entry in entries:
+        if entry['store'] in rollup_stores:
+            shards.add((entry['store'], entry['key']))
+        elif entry['store'] not in index_stores:
+            records.add((entry['store'], entry['key']))
+    return records, shards
+
+def finish_commit(txn, entries):
+    """Write a journaled transaction through to its stores and mark it done
+    
+    Runs past the commit point with the transaction's locks still held, so
+    failed writes are retried rather than reported: the sale has happened.
+    Returns (store log sizes, journal size), or None if the stores stayed
+    unwritable and the transaction is left pending for recover_journal.
+    """
+    done = (json.dumps({'done': txn}) + "\n").encode('utf-8')
+    for attempt in range(APPLY_ATTEMPTS):
+        if attempt:
+            time.sleep(0.05 * 2 ** attempt)
+        try:
+            log_sizes = apply_journal_entries(entries, sync=attempt > 0)
+            return log_sizes, write_log_lines(JOURNAL, [done], sync=attempt > 0)
+        except Exception:
+            continue
+    return None
+
+def schedule_recovery():
+    """Have the next commit in this process replay pending journal transactions first"""
+    global _journal_recovered
+    with _recovery_lock:
+        _journal_recovered = False
+
+def value_digest(value):
+    """Short digest of a record's value, for telling later whether it changed"""
+    return zlib.crc32(json.dumps(value, sort_keys=True).encode('utf-8'))
+
+def select_replay_entries(entries):
+    """Pick the entries of a crashed transaction that recovery should still apply
+    
+    Entries hold absolute values worked out from each record's value at
+    commit time, whose digest is kept in 'before'. One is replayed only onto
+    that same value: a record another commit has moved on since keeps the
+    newer value. Index entries follow their record.
+    """
+    index_stores = {get_index_store(collection): collection for collection in INDEXED_FIELDS}
+    replay = []
+    current_records = set()
+    for entry in entries:
+        if entry['store'] in index_stores:
+            continue
+        collection = entry['store'].split('/', 1)[0]
+        current = read_current_record(entry['store'], entry['key'])
+        if 'before' not in entry or value_digest(current) == entry['before']:
+            replay.append(entry)
+            current_records.add((collection, entry['key']))
+        else:
+            # Already applied before the crash, or overwritten since
+            data = {entry['key']: copy_value(current)} if current is not None else {}
+            apply_log_entry(data, entry)
+            if data.get(entry['key']) == current:
+                current_records.add((collection, entry['key']))
+    replay.extend(
+        entry for entry in entries
+        if entry['store'] in index_stores and (index_stores[entry['store']], entry['key']) in current_records
+    )
+    return replay
+
+def recover_journal():
+    """Re-apply journaled transactions that crashed before reaching their stores"""
+    global _journal_recovered
+    with _recovery_lock:
+        if _journal_recovered:
+            return
+        
+        for txn, entries in pending_journal_transactions().items():
+            # A live register in another process holds these record locks
+            # until it has written its done marker, so wait and re-check
+            with ExitStack() as stack:
+                records, shards = journal_lock_groups(entries)
+                lock_records(stack, records)
+                lock_records(stack, shards)
+                if txn not in pending_journal_transactions():
+                    continue
+                
+                apply_journal_entries(select_replay_entries(entries), sync=True)
+                write_log_lines(JOURNAL, [(json.dumps({'done': txn}) + "\n").encode('utf-8')])
+        _journal_recovered = True
+
+def read_journal():
+    """Read the journal's complete lines"""
+    journal_path = get_log_path(JOURNAL)
+    if not os.path.exists(journal_path):
+        return []
+    
+    entries = []
+    with open(journal_path, 'rb') as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                # Torn final line: that transaction never committed
+                continue
+    return entries
+
+def checkpoint_journal():
+    """Flush store logs written under the journal, then drop finished transactions"""
+    with store_lock(JOURNAL):
+        pending = {}
+        stores = set()
+        for entry in read_journal():
+            if 'done' in entry:
+                pending.pop(entry['done'], None)
+            elif 'txn' in entry:
+                pending[entry['txn']] = entry
+                stores.update(item['store'] for item in entry['entries'])
+        
+        # Any process may have written these logs without an fsync
+        for store in stores:
+            log_path = get_log_path(store)
+            if os.path.exists(log_path):
+                fd = os.open(log_path, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+        
+        write_store(JOURNAL, {})
+        if pending:
+            write_log_lines(JOURNAL, [(json.dumps(entry) + "\n").encode('utf-8') for entry in pending.values()])
+
+def compact_collection(collection):
+    """Fold the append-only log back into the JSON snapshot"""
+    with store_lock(collection):
+        write_store(collection, read_store(collection))
+
+def file_signature(path):
+    """Identify a file version by mtime, inode and size"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_ino, stat.st_size)
+
+def get_generation(collection):
+    """Get the in-process write generation of a collection"""
+    return _generations.get(collection, 0)
+
+def bump_generation(collection):
+    """Invalidate cached reads of a collection after a write"""
+    _generations[collection] = _generations.get(collection, 0) + 1
+
+def bump_data_version(collection):
+    """Invalidate cached page computations that read a collection"""
+    with _data_versions_lock:
+        _data_versions[collection] = _data_versions.get(collection, 0) + 1
+
+def get_version(collection):
+    """Get a token that changes whenever a collection does
+    
+    Writes in this process bump a counter; the stores' file signatures
+    catch writes by other processes.
+    """
+    signatures = tuple(
+        (file_signature(get_file_path(store)), file_signature(get_log_path(store)))
+        for store in list_stores(collection)
+    )
+    with _data_versions_lock:
+        return (_data_versions.get(collection, 0), signatures)
+
+def clear_read_cache():
+    """Drop every cached collection"""
+    _read_cache.clear()
+
+def get_cache_lock(collection):
+    """Get the lock guarding one collection's cache entry"""
+    with _cache_locks_guard:
+        return _cache_locks.setdefault(collection, threading.RLock())
+
+def copy_value(value):
+    """Deep-copy parsed JSON in one C-level round trip, several times faster than copy.deepcopy"""
+    return marshal.loads(marshal.dumps(value))
+
+def snapshot(data):
+    """Copy a cached collection so callers can modify records freely
+    
+    The cache is shared by every session in the process, so nested lists
+    and dicts (such as a sale's items) are copied too.
+    """
+    return copy_value(data)
+
+def load_cached(collection, apply=apply_log_entry, new_state=dict):
+    """Get the parsed collection, re-reading only what changed on disk
+    
+    The result is shared and may be updated by another thread's read, so
+    iterate it only while holding get_cache_lock(collection). apply and
+    new_state build a different view of the same files, such as an index.
+    """
+    file_path = get_file_path(collection)
+    log_path = get_log_path(collection)
+    cache_key = (collection, apply)
+    
+    with get_cache_lock(collection):
+        generation = get_generation(collection)
+        snapshot_sig = file_signature(file_path)
+        log_sig = file_signature(log_path)
+        entry = _read_cache.get(cache_key)
+        
+        if (entry and entry['generation'] == generation
+                and entry['snapshot_sig'] == snapshot_sig):
+            if log_sig is None and entry['log_ino'] is None:
+                return entry['data']
+            if (log_sig is not None and entry['log_ino'] in (None, log_sig[1])
+                    and log_sig[2] >= entry['log_offset']):
+                # The log only ever grows in place, so replay just the tail
+                entry['log_ino'] = log_sig[1]
+                if log_sig[2] > entry['log_offset']:
+                    entry['log_offset'] = replay_log(collection, entry['data'], entry['log_offset'], apply)
+                return entry['data']
+        
+        data = new_state()
+        if snapshot_sig is not None:
+            with open(file_path, 'r') as f:
+                records = json.load(f)
+            if apply is apply_log_entry:
+                data = records
+            else:
+                for key, value in records.items():
+                    apply(data, {'op': 'set', 'key': key, 'value': value})
+        log_offset = replay_log(collection, data, 0, apply)
+        
+        _read_cache[cache_key] = {
+            'generation': generation,
+            'snapshot_sig': snapshot_sig,
+            'log_ino': log_sig[1] if log_sig else None,
+            'log_offset': log_offset,
+            'data': data
+        }
+        return data
+
+def read_store(store):
+    """Get a private copy of one store's records"""
+    with get_cache_lock(store):
+        return snapshot(load_cached(store))
+
+def write_store(store, data):
+    """Atomically replace one snapshot file and drop its log"""
+    file_path = get_file_path(store)
+    directory = os.path.dirname(file_path)
+    os.makedirs(directory, exist_ok=True)
+    
+    with store_lock(store):
+        # Write a temp file and rename it over the target so a crash
+        # leaves either the old or the new snapshot, never a torn one
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(store)}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, file_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        fsync_directory(directory)
+        
+        # The snapshot now holds everything the log did
+        log_path = get_log_path(store)
+        if os.path.exists(log_path):
+            os.remove(log_path)
+        bump_generation(store)
+
+def remove_store(store):
+    """Delete one snapshot file and its log"""
+    with store_lock(store):
+        for path in (get_file_path(store), get_log_path(store)):
+            if os.path.exists(path):
+                os.remove(path)
+        bump_generation(store)
+
+def is_partitioned(collection):
+    """Check whether a collection is stored as day partitions"""
+    return collection in PARTITIONED_COLLECTIONS
+
+def get_partition_store(collection, partition):
+    """Get the store name of one day partition"""
+    return f"{collection}/{partition}"
+
+def ensure_partitioned(collection):
+    """Split a legacy single-file collection into day partitions"""
+    legacy_paths = (get_file_path(collection), get_log_path(collection))
+    if not any(os.path.exists(path) for path in legacy_paths):
+        return
+    
+    with store_lock(collection):
+        # Another thread may have finished the split while we waited
+        if not any(os.path.exists(path) for path in legacy_paths):
+            return
+        
+        partitions = {}
+        for key, record in read_store(collection).items():
+            partitions.setdefault(get_partition_name(record), {})[key] = record
+        
+        for partition, records in partitions.items():
+            store = get_partition_store(collection, partition)
+            with store_lock(store):
+                merged = read_store(store)
+                merged.update(records)
+                write_store(store, merged)
+        
+        remove_store(collection)
+
+def list_partitions(collection):
+    """List the day partitions of a collection in date order"""
+    ensure_partitioned(collection)
+    directory = os.path.join(DATA_DIR, collection)
+    signature = file_signature(directory)
+    if signature is None:
+        return ()
+    
+    cached = _partition_lists.get(collection)
+    if cached and cached[0] == signature:
+        return cached[1]
+    
+    partitions = tuple(sorted({
+        name.rsplit('.', 1)[0] for name in os.listdir(directory)
+        if name.endswith(('.json', '.jsonl')) and not name.startswith('.')
+    }))
+    # Adding or removing a day changes the directory's mtime, but only to
+    # clock-tick precision; trust it once the tick has safely passed
+    if time.time_ns() - signature[0] > PARTITION_LIST_RACY_SECONDS * 10 ** 9:
+        _partition_lists[collection] = (signature, partitions)
+    return partitions
+
+def find_partition(collection, key):
+    """Find the day partition holding a key, newest first"""
+    for partition in reversed(list_partitions(collection)):
+        if key in load_cached(get_partition_store(collection, partition)):
+            return partition
+    return None
+
+def get_store_for_key(collection, key, data=None):
+    """Get the store a keyed record lives in, or would be written to"""
+    if not is_partitioned(collection):
+        return collection
+    partition = find_partition(collection, key)
+    if partition is None:
+        partition = get_partition_name(data)
+    return get_partition_store(collection, partition)
+
+def list_stores(collection):
+    """List the stores holding a collection's records"""
+    if not is_partitioned(collection):
+        return [collection]
+    return [get_partition_store(collection, partition) for partition in list_partitions(collection)]
+
+def has_derived_stores(collection):
+    """Check whether commits to a collection also maintain an index or rollups"""
+    return collection in INDEXED_FIELDS or collection in ROLLUP_COLLECTIONS
+
+def get_index_store(collection):
+    """Get the store name of a collection's secondary index"""
+    return f"_index/{collection}"
+
+def build_index_entry(collection, store, key, record):
+    """Build the index log entry for a record written to store"""
+    return {
+        'store': get_index_store(collection),
+        'op': 'set',
+        'key': key,
+        'value': {'store': store, 'fields': extract_index_fields(collection, record)}
+    }
+
+def new_index_state():
+    """Create an empty in-memory index
+    
+    'sorted' holds, per field, (value as text, key) pairs in sorted order for
+    prefix lookups; a field's list is built on its first lookup and kept in
+    step from then on.
+    """
+    return {'records': {}, 'by_field': {}, 'sorted': {}}
+
+def apply_index_entry(index, entry):
+    """Apply one index log entry, keeping the inverted maps in step"""
+    key = entry['key']
+    previous = index['records'].pop(key, None)
+    if previous:
+        for field, values in previous['fields'].items():
+            field_map = index['by_field'].get(field, {})
+            for value in values:
+                keys = field_map.get(value)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del field_map[value]
+            pairs = index['sorted'].get(field)
+            if pairs is not None:
+                for text in {str(value) for value in values}:
+                    position = bisect.bisect_left(pairs, (text, key))
+                    if position < len(pairs) and pairs[position] == (text, key):
+                        del pairs[position]
+    
+    if entry.get('op') == 'set':
+        index['records'][key] = entry['value']
+        for field, values in entry['value']['fields'].items():
+            field_map = index['by_field'].setdefault(field, {})
+            for value in values:
+                field_map.setdefault(value, set()).add(key)
+            pairs = index['sorted'].get(field)
+            if pairs is not None:
+                for text in {str(value) for value in values}:
+                    bisect.insort(pairs, (text, key))
+
+def sorted_index_values(index, field):
+    """Get a field's (value as text, key) pairs in sorted order, building them on first use"""
+    pairs = index['sorted'].get(field)
+    if pairs is None:
+        pairs = index['sorted'][field] = sorted({
+            (str(value), key) for value, keys in index['by_field'].get(field, {}).items() for key in keys
+        })
+    return pairs
+
+def rebuild_index(collection):
+    """Rebuild a collection's secondary index from its records"""
+    index_store = get_index_store(collection)
+    with store_lock(index_store):
+        records = {}
+        for store in list_stores(collection):
+            for key, record in read_store(store).items():
+                if isinstance(record, dict):
+                    records[key] = build_index_entry(collection, store, key, record)['value']
+        write_store(index_store, records)
+    _verified_indexes.add(collection)
+
+def verify_index(collection):
+    """Rebuild a collection's index once per process if it is missing or damaged"""
+    if collection in _verified_indexes:
+        return
+    
+    # The index must cover every record, with every field indexed now
+    try:
+        index = load_cached(get_index_store(collection), apply_index_entry, new_index_state)
+        intact = len(index['records']) == count_data(collection) and all(
+            set(entry['fields']) == set(INDEXED_FIELDS[collection]) for entry in index['records'].values())
+    except (ValueError, KeyError, TypeError, AttributeError):
+        intact = False
+    if not intact:
+        rebuild_index(collection)
+    _verified_indexes.add(collection)
+
+def load_index(collection):
+    """Get a collection's index
+    
+    Call verify_index first, and hold get_cache_lock(get_index_store(collection))
+    while using the result.
+    """
+    return load_cached(get_index_store(collection), apply_index_entry, new_index_state)
+
+def lookup_index(collection, field, value):
+    """Get the keys of the records whose indexed field has value"""
+    verify_index(collection)
+    with get_cache_lock(get_index_store(collection)):
+        return sorted(load_index(collection)['by_field'].get(field, {}).get(value, ()))
+
+def lookup_prefix(collection, field, prefix):
+    """Get the keys of the records whose indexed field starts with prefix"""
+    verify_index(collection)
+    with get_cache_lock(get_index_store(collection)):
+        pairs = sorted_index_values(load_index(collection), field)
+        # Values starting with prefix sort within [prefix, prefix + U+FFFF)
+        low = bisect.bisect_left(pairs, (prefix,))
+        high = bisect.bisect_left(pairs, (prefix + "\uffff",), low)
+        return sorted({key for _, key in pairs[low:high]})
+
+def group_index(collection, field, keys=None):
+    """Group record keys by an indexed field, optionally only within keys"""
+    if keys is not None:
+        keys = set(keys)
+    
+    groups = {}
+    verify_index(collection)
+    with get_cache_lock(get_index_store(collection)):
+        for value, value_keys in load_index(collection)['by_field'].get(field, {}).items():
+            matched = value_keys if keys is None else value_keys & keys
+            if matched:
+                groups[value] = sorted(matched)
+    return groups
+
+def get_rollup_store(collection):
+    """Get the store name of a collection's daily rollups"""
+    return f"_rollups/{collection}"
+
+def get_rollup_key(day):
+    """Get the key of the calling thread's shard of a day's rollup"""
+    shard = zlib.crc32(f"{os.getpid()}:{threading.get_ident()}".encode('utf-8')) % ROLLUP_SHARDS
+    return f"{day}~{shard}"
+
+def get_rollup_day(rollup_key):
+    """Get the day a rollup shard (or a plain day key) belongs to"""
+    return rollup_key.split('~')[0]
+
+def rebuild_rollups(collection):
+    """Recompute a collection's daily rollups from its records"""
+    rollup_store = get_rollup_store(collection)
+    with store_lock(rollup_store):
+        records = {}
+        for store in list_stores(collection):
+            records.update(read_store(store))
+        write_store(rollup_store, rollup_records(collection, records))
+    _verified_rollups.add(collection)
+    return True
+
+def verify_rollups(collection):
+    """Rebuild a collection's rollups once per process if they are missing or disagree with it"""
+    if collection in _verified_rollups:
+        return
+    
+    # The day counts must add up to the records
+    rollup_store = get_rollup_store(collection)
+    try:
+        with get_cache_lock(rollup_store):
+            counted = sum(rollup.get('count', 0) for rollup in load_cached(rollup_store).values())
+        intact = counted == count_data(collection)
+    except (ValueError, KeyError, TypeError, AttributeError):
+        intact = False
+    if not intact:
+        rebuild_rollups(collection)
+    _verified_rollups.add(collection)
+
+def read_rollups(collection, start_date, end_date):
+    """Read a collection's daily rollups for the days within [start_date, end_date]"""
+    try:
+        start, end = str(start_date)[:10], str(end_date)[:10]
+        verify_rollups(collection)
+        rollup_store = get_rollup_store(collection)
+        rollups = {}
+        with get_cache_lock(rollup_store):
+            for rollup_key, rollup in load_cached(rollup_store).items():
+                day = get_rollup_day(rollup_key)
+                if day != UNDATED_PARTITION and start <= day <= end:
+                    # Adding into fresh dicts also copies the cached shards
+                    add_rollup(rollups.setdefault(day, {}), rollup)
+        return {day: rollup for day, rollup in rollups.items() if rollup}
+    except Exception as e:
+        st.error(f"Failed to read data from {collection}: {str(e)}")
+        return {}
+
+def apply_timeline_entry(field, timeline, entry):
+    """Apply one log entry to a store's timeline of field"""
+    value = entry.get('value')
+    if entry['op'] == 'set':
+        timeline_set(timeline, entry['key'], value.get(field) if isinstance(value, dict) else None)
+    elif entry['op'] == 'merge':
+        if isinstance(value, dict) and field in value:
+            timeline_set(timeline, entry['key'], value[field])
+    elif entry['op'] == 'del':
+        timeline_set(timeline, entry['key'], None)
+
+# Range reads on TIMELINE_FIELDS binary-search a sorted (value, key) timeline
+# of each store, a view built from the same files as the records. One applier
+# per field, so load_cached keeps one timeline per (store, field)
+TIMELINE_APPLIERS = {field: functools.partial(apply_timeline_entry, field) for field in TIMELINE_FIELDS}
+
+def store_range_keys(store, field, start, end):
+    """Get the keys of one store's records whose field is within [start, end], in field order"""
+    with get_cache_lock(store):
+        if field in TIMELINE_FIELDS:
+            return timeline_range(load_cached(store, TIMELINE_APPLIERS[field], new_timeline), start, end)
+        matches = [(record[field], key) for key, record in load_cached(store).items()
+                   if isinstance(record, dict) and in_range(record.get(field), start, end)]
+        return [key for _, key in sorted(matches)]
+
+def read_store_range(store, field, start, end):
+    """Copy out one store's records whose field is within [start, end]"""
+    if field not in TIMELINE_FIELDS:
+        return {key: record for key, record in read_store(store).items()
+                if isinstance(record, dict) and in_range(record.get(field), start, end)}
+    
+    with get_cache_lock(store):
+        records = load_cached(store)
+        return copy_value({key: records[key] for key in store_range_keys(store, field, start, end)
+                           if isinstance(records.get(key), dict)})
+
+def list_range_stores(collection, start, end):
+    """List the stores that can hold records within [start, end], in date order"""
+    if not is_partitioned(collection):
+        return [collection]
+    
+    # Binary search for the partitions inside the range; "undated" sorts after every date
+    partitions = list_partitions(collection)
+    low = bisect.bisect_left(partitions, start[:10])
+    high = bisect.bisect_right(partitions, end[:10], low)
+    return [get_partition_store(collection, partition) for partition in partitions[low:high]
+            if partition != UNDATED_PARTITION]
+
+def read_records(collection, keys):
+    """Read just the given records, opening only the stores that hold them"""
+    try:
+        keys_by_store = {}
+        if collection in INDEXED_FIELDS:
+            verify_index(collection)
+            with get_cache_lock(get_index_store(collection)):
+                located = load_index(collection)['records']
+                for key in keys:
+                    if key in located:
+                        keys_by_store.setdefault(located[key]['store'], []).append(key)
+        else:
+            for key in keys:
+                keys_by_store.setdefault(get_store_for_key(collection, key), []).append(key)
+        
+        data = {}
+        for store, store_keys in keys_by_store.items():
+            with get_cache_lock(store):
+                records = load_cached(store)
+                data.update(copy_value({key: records[key] for key in store_keys if key in records}))
+        return data
+    except Exception as e:
+        st.error(f"Failed to read data from {collection}: {str(e)}")
+        return {}
+
 def read_data(collection):
     """Read data from local JSON file"""
     try:
-        file_path = get_file_path(collection)
-        if os.path.exists(file_path):
-            with open(file_path, 'r') as f:
-                return json.load(f)
+        if not is_partitioned(collection):
+            return read_store(collection)
+        
+        data = {}
+        for partition in list_partitions(collection):
+            data.update(read_store(get_partition_store(collection, partition)))
+        return data
+    except Exception as e:
+        st.error(f"Failed to read data from {collection}: {str(e)}")
         return {}
+
+def read_range(collection, start_date, end_date, field='date'):
+    """Read the records whose date (or timestamp) is within [start_date, end_date]
+    
+    The partitions in range and the records within them are both found by
+    binary search, so the cost follows the size of the range, not the history.
+    """
+    try:
+        start, end = str(start_date), str(end_date)
+        if not is_partitioned(collection):
+            return read_store_range(collection, field, start, end)
+        
+        # Only the partitions inside the range are opened
+        whole_days = field == 'date' and len(start) == 10 and len(end) == 10
+        data = {}
+        for store in list_range_stores(collection, start, end):
+            data.update(read_store(store) if whole_days else read_store_range(store, field, start, end))
+        return data
     except Exception as e:
         st.error(f"Failed to read data from {collection}: {str(e)}")
         return {}
 
+def range_keys(collection, start_date, end_date, field='date'):
+    """Get the keys of the records whose field is within [start_date, end_date], in field order
+    
+    Keys come from the same timelines as read_range, so no record is copied.
+    """
+    try:
+        start, end = str(start_date), str(end_date)
+        keys = []
+        for store in list_range_stores(collection, start, end):
+            keys.extend(store_range_keys(store, field, start, end))
+        return keys
+    except Exception as e:
+        st.error(f"Failed to read data from {collection}: {str(e)}")
+        return []
+
+def count_data(collection):
+    """Count the records in a collection without copying them"""
+    try:
+        if not is_partitioned(collection):
+            return len(load_cached(collection))
+        return sum(len(load_cached(get_partition_store(collection, partition)))
+                   for partition in list_partitions(collection))
+    except Exception as e:
+        st.error(f"Failed to read data from {collection}: {str(e)}")
+        return 0
+
 def write_data(collection, data):
     """Write data to local JSON file"""
     try:
-        file_path = get_file_path(collection)
-        with open(file_path, 'w') as f:
-            json.dump(data, f, indent=2)
+        if not is_partitioned(collection):
+            write_store(collection, data)
+            if collection in INDEXED_FIELDS:
+                rebuild_index(collection)
+            if collection in ROLLUP_COLLECTIONS:
+                rebuild_rollups(collection)
+            bump_data_version(collection)
+            return True
+        
+        with store_lock(collection):
+            partitions = {}
+            for key, record in data.items():
+                partitions.setdefault(get_partition_name(record), {})[key] = record
+            
+            for partition in list_partitions(collection):
+                if partition not in partitions:
+                    remove_store(get_partition_store(collection, partition))
+            for partition, records in partitions.items():
+                write_store(get_partition_store(collection, partition), records)
+        
+        if collection in INDEXED_FIELDS:
+            rebuild_index(collection)
+        if collection in ROLLUP_COLLECTIONS:
+            rebuild_rollups(collection)
+        bump_data_version(collection)
         return True
     except Exception as e:
         st.error(f"Failed to write data to {collection}: {str(e)}")
@@ -42,39 +1049,40 @@ def write_data(collection, data):
 
 def push_data(collection, data):
     """Add new data with unique key to collection"""
+    if has_derived_stores(collection):
+        # Record, index and rollup entries go in together through the journal
+        keys = commit_batch([{'op': 'push', 'collection': collection, 'data': data}])
+        return keys[0] if keys else None
+    
     try:
         # Generate unique key
         unique_key = str(uuid.uuid4())
         
-        # Read existing data
-        existing_data = read_data(collection)
+        store = collection
+        if is_partitioned(collection):
+            store = get_partition_store(collection, get_partition_name(data))
         
-        # Add new data with unique key
-        existing_data[unique_key] = data
-        
-        # Write back to file
-        if write_data(collection, existing_data):
-            return unique_key
-        return None
+        # Append to the log instead of rewriting the whole collection
+        append_log(store, {'op': 'set', 'key': unique_key, 'value': data})
+        bump_data_version(collection)
+        return unique_key
     except Exception as e:
         st.error(f"Failed to push data to {collection}: {str(e)}")
         return None
 
 def update_data(collection, key, data):
     """Update specific item in collection"""
+    if has_derived_stores(collection):
+        return commit_batch([{'op': 'update', 'collection': collection, 'key': key, 'data': data}]) is not None
+    
     try:
-        # Read existing data
-        existing_data = read_data(collection)
-        
-        if key in existing_data:
-            # Update the existing item
-            existing_data[key].update(data)
-        else:
-            # Create new item if it doesn't exist
-            existing_data[key] = data
-        
-        # Write back to file
-        return write_data(collection, existing_data)
+        store = get_store_for_key(collection, key, data)
+        with record_lock(store, key):
+            # Append just the changed fields; replay merges them into the
+            # existing item or creates it if it doesn't exist
+            append_log(store, {'op': 'merge', 'key': key, 'value': data})
+        bump_data_version(collection)
+        return True
     except Exception as e:
         st.error(f"Failed to update data in {collection}: {str(e)}")
         return False
@@ -84,26 +1092,212 @@ def delete_data(collection, key=None):
     try:
         if key is None:
             # Delete entire collection
-            file_path = get_file_path(collection)
-            if os.path.exists(file_path):
-                os.remove(file_path)
+            with store_lock(collection):
+                if is_partitioned(collection):
+                    for partition in list_partitions(collection):
+                        remove_store(get_partition_store(collection, partition))
+                    shutil.rmtree(os.path.join(DATA_DIR, collection), ignore_errors=True)
+                remove_store(collection)
+                if collection in INDEXED_FIELDS:
+                    remove_store(get_index_store(collection))
+                if collection in ROLLUP_COLLECTIONS:
+                    remove_store(get_rollup_store(collection))
+            bump_data_version(collection)
             return True
+        elif has_derived_stores(collection):
+            return commit_batch([{'op': 'delete', 'collection': collection, 'key': key}]) is not None
         else:
             # Delete specific item
-            existing_data = read_data(collection)
-            if key in existing_data:
-                del existing_data[key]
-                return write_data(collection, existing_data)
+            store = get_store_for_key(collection, key)
+            with record_lock(store, key):
+                if key in load_cached(store):
+                    append_log(store, {'op': 'del', 'key': key})
+            bump_data_version(collection)
             return True
     except Exception as e:
         st.error(f"Failed to delete data from {collection}: {str(e)}")
         return False
 
+def read_current_record(store, key):
+    """Read one record's latest committed value"""
+    with store_lock(store, exclusive=False), get_cache_lock(store):
+        # Re-stats the files, picking up other processes' appends
+        return copy_value(load_cached(store).get(key))
+
+def resolve_batch(operations):
+    """Turn batch operations into store entries, reading current records under lock
+    
+    Also returns the rollup deltas of the batch by (collection, rollup key),
+    for resolve_rollups once those rollup shards are locked.
+    """
+    entries = []
+    keys = []
+    rollups = {}
+    
+    def roll_up(collection, record, sign):
+        if collection in ROLLUP_COLLECTIONS and isinstance(record, dict):
+            delta = rollups.setdefault((collection, get_rollup_key(get_partition_name(record))), {})
+            add_rollup(delta, build_rollup(collection, record), sign)
+    
+    for operation in operations:
+        collection = operation['collection']
+        indexed = collection in INDEXED_FIELDS
+        
+        if operation['op'] == 'push':
+            key = operation.get('key') or str(uuid.uuid4())
+            store = collection
+            if is_partitioned(collection):
+                store = get_partition_store(collection, get_partition_name(operation['data']))
+            entries.append({'store': store, 'op': 'set', 'key': key, 'value': operation['data'], 'before': value_digest(None)})
+            if indexed:
+                entries.append(build_index_entry(collection, store, key, operation['data']))
+            roll_up(collection, operation['data'], 1)
+            keys.append(key)
+        
+        elif operation['op'] == 'update':
+            key = operation['key']
+            store = get_store_for_key(collection, key, operation['data'])
+            previous = read_current_record(store, key)
+            if not (has_derived_stores(collection) or is_partitioned(collection)):
+                entries.append({'store': store, 'op': 'merge', 'key': key, 'value': operation['data'],
+                                'before': value_digest(previous)})
+            else:
+                record = dict(previous) if isinstance(previous, dict) else {}
+                record.update(operation['data'])
+                target = get_partition_store(collection, get_partition_name(record)) if is_partitioned(collection) else store
+                if target == store:
+                    entries.append({'store': store, 'op': 'merge', 'key': key, 'value': operation['data'],
+                                    'before': value_digest(previous)})
+                else:
+                    # A changed date moves the record into that day's partition
+                    entries.append({'store': store, 'op': 'del', 'key': key, 'before': value_digest(previous)})
+                    entries.append({'store': target, 'op': 'set', 'key': key, 'value': record,
+                                    'before': value_digest(read_current_record(target, key))})
+                    store = target
+                if indexed:
+                    entries.append(build_index_entry(collection, store, key, record))
+                roll_up(collection, previous, -1)
+                roll_up(collection, record, 1)
+            keys.append(key)
+        
+        elif operation['op'] == 'increment':
+            # Record the resulting value, not the delta, so replay is idempotent
+            key = operation['key']
+            store = get_store_for_key(collection, key)
+            record = read_current_record(store, key)
+            if isinstance(record, dict):
+                field = operation['field']
+                new_value = record.get(field, 0) + operation['amount']
+                if operation.get('minimum') is not None:
+                    new_value = max(operation['minimum'], new_value)
+                value = dict(operation.get('data', {}))
+                value[field] = new_value
+                entries.append({'store': store, 'op': 'merge', 'key': key, 'value': value, 'before': value_digest(record)})
+                roll_up(collection, record, -1)
+                if indexed:
+                    record.update(value)
+                    entries.append(build_index_entry(collection, store, key, record))
+                roll_up(collection, dict(record, **value), 1)
+            keys.append(key)
+        
+        elif operation['op'] == 'delete':
+            key = operation['key']
+            store = get_store_for_key(collection, key)
+            previous = read_current_record(store, key)
+            entries.append({'store': store, 'op': 'del', 'key': key, 'before': value_digest(previous)})
+            if indexed:
+                entries.append({'store': get_index_store(collection), 'op': 'del', 'key': key})
+            roll_up(collection, previous, -1)
+            keys.append(key)
+        
+        else:
+            raise ValueError(f"Unknown batch operation: {operation['op']}")
+    return entries, keys, rollups
+
+def resolve_rollups(rollups):
+    """Turn rollup deltas into entries holding each shard's new totals; lock the shards first"""
+    entries = []
+    for (collection, rollup_key), delta in sorted(rollups.items()):
+        if not delta:
+            continue
+        rollup_store = get_rollup_store(collection)
+        current = read_current_record(rollup_store, rollup_key)
+        rollup = add_rollup(copy.deepcopy(current) if isinstance(current, dict) else {}, delta)
+        if rollup:
+            entries.append({'store': rollup_store, 'op': 'set', 'key': rollup_key, 'value': rollup,
+                            'before': value_digest(current)})
+        else:
+            entries.append({'store': rollup_store, 'op': 'del', 'key': rollup_key, 'before': value_digest(current)})
+    return entries
+
+def commit_batch(operations):
+    """Apply pushes, updates, increments and deletes across collections as one atomic commit
+    
+    Each operation is a dict with 'op' ('push', 'update', 'increment' or
+    'delete') and 'collection', plus 'data' for push/update, 'key' for
+    update/increment/delete and 'field', 'amount' and optional
+    'minimum'/'data' for increment. Returns the keys written.
+    """
+    try:
+        recover_journal()
+        
+        # Lock just the existing records the batch rewrites, in a fixed order;
+        # pushes create fresh keys and need no lock
+        records = {
+            (get_store_for_key(operation['collection'], operation['key'], operation.get('data')), operation['key'])
+            for operation in operations if operation['op'] != 'push'
+        }
+        # An update that changes a date also writes the key into that day's partition
+        records.update(
+            (get_partition_store(operation['collection'], get_partition_name(operation['data'])), operation['key'])
+            for operation in operations
+            if operation['op'] == 'update' and is_partitioned(operation['collection']) and 'date' in operation['data']
+        )
+        
+        with ExitStack() as stack:
+            lock_records(stack, records)
+            entries, keys, rollups = resolve_batch(operations)
+            
+            # Then the rollup shards that change, always after the records so
+            # the lock order stays fixed
+            lock_records(stack, {(get_rollup_store(collection), rollup_key) for collection, rollup_key in rollups})
+            entries.extend(resolve_rollups(rollups))
+            txn = str(uuid.uuid4())
+            
+            # The commit point: one fsynced journal line, shared with other committers
+            line = (json.dumps({'txn': txn, 'entries': entries}) + "\n").encode('utf-8')
+            commit_log_line(JOURNAL, line)
+            
+            # Committed: from here on failures must not be reported as a
+            # failed sale, or a retry would record it twice
+            applied = finish_commit(txn, entries)
+    except Exception as e:
+        st.error(f"Failed to commit changes: {str(e)}")
+        return None
+    
+    for collection in {operation['collection'] for operation in operations}:
+        bump_data_version(collection)
+    if applied is None:
+        schedule_recovery()
+        st.warning("Changes were saved to the journal but not yet to the data files; they will be written on the next save")
+        return keys
+    
+    try:
+        log_sizes, journal_size = applied
+        for store, log_size in log_sizes.items():
+            maybe_compact(store, log_size)
+        if journal_size > JOURNAL_CHECKPOINT_BYTES:
+            checkpoint_journal()
+    except Exception as e:
+        st.warning(f"Changes were saved, but compacting the data files failed: {str(e)}")
+    return keys
+
 def get_database_ref(path):
     """Compatibility function - not needed for local storage"""
     return None
 
-def initialize_local_storage():
+def initialize_storage():
     """Initialize local storage system"""
     ensure_data_directory()
-    return True
\ No newline at end of file
+    recover_journal()
+    return True
@@ -0,0 +1,205 @@
+import copy
+import threading
+import uuid
+import streamlit as st
+from storage_common import (
+    TIMELINE_FIELDS, UNDATED_PARTITION, group_records, in_range, rollup_records,
+    new_timeline, timeline_set, timeline_range
+)
+
+# Process-local store: {collection: {key: record}}. Nothing is persisted, so
+# this backend is for demos, tests and benchmarking the layers above storage.
+_collections = {}
+_versions = {}
+# Sorted timelines for range reads: {collection: {field: timeline}}, built on
+# the first range read of a field and then kept up to date by every write
+_timelines = {}
+_lock = threading.RLock()
+
+def get_collection(collection):
+    """Get the live dict of a collection, creating it if needed"""
+    return _collections.setdefault(collection, {})
+
+def bump_version(collection):
+    """Count a write to a collection; call with _lock held"""
+    _versions[collection] = _versions.get(collection, 0) + 1
+
+def get_timeline(collection, field):
+    """Get a collection's timeline of field, building it on first use; call with _lock held"""
+    timelines = _timelines.setdefault(collection, {})
+    if field not in timelines:
+        timeline = new_timeline()
+        for key, record in get_collection(collection).items():
+            timeline_set(timeline, key, record.get(field) if isinstance(record, dict) else None)
+        timelines[field] = timeline
+    return timelines[field]
+
+def update_timelines(collection, key, record):
+    """Move one record in every timeline of its collection; call with _lock held"""
+    for field, timeline in _timelines.get(collection, {}).items():
+        timeline_set(timeline, key, record.get(field) if isinstance(record, dict) else None)
+
+def find_range_keys(collection, field, start, end):
+    """Get the keys of the records whose field is within [start, end] in field order; call with _lock held"""
+    if field in TIMELINE_FIELDS:
+        return timeline_range(get_timeline(collection, field), start, end)
+    matches = [(record[field], key) for key, record in get_collection(collection).items()
+               if isinstance(record, dict) and in_range(record.get(field), start, end)]
+    return [key for _, key in sorted(matches)]
+
+def get_version(collection):
+    """Get a token that changes whenever a collection does"""
+    with _lock:
+        return _versions.get(collection, 0)
+
+def read_data(collection):
+    """Read a copy of every record in a collection"""
+    with _lock:
+        return copy.deepcopy(get_collection(collection))
+
+def read_records(collection, keys):
+    """Read just the given records"""
+    with _lock:
+        records = get_collection(collection)
+        return {key: copy.deepcopy(records[key]) for key in keys if key in records}
+
+def read_range(collection, start_date, end_date, field='date'):
+    """Read the records whose date (or timestamp) is within [start_date, end_date]"""
+    start, end = str(start_date), str(end_date)
+    with _lock:
+        records = get_collection(collection)
+        return {key: copy.deepcopy(records[key]) for key in find_range_keys(collection, field, start, end)}
+
+def range_keys(collection, start_date, end_date, field='date'):
+    """Get the keys of the records whose field is within [start_date, end_date], in field order"""
+    with _lock:
+        return find_range_keys(collection, field, str(start_date), str(end_date))
+
+def count_data(collection):
+    """Count the records in a collection"""
+    with _lock:
+        return len(get_collection(collection))
+
+def write_data(collection, data):
+    """Replace a whole collection"""
+    with _lock:
+        _collections[collection] = copy.deepcopy(data)
+        _timelines.pop(collection, None)
+        bump_version(collection)
+    return True
+
+def push_data(collection, data):
+    """Add new data with unique key to collection"""
+    keys = commit_batch([{'op': 'push', 'collection': collection, 'data': data}])
+    return keys[0] if keys else None
+
+def update_data(collection, key, data):
+    """Update specific item in collection"""
+    return commit_batch([{'op': 'update', 'collection': collection, 'key': key, 'data': data}]) is not None
+
+def delete_data(collection, key=None):
+    """Delete data from collection"""
+    with _lock:
+        if key is None:
+            _collections.pop(collection, None)
+            _timelines.pop(collection, None)
+        else:
+            get_collection(collection).pop(key, None)
+            update_timelines(collection, key, None)
+        bump_version(collection)
+    return True
+
+def commit_batch(operations):
+    """Apply pushes, updates, increments and deletes as one commit (see local_storage.commit_batch)"""
+    try:
+        with _lock:
+            # Stage just the records the batch changes, so a bad operation
+            # leaves nothing applied; a staged None is a deletion
+            staged = {}
+            keys = []
+            
+            def current(collection, key):
+                if (collection, key) in staged:
+                    return staged[(collection, key)]
+                return get_collection(collection).get(key)
+            
+            for operation in operations:
+                collection = operation['collection']
+                
+                if operation['op'] == 'push':
+                    key = operation.get('key') or str(uuid.uuid4())
+                    staged[(collection, key)] = copy.deepcopy(operation['data'])
+                
+                elif operation['op'] == 'update':
+                    key = operation['key']
+                    record = dict(current(collection, key) or {})
+                    record.update(copy.deepcopy(operation['data']))
+                    staged[(collection, key)] = record
+                
+                elif operation['op'] == 'increment':
+                    key = operation['key']
+                    if isinstance(current(collection, key), dict):
+                        record = dict(current(collection, key))
+                        field = operation['field']
+                        new_value = record.get(field, 0) + operation['amount']
+                        if operation.get('minimum') is not None:
+                            new_value = max(operation['minimum'], new_value)
+                        record.update(copy.deepcopy(operation.get('data', {})))
+                        record[field] = new_value
+                        staged[(collection, key)] = record
+                
+                elif operation['op'] == 'delete':
+                    key = operation['key']
+                    staged[(collection, key)] = None
+                
+                else:
+                    raise ValueError(f"Unknown batch operation: {operation['op']}")
+                keys.append(key)
+            
+            for (collection, key), record in staged.items():
+                if record is None:
+                    get_collection(collection).pop(key, None)
+                else:
+                    get_collection(collection)[key] = record
+                update_timelines(collection, key, record)
+            for collection in {operation['collection'] for operation in operations}:
+                bump_version(collection)
+            return keys
+    except Exception as e:
+        st.error(f"Failed to commit changes: {str(e)}")
+        return None
+
+def lookup_index(collection, field, value):
+    """Get the keys of the records whose indexed field has value"""
+    return group_index(collection, field).get(value, [])
+
+def lookup_prefix(collection, field, prefix):
+    """Get the keys of the records whose indexed field starts with prefix"""
+    return sorted({key for value, keys in group_index(collection, field).items()
+                   if str(value).startswith(prefix) for key in keys})
+
+def group_index(collection, field, keys=None):
+    """Group record keys by an indexed field by scanning the records"""
+    with _lock:
+        records = get_collection(collection)
+        if keys is not None:
+            records = {key: records[key] for key in keys if key in records}
+        return group_records(collection, records, field)
+
+def read_rollups(collection, start_date, end_date):
+    """Roll up the records of the days within [start_date, end_date] by scanning them"""
+    start, end = str(start_date)[:10], str(end_date)[:10]
+    with _lock:
+        records = get_collection(collection)
+        records = {key: records[key] for key in find_range_keys(collection, 'date', start, end)}
+    rollups = rollup_records(collection, records)
+    rollups.pop(UNDATED_PARTITION, None)
+    return rollups
+
+def rebuild_rollups(collection):
+    """Nothing to rebuild: rollups are computed on read"""
+    return True
+
+def initialize_storage():
+    """Initialize in-memory storage"""
+    return True
@@ -1,5 +1,6 @@
 import streamlit as st
-from local_storage import read_data, push_data, update_data
+from storage import read_data, commit_batch
+from utils import item_details
 from datetime import datetime
 import uuid
 
@@ -124,12 +125,13 @@ def add_item_to_cart(item_id, item_data, quantity):
             st.rerun()
             return
     
-    # Add new item to cart
+    # Add new item to cart, copying the fields reports need from the inventory
     cart_item = {
         'id': item_id,
         'name': item_data['name'],
         'price': item_data['price'],
-        'quantity': quantity
+        'quantity': quantity,
+        **item_details(item_data)
     }
     
     st.session_state.cart.append(cart_item)
@@ -151,7 +153,7 @@ def checkout_section():
                 "Payment Method*",
                 ["Cash", "Zelle"]
             )
-            
+        
         with col2:
             customer_notes = st.text_input("Customer Notes (Optional)")
         
@@ -182,11 +184,11 @@ def complete_transaction(payment_method, customer_notes, total):
         'type': 'sale'
     }
     
-    # Save transaction
-    if push_data('transactions', transaction_data):
-        # Update inventory stock
-        update_inventory_stock()
-        
+    # Save the sale and every stock decrement as one atomic commit
+    operations = [{'op': 'push', 'collection': 'transactions', 'data': transaction_data}]
+    operations += stock_decrement_operations()
+    
+    if commit_batch(operations):
         st.success(f"✅ Transaction completed successfully!")
         st.success(f"Transaction ID: {transaction_id}")
         st.success(f"Total: ${total:.2f}")
@@ -201,26 +203,18 @@ def complete_transaction(payment_method, customer_notes, total):
     else:
         st.error("❌ Failed to complete transaction. Please try again.")
 
-def update_inventory_stock():
-    """Update inventory stock after sale"""
-    from local_storage import write_data
-    inventory = read_data('inventory')
-    
-    if not inventory:
-        return
-    
-    for cart_item in st.session_state.cart:
-        item_id = cart_item['id']
-        quantity_sold = cart_item['quantity']
-        
-        if item_id in inventory:
-            current_stock = inventory[item_id].get('stock', 0)
-            new_stock = max(0, current_stock - quantity_sold)
-            
-            inventory[item_id].update({
-                'stock': new_stock,
-                'updated_at': datetime.now().isoformat()
-            })
-    
-    # Write updated inventory back to storage
-    write_data('inventory', inventory)
+def stock_decrement_operations():
+    """Build the stock decrements for the items in the cart"""
+    updated_at = datetime.now().isoformat()
+    return [
+        {
+            'op': 'increment',
+            'collection': 'inventory',
+            'key': cart_item['id'],
+            'field': 'stock',
+            'amount': -cart_item['quantity'],
+            'minimum': 0,
+            'data': {'updated_at': updated_at}
+        }
+        for cart_item in st.session_state.cart
+    ]
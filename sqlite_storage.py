@@ -0,0 +1,522 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import streamlit as st
+import uuid
+from contextlib import contextmanager
+from local_storage import (
+    DATA_DIR, PARTITIONED_COLLECTIONS, ensure_data_directory, read_store, list_partitions,
+    get_partition_store
+)
+from storage_common import ROLLUP_COLLECTIONS, get_partition_name, build_rollup, add_rollup, rollup_records
+
+# Database file, overridable for deployments that keep data elsewhere
+DB_PATH = os.getenv("POS_SQLITE_PATH", os.path.join(DATA_DIR, "pos.sqlite3"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    collection TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    date TEXT,
+    timestamp TEXT,
+    PRIMARY KEY (collection, key)
+);
+CREATE INDEX IF NOT EXISTS idx_records_date ON records (collection, date);
+CREATE INDEX IF NOT EXISTS idx_records_timestamp ON records (collection, timestamp);
+CREATE INDEX IF NOT EXISTS idx_records_payment_method
+    ON records (collection, json_extract(value, '$.payment_method'));
+CREATE INDEX IF NOT EXISTS idx_records_id
+    ON records (collection, json_extract(value, '$.id'));
+CREATE INDEX IF NOT EXISTS idx_records_confirmation_number
+    ON records (collection, json_extract(value, '$.confirmation_number'));
+
+CREATE TABLE IF NOT EXISTS record_items (
+    collection TEXT NOT NULL,
+    key TEXT NOT NULL,
+    item_id TEXT NOT NULL,
+    quantity INTEGER,
+    price REAL
+);
+CREATE INDEX IF NOT EXISTS idx_record_items_item ON record_items (item_id);
+CREATE INDEX IF NOT EXISTS idx_record_items_key ON record_items (collection, key);
+
+CREATE TABLE IF NOT EXISTS rollups (
+    collection TEXT NOT NULL,
+    day TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (collection, day)
+);
+
+CREATE TABLE IF NOT EXISTS versions (
+    collection TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+"""
+
+# Idle connections shared by every thread. Streamlit runs each rerun on a
+# new thread, so each call borrows one here rather than opening its own
+_pool = queue.LifoQueue()
+_schema_lock = threading.Lock()
+_schema_ready = False
+_verified_rollups = set()
+
+def open_connection():
+    """Open a connection, creating the schema on the first one"""
+    global _schema_ready
+    ensure_data_directory()
+    conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # NORMAL would let a power cut roll back the last committed sales in WAL mode
+    conn.execute("PRAGMA synchronous=FULL")
+    with _schema_lock:
+        if not _schema_ready:
+            conn.executescript(SCHEMA)
+            _schema_ready = True
+    return conn
+
+@contextmanager
+def connection():
+    """Borrow a pooled connection for one read or transaction"""
+    try:
+        conn = _pool.get_nowait()
+    except queue.Empty:
+        conn = open_connection()
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        _pool.put(conn)
+
+def index_columns(value):
+    """Extract the indexed date and timestamp columns from a record"""
+    if not isinstance(value, dict):
+        return None, None
+    return value.get('date'), value.get('timestamp')
+
+def adjust_rollup(conn, collection, record, sign):
+    """Add a record to (or with sign=-1 take it off) its day's rollup row"""
+    if collection not in ROLLUP_COLLECTIONS or not isinstance(record, dict):
+        return
+    day = get_partition_name(record)
+    row = conn.execute("SELECT value FROM rollups WHERE collection = ? AND day = ?", (collection, day)).fetchone()
+    rollup = add_rollup(json.loads(row[0]) if row else {}, build_rollup(collection, record), sign)
+    if rollup:
+        conn.execute("INSERT OR REPLACE INTO rollups (collection, day, value) VALUES (?, ?, ?)",
+                     (collection, day, json.dumps(rollup)))
+    else:
+        conn.execute("DELETE FROM rollups WHERE collection = ? AND day = ?", (collection, day))
+
+def read_previous(conn, collection, key):
+    """Read the stored value a write is about to replace, when rollups need it"""
+    if collection not in ROLLUP_COLLECTIONS:
+        return None
+    row = conn.execute("SELECT value FROM records WHERE collection = ? AND key = ?", (collection, key)).fetchone()
+    return json.loads(row[0]) if row else None
+
+def put_record(conn, collection, key, value):
+    """Insert or replace one record, its item index rows and its rollup"""
+    adjust_rollup(conn, collection, read_previous(conn, collection, key), -1)
+    adjust_rollup(conn, collection, value, 1)
+    date, timestamp = index_columns(value)
+    conn.execute(
+        "INSERT OR REPLACE INTO records (collection, key, value, date, timestamp) VALUES (?, ?, ?, ?, ?)",
+        (collection, key, json.dumps(value), date, timestamp)
+    )
+    conn.execute("DELETE FROM record_items WHERE collection = ? AND key = ?", (collection, key))
+    
+    items = value.get('items') if isinstance(value, dict) else None
+    if isinstance(items, list):
+        conn.executemany(
+            "INSERT INTO record_items (collection, key, item_id, quantity, price) VALUES (?, ?, ?, ?, ?)",
+            [(collection, key, item.get('id'), item.get('quantity'), item.get('price'))
+             for item in items if isinstance(item, dict) and item.get('id')]
+        )
+
+def remove_record(conn, collection, key):
+    """Delete one record, its item index rows and its share of the rollup"""
+    adjust_rollup(conn, collection, read_previous(conn, collection, key), -1)
+    conn.execute("DELETE FROM records WHERE collection = ? AND key = ?", (collection, key))
+    conn.execute("DELETE FROM record_items WHERE collection = ? AND key = ?", (collection, key))
+
+def bump_version(conn, collection):
+    """Count a write to a collection, inside the writing transaction"""
+    conn.execute(
+        "INSERT INTO versions (collection, version) VALUES (?, 1) "
+        "ON CONFLICT (collection) DO UPDATE SET version = version + 1",
+        (collection,)
+    )
+
+def get_version(collection):
+    """Get a token that changes whenever a collection does, whichever process wrote it"""
+    with connection() as conn:
+        row = conn.execute("SELECT version FROM versions WHERE collection = ?", (collection,)).fetchone()
+    return row[0] if row else 0
+
+def range_bounds(start_date, end_date):
+    """Get SQL bounds for [start_date, end_date] that match on the bounds' own length, as in_range does
+    
+    The end bound extended by U+10FFFF sorts after every value that starts
+    with it, so a date end bound covers that whole day and the column's
+    index still serves both bounds.
+    """
+    return str(start_date), str(end_date) + "\U0010ffff"
+
+def read_data(collection):
+    """Read a collection from SQLite"""
+    try:
+        with connection() as conn:
+            rows = conn.execute("SELECT key, value FROM records WHERE collection = ?", (collection,))
+            return {key: json.loads(value) for key, value in rows}
+    except Exception as e:
+        st.error(f"Failed to read data from {collection}: {str(e)}")
+        return {}
+
+def read_range(collection, start_date, end_date, field='date'):
+    """Read the records whose date (or timestamp) is within [start_date, end_date] using its index"""
+    if field not in ('date', 'timestamp'):
+        raise ValueError(f"Cannot range over {field}")
+    try:
+        with connection() as conn:
+            rows = conn.execute(
+                f"SELECT key, value FROM records WHERE collection = ? AND {field} >= ? AND {field} <= ?",
+                (collection,) + range_bounds(start_date, end_date)
+            )
+            return {key: json.loads(value) for key, value in rows}
+    except Exception as e:
+        st.error(f"Failed to read data from {collection}: {str(e)}")
+        return {}
+
+def range_keys(collection, start_date, end_date, field='date'):
+    """Get the keys of the records whose field is within [start_date, end_date], in field order"""
+    if field not in ('date', 'timestamp'):
+        raise ValueError(f"Cannot range over {field}")
+    try:
+        with connection() as conn:
+            rows = conn.execute(
+                f"SELECT key FROM records WHERE collection = ? AND {field} >= ? AND {field} <= ? ORDER BY {field}, key",
+                (collection,) + range_bounds(start_date, end_date)
+            )
+            return [key for key, in rows]
+    except Exception as e:
+        st.error(f"Failed to read data from {collection}: {str(e)}")
+        return []
+
+def count_data(collection):
+    """Count the records in a collection"""
+    try:
+        with connection() as conn:
+            return conn.execute("SELECT COUNT(*) FROM records WHERE collection = ?", (collection,)).fetchone()[0]
+    except Exception as e:
+        st.error(f"Failed to read data from {collection}: {str(e)}")
+        return 0
+
+def write_data(collection, data):
+    """Replace a whole collection in SQLite"""
+    try:
+        with connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM records WHERE collection = ?", (collection,))
+                conn.execute("DELETE FROM record_items WHERE collection = ?", (collection,))
+                conn.execute("DELETE FROM rollups WHERE collection = ?", (collection,))
+                for key, value in data.items():
+                    put_record(conn, collection, key, value)
+                bump_version(conn, collection)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return True
+    except Exception as e:
+        st.error(f"Failed to write data to {collection}: {str(e)}")
+        return False
+
+def push_data(collection, data):
+    """Add new data with unique key to collection"""
+    try:
+        unique_key = str(uuid.uuid4())
+        with connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                put_record(conn, collection, unique_key, data)
+                bump_version(conn, collection)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return unique_key
+    except Exception as e:
+        st.error(f"Failed to push data to {collection}: {str(e)}")
+        return None
+
+def update_data(collection, key, data):
+    """Update one record in place, touching only its row"""
+    try:
+        with connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT value FROM records WHERE collection = ? AND key = ?", (collection, key)
+                ).fetchone()
+                if row:
+                    value = json.loads(row[0])
+                    value.update(data)
+                else:
+                    value = data
+                put_record(conn, collection, key, value)
+                bump_version(conn, collection)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return True
+    except Exception as e:
+        st.error(f"Failed to update data in {collection}: {str(e)}")
+        return False
+
+def delete_data(collection, key=None):
+    """Delete a record, or the whole collection when key is None"""
+    try:
+        with connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if key is None:
+                    conn.execute("DELETE FROM records WHERE collection = ?", (collection,))
+                    conn.execute("DELETE FROM record_items WHERE collection = ?", (collection,))
+                    conn.execute("DELETE FROM rollups WHERE collection = ?", (collection,))
+                else:
+                    remove_record(conn, collection, key)
+                bump_version(conn, collection)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return True
+    except Exception as e:
+        st.error(f"Failed to delete data from {collection}: {str(e)}")
+        return False
+
+def commit_batch(operations):
+    """Apply pushes, updates and increments across collections in one SQLite transaction"""
+    try:
+        with connection() as conn:
+            keys = []
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for operation in operations:
+                    collection = operation['collection']
+                    
+                    if operation['op'] == 'push':
+                        key = operation.get('key') or str(uuid.uuid4())
+                        put_record(conn, collection, key, operation['data'])
+                    
+                    elif operation['op'] in ('update', 'increment'):
+                        key = operation['key']
+                        row = conn.execute(
+                            "SELECT value FROM records WHERE collection = ? AND key = ?", (collection, key)
+                        ).fetchone()
+                        if operation['op'] == 'update':
+                            value = json.loads(row[0]) if row else {}
+                            value.update(operation['data'])
+                            put_record(conn, collection, key, value)
+                        elif row:
+                            value = json.loads(row[0])
+                            field = operation['field']
+                            new_value = value.get(field, 0) + operation['amount']
+                            if operation.get('minimum') is not None:
+                                new_value = max(operation['minimum'], new_value)
+                            value.update(operation.get('data', {}))
+                            value[field] = new_value
+                            put_record(conn, collection, key, value)
+                    
+                    elif operation['op'] == 'delete':
+                        key = operation['key']
+                        remove_record(conn, collection, key)
+                    
+                    else:
+                        raise ValueError(f"Unknown batch operation: {operation['op']}")
+                    keys.append(key)
+                for collection in {operation['collection'] for operation in operations}:
+                    bump_version(conn, collection)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return keys
+    except Exception as e:
+        st.error(f"Failed to commit changes: {str(e)}")
+        return None
+
+# SQL for each indexed field: (value expression, extra join)
+INDEX_QUERIES = {
+    'date': ("records.date", ""),
+    'payment_method': ("json_extract(records.value, '$.payment_method')", ""),
+    'id': ("json_extract(records.value, '$.id')", ""),
+    'confirmation_number': ("json_extract(records.value, '$.confirmation_number')", ""),
+    'item_id': ("record_items.item_id",
+                "JOIN record_items ON record_items.collection = records.collection AND record_items.key = records.key")
+}
+
+def lookup_index(collection, field, value):
+    """Get the keys of the records whose indexed field has value"""
+    expression, join = INDEX_QUERIES[field]
+    with connection() as conn:
+        rows = conn.execute(
+            f"SELECT DISTINCT records.key FROM records {join} WHERE records.collection = ? AND {expression} = ?",
+            (collection, value)
+        )
+        # Sorted here: ORDER BY key would steer SQLite to the primary key over the field's index
+        return sorted(key for key, in rows)
+
+def lookup_prefix(collection, field, prefix):
+    """Get the keys of the records whose indexed field starts with prefix, as an index range scan"""
+    expression, join = INDEX_QUERIES[field]
+    with connection() as conn:
+        rows = conn.execute(
+            f"SELECT DISTINCT records.key FROM records {join} "
+            f"WHERE records.collection = ? AND {expression} >= ? AND {expression} <= ?",
+            (collection, prefix, prefix + "\U0010ffff")
+        )
+        return sorted(key for key, in rows)
+
+def group_index(collection, field, keys=None):
+    """Group record keys by an indexed field, optionally only within keys"""
+    if keys is not None:
+        keys = set(keys)
+    
+    expression, join = INDEX_QUERIES[field]
+    with connection() as conn:
+        rows = conn.execute(
+            f"SELECT DISTINCT {expression}, records.key FROM records {join} "
+            f"WHERE records.collection = ? AND {expression} IS NOT NULL ORDER BY records.key",
+            (collection,)
+        ).fetchall()
+    groups = {}
+    for value, key in rows:
+        if keys is None or key in keys:
+            groups.setdefault(value, []).append(key)
+    return groups
+
+def read_records(collection, keys):
+    """Read just the given records by primary key"""
+    try:
+        keys = list(keys)
+        data = {}
+        with connection() as conn:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT key, value FROM records WHERE collection = ? AND key IN ({', '.join('?' * len(chunk))})",
+                    [collection] + chunk
+                )
+                data.update({key: json.loads(value) for key, value in rows})
+            return data
+    except Exception as e:
+        st.error(f"Failed to read data from {collection}: {str(e)}")
+        return {}
+
+def rebuild_index(collection):
+    """Rebuild the item index rows and SQL indexes for a collection"""
+    with connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute("SELECT key, value FROM records WHERE collection = ?", (collection,)).fetchall()
+            for key, value in rows:
+                put_record(conn, collection, key, json.loads(value))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("REINDEX records")
+
+def rebuild_rollups(collection):
+    """Recompute a collection's daily rollup rows from its records"""
+    with connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute("SELECT key, value FROM records WHERE collection = ?", (collection,))
+            rollups = rollup_records(collection, {key: json.loads(value) for key, value in rows})
+            conn.execute("DELETE FROM rollups WHERE collection = ?", (collection,))
+            conn.executemany(
+                "INSERT INTO rollups (collection, day, value) VALUES (?, ?, ?)",
+                [(collection, day, json.dumps(rollup)) for day, rollup in rollups.items()]
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    _verified_rollups.add(collection)
+    return True
+
+def verify_rollups(collection):
+    """Rebuild a collection's rollups once per process if their counts disagree with it"""
+    if collection in _verified_rollups:
+        return
+    with connection() as conn:
+        rows = conn.execute("SELECT value FROM rollups WHERE collection = ?", (collection,)).fetchall()
+    if sum(json.loads(value).get('count', 0) for value, in rows) != count_data(collection):
+        rebuild_rollups(collection)
+    _verified_rollups.add(collection)
+
+def read_rollups(collection, start_date, end_date):
+    """Read a collection's daily rollup rows for the days within [start_date, end_date]"""
+    try:
+        verify_rollups(collection)
+        with connection() as conn:
+            rows = conn.execute(
+                "SELECT day, value FROM rollups WHERE collection = ? AND day BETWEEN ? AND ?",
+                (collection, str(start_date)[:10], str(end_date)[:10])
+            )
+            return {day: json.loads(value) for day, value in rows}
+    except Exception as e:
+        st.error(f"Failed to read data from {collection}: {str(e)}")
+        return {}
+
+def get_database_ref(path):
+    """Compatibility function - not needed for SQLite storage"""
+    return None
+
+def initialize_storage():
+    """Initialize SQLite storage"""
+    with connection():
+        pass
+    return True
+
+def migrate_json_files():
+    """Import every JSON collection (logs and day partitions included) into SQLite"""
+    ensure_data_directory()
+    collections = sorted({
+        name.rsplit('.', 1)[0] for name in os.listdir(DATA_DIR)
+        if name.endswith(('.json', '.jsonl')) and not name.startswith(('.', '_'))
+    } | set(PARTITIONED_COLLECTIONS))
+    
+    with connection() as conn:
+        imported = {}
+        for collection in collections:
+            if collection in PARTITIONED_COLLECTIONS:
+                data = {}
+                for partition in list_partitions(collection):
+                    data.update(read_store(get_partition_store(collection, partition)))
+            else:
+                data = read_store(collection)
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for key, value in data.items():
+                    put_record(conn, collection, key, value)
+                bump_version(conn, collection)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            imported[collection] = len(data)
+        return imported
+
+if __name__ == "__main__":
+    # One-shot migration: python sqlite_storage.py
+    for collection, count in migrate_json_files().items():
+        print(f"Imported {count} records into {collection}")
@@ -1,24 +1,231 @@
 import streamlit as st
-from local_storage import read_data
+from storage import (
+    read_data, read_range, read_records, read_rollups, range_keys, lookup_index, lookup_prefix, group_index,
+    combine_rollups, cache_by_version
+)
 import pandas as pd
+import numpy as np
 from datetime import datetime, timedelta
 from collections import Counter
 import plotly.express as px
 import plotly.graph_objects as go
 
+# One row per sold item; the transaction's own fields repeat on each of its rows
+LINE_ITEM_COLUMNS = (
+    'transaction_id', 'date', 'time', 'timestamp', 'payment_method', 'total',
+    'confirmation_number', 'customer_notes', 'item_id', 'name', 'category', 'sku', 'quantity', 'price'
+)
+CATEGORICAL_COLUMNS = ('transaction_id', 'date', 'payment_method', 'item_id', 'name', 'category', 'sku')
+CATEGORIES = ['Drink', 'Snack', 'Other']
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+# Transaction browser: searches run on these indexed fields, sorts on the key order
+SEARCH_FIELDS = {'Transaction ID': 'id', 'Zelle Confirmation': 'confirmation_number', 'Item': 'item_id'}
+SORT_ORDERS = ['Newest first', 'Oldest first', 'Payment method']
+PAGE_SIZES = [25, 50, 100]
+
+# Charts: sales are bucketed by day, week or month so a chart keeps at most
+# about MAX_CHART_BARS bars, and the reasons pie shows the TOP_REASONS largest
+CHART_BUCKETS = [('Daily', 'D', 1), ('Weekly', 'W-MON', 7), ('Monthly', 'MS', 31)]
+MAX_CHART_BARS = 60
+TOP_REASONS = 8
+
+def build_line_items(transactions, inventory=None):
+    """Flatten transactions into a columnar line-item frame, in one pass over the records
+    
+    A transaction without items keeps one row with no item, so it still
+    counts as a sale. Category and SKU are the ones stored on the item when
+    it was sold; older sales that backfill_line_items.py has not reached yet
+    take the current inventory's.
+    """
+    inventory = inventory or {}
+    columns = {column: [] for column in LINE_ITEM_COLUMNS}
+    for trans_id, trans in transactions.items():
+        items = [item for item in trans.get('items', []) if isinstance(item, dict)] or [{}]
+        for item in items:
+            # Items sold without a category fall back to the inventory's
+            details = item if not item or item.get('category') else inventory.get(item.get('id'))
+            details = details if isinstance(details, dict) else {}
+            columns['transaction_id'].append(trans.get('id', trans_id))
+            columns['date'].append(trans.get('date', ''))
+            columns['time'].append(trans.get('time', ''))
+            columns['timestamp'].append(trans.get('timestamp'))
+            columns['payment_method'].append(trans.get('payment_method') or 'Unknown')
+            columns['total'].append(trans.get('total', 0))
+            columns['confirmation_number'].append(str(trans.get('confirmation_number') or ''))
+            columns['customer_notes'].append(trans.get('customer_notes', ''))
+            columns['item_id'].append(item.get('id'))
+            columns['name'].append(item.get('name'))
+            columns['category'].append((details.get('category') or 'Other') if item else None)
+            columns['sku'].append(details.get('sku') or None)
+            columns['quantity'].append(item.get('quantity', 0))
+            columns['price'].append(item.get('price', 0))
+    
+    line_items = pd.DataFrame(columns, columns=list(LINE_ITEM_COLUMNS))
+    line_items['timestamp'] = pd.to_datetime(line_items['timestamp'], errors='coerce', format='ISO8601')
+    line_items['total'] = pd.to_numeric(line_items['total'], errors='coerce').fillna(0)
+    line_items['quantity'] = pd.to_numeric(line_items['quantity'], errors='coerce').fillna(0)
+    line_items['price'] = pd.to_numeric(line_items['price'], errors='coerce').fillna(0)
+    
+    for column in CATEGORICAL_COLUMNS:
+        line_items[column] = line_items[column].astype('category')
+    return line_items
+
+def summarize_transactions(line_items):
+    """Collapse line items back to one row per transaction"""
+    has_item = line_items['item_id'].notna()
+    labels = line_items['name'].astype(str) + " x" + line_items['quantity'].astype(int).astype(str)
+    
+    grouped = line_items.groupby('transaction_id', observed=True, sort=False)
+    transactions = grouped.agg(
+        date=('date', 'first'),
+        time=('time', 'first'),
+        payment_method=('payment_method', 'first'),
+        total=('total', 'first'),
+        confirmation_number=('confirmation_number', 'first'),
+        customer_notes=('customer_notes', 'first'),
+        item_count=('item_id', 'count'),
+        quantity=('quantity', 'sum'),
+    )
+    
+    # Join each transaction's item labels over sorted runs, not one Python group at a time
+    codes = line_items['transaction_id'].cat.codes.to_numpy()[has_item.to_numpy()]
+    labels = labels[has_item].to_numpy(dtype=object)
+    order = np.argsort(codes, kind='stable')
+    codes, labels = codes[order], labels[order]
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]) if len(codes) else np.array([], dtype=int)
+    ends = np.r_[starts[1:], len(codes)]
+    items = np.full(len(line_items['transaction_id'].cat.categories), '', dtype=object)
+    items[codes[starts]] = [", ".join(labels[start:end]) for start, end in zip(starts, ends)]
+    transactions['items'] = items[transactions.index.codes]
+    return transactions
+
+@cache_by_version('transactions', 'inventory')
+def load_sales_frames(start_date, end_date):
+    """Build the line-item and per-sale frames of a date range, once per data version"""
+    line_items = build_line_items(read_range('transactions', start_date, end_date), read_data('inventory') or {})
+    return line_items, summarize_transactions(line_items)
+
+@cache_by_version('turned_away')
+def load_turned_away_rollups(start_date, end_date):
+    """Read the turned-away rollups of a date range and their total"""
+    # One rollup row per day in the range instead of every record
+    daily_turned_away = read_rollups('turned_away', start_date, end_date)
+    return daily_turned_away, combine_rollups(daily_turned_away)
+
+def hourly_heatmap(daily_rollups):
+    """Bin per-day rollups into a weekday x hour grid of counts
+    
+    Each day's hourly breakdown becomes one (weekday, hour, count) row and
+    np.bincount adds them up, so a season costs a few thousand rows.
+    """
+    days, hours, counts = [], [], []
+    for day, rollup in daily_rollups.items():
+        for hour, hourly in rollup.get('hours', {}).items():
+            if hour.isdigit():
+                days.append(day)
+                hours.append(int(hour))
+                counts.append(hourly.get('count', 0))
+    if not days:
+        return np.zeros((7, 24))
+    
+    # Days since the epoch, shifted so Monday is 0 (1970-01-01 was a Thursday)
+    weekdays = (np.array(days, dtype='datetime64[D]').astype(np.int64) + 3) % 7
+    cells = weekdays * 24 + np.array(hours)
+    return np.bincount(cells, weights=counts, minlength=7 * 24).reshape(7, 24)
+
+@cache_by_version('transactions', 'turned_away')
+def load_hourly_traffic(start_date, end_date):
+    """Get the weekday x hour grids of sales and turned-away customers"""
+    return (hourly_heatmap(read_rollups('transactions', start_date, end_date)),
+            hourly_heatmap(read_rollups('turned_away', start_date, end_date)))
+
+@cache_by_version('transactions', 'inventory')
+def find_transaction_keys(start_date, end_date, sort_order, payment_method, search_by, search):
+    """Get the keys of the matching transactions in display order, from the indexes alone"""
+    keys = range_keys('transactions', start_date, end_date, 'timestamp')
+    if sort_order != 'Oldest first':
+        keys.reverse()
+    
+    if payment_method != 'All':
+        matched = set(lookup_index('transactions', 'payment_method', payment_method))
+        keys = [key for key in keys if key in matched]
+    
+    search = search.strip()
+    if search:
+        if search_by == 'Item':
+            # Item names are matched in the inventory, then looked up by id
+            item_ids = [item_id for item_id, item in (read_data('inventory') or {}).items()
+                        if search.lower() in str(item.get('name', '')).lower()] + [search]
+            matched = {key for item_id in item_ids for key in lookup_index('transactions', 'item_id', item_id)}
+        else:
+            matched = set(lookup_prefix('transactions', SEARCH_FIELDS[search_by], search))
+            if search_by == 'Transaction ID':
+                # Older records show their storage key as the ID
+                matched.update(key for key in keys if key.startswith(search))
+        keys = [key for key in keys if key in matched]
+    
+    if sort_order == 'Payment method':
+        # A stable sort keeps the newest first within each method
+        methods = {key: value for value, value_keys in group_index('transactions', 'payment_method', keys).items()
+                   for key in value_keys}
+        keys.sort(key=lambda key: str(methods.get(key, '')))
+    return keys
+
+def load_transaction_page(keys):
+    """Read and summarize just the transactions on one page, in the given order"""
+    records = read_records('transactions', keys)
+    return summarize_transactions(build_line_items({key: records[key] for key in keys if key in records}))
+
+def choose_chart_bucket(start_date, end_date):
+    """Pick the smallest bucket that keeps a range's charts within MAX_CHART_BARS bars"""
+    days = (pd.Timestamp(end_date) - pd.Timestamp(start_date)).days + 1
+    for label, frequency, bucket_days in CHART_BUCKETS:
+        if days <= MAX_CHART_BARS * bucket_days:
+            return label, frequency
+    return CHART_BUCKETS[-1][:2]
+
+@cache_by_version('transactions')
+def build_sales_figures(start_date, end_date):
+    """Build the transaction count and revenue charts of a range from the daily rollups
+    
+    The figures are returned as plain dicts, which come out of the cache far
+    faster than Figure objects and which st.plotly_chart takes as they are.
+    """
+    daily_sales = read_rollups('transactions', start_date, end_date)
+    if not daily_sales:
+        return None
+    
+    label, frequency = choose_chart_bucket(start_date, end_date)
+    daily = pd.DataFrame(
+        [(rollup.get('count', 0), rollup.get('revenue', 0)) for rollup in daily_sales.values()],
+        index=pd.to_datetime(list(daily_sales)), columns=['count', 'revenue']
+    ).sort_index()
+    buckets = daily.resample(frequency, label='left', closed='left').sum()
+    dates = buckets.index.strftime('%Y-%m-%d').tolist()
+    
+    count_fig = px.bar(x=dates, y=buckets['count'].tolist(), labels={'x': 'Date', 'y': 'Transactions'})
+    revenue_fig = px.bar(x=dates, y=buckets['revenue'].round(2).tolist(), labels={'x': 'Date', 'y': 'Revenue ($)'})
+    return label, count_fig.to_dict(), revenue_fig.to_dict()
+
+@cache_by_version('turned_away')
+def build_reason_figure(start_date, end_date):
+    """Build the turned-away reasons pie, folding all but the largest reasons into one slice"""
+    reason_counts = Counter(load_turned_away_rollups(start_date, end_date)[1].get('reasons', {}))
+    top_reasons = reason_counts.most_common(TOP_REASONS)
+    other = sum(reason_counts.values()) - sum(count for _, count in top_reasons)
+    if other:
+        top_reasons.append((f"Other reasons ({len(reason_counts) - TOP_REASONS})", other))
+    return px.pie(
+        values=[count for _, count in top_reasons],
+        names=[reason for reason, _ in top_reasons],
+        title="Turned Away Reasons"
+    ).to_dict()
+
 def statistics_page():
     """Comprehensive statistics and analytics page"""
     st.header("📊 Statistics & Analytics")
     
-    # Load all data
-    transactions_data = read_data('transactions') or {}
-    turned_away_data = read_data('turned_away') or {}
-    inventory_data = read_data('inventory') or {}
-    
-    if not transactions_data and not turned_away_data:
-        st.info("No data available yet. Make some sales or track turned away customers to see statistics.")
-        return
-    
     # Date filter
     col1, col2 = st.columns(2)
     with col1:
@@ -26,68 +233,60 @@ def statistics_page():
     with col2:
         end_date = st.date_input("End Date", value=datetime.now().date())
     
-    # Filter data by date range
-    filtered_transactions = filter_data_by_date(transactions_data, start_date, end_date)
-    filtered_turned_away = filter_data_by_date(turned_away_data, start_date, end_date)
+    # Every transaction tab is a groupby over these two frames
+    line_items, sales = load_sales_frames(start_date, end_date)
+    daily_turned_away, turned_away = load_turned_away_rollups(start_date, end_date)
+    
+    if sales.empty and not daily_turned_away:
+        st.info("No data available for the selected dates. Make some sales or track turned away customers to see statistics.")
+        return
     
     # Main metrics
-    display_key_metrics(filtered_transactions, filtered_turned_away, inventory_data)
+    display_key_metrics(sales, turned_away)
     
     st.divider()
     
     # Create tabs for different analytics
-    tab1, tab2, tab3, tab4, tab5 = st.tabs([
+    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
         "Sales Analytics", 
         "Payment Analytics", 
         "Category Analytics", 
         "Turned Away Analytics", 
+        "Hourly Patterns",
         "Transaction Details"
     ])
     
     with tab1:
-        display_sales_analytics(filtered_transactions, inventory_data)
+        display_sales_analytics(start_date, end_date)
     
     with tab2:
-        display_payment_analytics(filtered_transactions)
+        display_payment_analytics(sales)
     
     with tab3:
-        display_category_analytics(filtered_transactions, inventory_data)
+        display_category_analytics(line_items)
     
     with tab4:
-        display_turned_away_analytics(filtered_turned_away)
+        display_turned_away_analytics(turned_away, start_date, end_date)
     
     with tab5:
-        display_transaction_details(filtered_transactions)
-
-def filter_data_by_date(data, start_date, end_date):
-    """Filter data by date range"""
-    if not data:
-        return {}
-    
-    filtered = {}
-    for key, item in data.items():
-        try:
-            item_date = datetime.strptime(item.get('date', ''), '%Y-%m-%d').date()
-            if start_date <= item_date <= end_date:
-                filtered[key] = item
-        except:
-            continue
-    
-    return filtered
+        display_hourly_patterns(*load_hourly_traffic(start_date, end_date))
+    
+    with tab6:
+        display_transaction_details(sales, start_date, end_date)
 
-def display_key_metrics(transactions, turned_away, inventory):
+def display_key_metrics(sales, turned_away):
     """Display key performance metrics"""
     st.subheader("📈 Key Metrics")
     
     # Calculate metrics
-    total_transactions = len(transactions)
-    total_revenue = sum(t.get('total', 0) for t in transactions.values())
+    total_transactions = len(sales)
+    total_revenue = sales['total'].sum()
     avg_transaction = total_revenue / total_transactions if total_transactions > 0 else 0
-    total_turned_away = len(turned_away)
+    total_turned_away = turned_away.get('count', 0)
     
     # Get payment type breakdown
-    payment_wrong_type = sum(1 for t in turned_away.values() 
-                           if 'wrong payment' in t.get('reason', '').lower())
+    payment_wrong_type = sum(count for reason, count in turned_away.get('reasons', {}).items()
+                             if 'wrong payment' in reason.lower())
     
     # Display metrics in columns
     col1, col2, col3, col4, col5 = st.columns(5)
@@ -107,144 +306,114 @@ def display_key_metrics(transactions, turned_away, inventory):
     with col5:
         st.metric("Wrong Payment", payment_wrong_type)
 
-def display_sales_analytics(transactions, inventory):
+def display_sales_analytics(start_date, end_date):
     """Display sales analytics"""
     st.subheader("💰 Sales Analytics")
     
-    if not transactions:
+    # Cached figures, bucketed to the range's length
+    figures = build_sales_figures(start_date, end_date)
+    if figures is None:
         st.info("No sales data for selected period.")
         return
+    label, count_fig, revenue_fig = figures
     
-    # Daily sales chart
-    daily_sales = {}
-    daily_revenue = {}
-    
-    for trans in transactions.values():
-        date = trans.get('date', '')
-        if date:
-            daily_sales[date] = daily_sales.get(date, 0) + 1
-            daily_revenue[date] = daily_revenue.get(date, 0) + trans.get('total', 0)
-    
-    if daily_sales:
-        # Create daily sales chart
-        dates = list(daily_sales.keys())
-        sales_counts = list(daily_sales.values())
-        revenues = list(daily_revenue.values())
-        
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            st.subheader("Daily Transaction Count")
-            fig = px.bar(x=dates, y=sales_counts, labels={'x': 'Date', 'y': 'Transactions'})
-            st.plotly_chart(fig, use_container_width=True)
-        
-        with col2:
-            st.subheader("Daily Revenue")
-            fig = px.bar(x=dates, y=revenues, labels={'x': 'Date', 'y': 'Revenue ($)'})
-            st.plotly_chart(fig, use_container_width=True)
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        st.subheader(f"{label} Transaction Count")
+        st.plotly_chart(count_fig, use_container_width=True)
+    
+    with col2:
+        st.subheader(f"{label} Revenue")
+        st.plotly_chart(revenue_fig, use_container_width=True)
 
-def display_payment_analytics(transactions):
+def display_payment_analytics(sales):
     """Display payment method analytics"""
     st.subheader("💳 Payment Method Analytics")
     
-    if not transactions:
+    if sales.empty:
         st.info("No transaction data for selected period.")
         return
     
     # Count payment methods
-    payment_methods = [t.get('payment_method', 'Unknown') for t in transactions.values()]
-    payment_counts = Counter(payment_methods)
+    payment_counts = sales['payment_method'].value_counts(sort=True)
+    payment_counts = payment_counts[payment_counts > 0]
     
-    if payment_counts:
+    if not payment_counts.empty:
         col1, col2 = st.columns(2)
         
         with col1:
             st.subheader("Payment Method Usage")
             fig = px.pie(
-                values=list(payment_counts.values()),
-                names=list(payment_counts.keys()),
+                values=payment_counts.tolist(),
+                names=payment_counts.index.astype(str).tolist(),
                 title="Payment Methods Used"
             )
             st.plotly_chart(fig, use_container_width=True)
         
         with col2:
             st.subheader("Payment Method Stats")
-            df = pd.DataFrame([
-                {'Payment Method': method, 'Count': count, 'Percentage': f"{count/sum(payment_counts.values())*100:.1f}%"}
-                for method, count in payment_counts.most_common()
-            ])
+            df = pd.DataFrame({
+                'Payment Method': payment_counts.index.astype(str),
+                'Count': payment_counts.values,
+                'Percentage': (payment_counts / payment_counts.sum() * 100).map(lambda share: f"{share:.1f}%").values
+            })
             st.dataframe(df, use_container_width=True)
 
-def display_category_analytics(transactions, inventory):
+def display_category_analytics(line_items):
     """Display category sales analytics"""
     st.subheader("🏷️ Category Sales Analytics")
     
-    if not transactions:
+    if line_items.empty:
         st.info("No transaction data for selected period.")
         return
     
     # Count items by category
-    category_counts = {'Drink': 0, 'Snack': 0, 'Other': 0}
-    category_revenue = {'Drink': 0, 'Snack': 0, 'Other': 0}
-    
-    for trans in transactions.values():
-        for item in trans.get('items', []):
-            item_id = item.get('id')
-            quantity = item.get('quantity', 0)
-            price = item.get('price', 0)
-            
-            # Find category from inventory
-            if inventory and item_id in inventory:
-                category = inventory[item_id].get('category', 'Other')
-            else:
-                category = 'Other'
-            
-            if category in category_counts:
-                category_counts[category] += quantity
-                category_revenue[category] += price * quantity
+    by_category = line_items.assign(revenue=line_items['price'] * line_items['quantity']).groupby(
+        'category', observed=True)[['quantity', 'revenue']].sum().reindex(CATEGORIES, fill_value=0)
+    category_counts = by_category['quantity']
     
     # Display category analytics
     col1, col2 = st.columns(2)
     
     with col1:
         st.subheader("Items Sold by Category")
-        st.metric("Drinks Sold", category_counts['Drink'])
-        st.metric("Snacks Sold", category_counts['Snack'])
-        st.metric("Other Items Sold", category_counts['Other'])
+        st.metric("Drinks Sold", int(category_counts['Drink']))
+        st.metric("Snacks Sold", int(category_counts['Snack']))
+        st.metric("Other Items Sold", int(category_counts['Other']))
     
     with col2:
         st.subheader("Revenue by Category")
-        if any(category_counts.values()):
+        if category_counts.any():
             fig = px.bar(
-                x=list(category_counts.keys()),
-                y=list(category_revenue.values()),
+                x=CATEGORIES,
+                y=by_category['revenue'].tolist(),
                 labels={'x': 'Category', 'y': 'Revenue ($)'},
                 title="Revenue by Category"
             )
             st.plotly_chart(fig, use_container_width=True)
 
-def display_turned_away_analytics(turned_away):
+def display_turned_away_analytics(turned_away, start_date, end_date):
     """Display turned away analytics"""
     st.subheader("👋 Turned Away Analytics")
     
-    if not turned_away:
+    if not turned_away.get('count'):
         st.info("No turned away data for selected period.")
         return
     
     # Count reasons
-    reasons = [t.get('reason', 'Unknown') for t in turned_away.values()]
-    reason_counts = Counter(reasons)
+    reason_counts = Counter(turned_away.get('reasons', {}))
     
     # Specifically track wrong payment type
-    wrong_payment_count = sum(1 for reason in reasons 
-                            if 'wrong payment' in reason.lower())
+    wrong_payment_count = sum(count for reason, count in reason_counts.items()
+                              if 'wrong payment' in reason.lower())
     
     col1, col2 = st.columns(2)
     
     with col1:
         st.subheader("Turned Away Reasons")
         st.metric("Wrong Payment Type", wrong_payment_count)
-        st.metric("Total Turned Away", len(turned_away))
+        st.metric("Total Turned Away", turned_away['count'])
         
         # Show top reasons
         if reason_counts:
@@ -255,65 +424,130 @@ def display_turned_away_analytics(turned_away):
     with col2:
         if reason_counts:
             st.subheader("Reason Distribution")
-            fig = px.pie(
-                values=list(reason_counts.values()),
-                names=list(reason_counts.keys()),
-                title="Turned Away Reasons"
-            )
-            st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(build_reason_figure(start_date, end_date), use_container_width=True)
+
+def peak_cell(grid):
+    """Label the weekday and hour with the highest count in a grid"""
+    if not grid.any():
+        return "—"
+    day, hour = np.unravel_index(grid.argmax(), grid.shape)
+    return f"{WEEKDAYS[day]} {hour:02d}:00"
+
+def display_hourly_patterns(sales_grid, turned_away_grid):
+    """Display sales, turned away customers and conversion by weekday and hour"""
+    st.subheader("🕒 Hourly Patterns")
+    
+    if not sales_grid.any() and not turned_away_grid.any():
+        st.info("No data for selected period.")
+        return
+    
+    # Share of visitors who bought, where anyone came by
+    visitors = sales_grid + turned_away_grid
+    conversion = np.divide(sales_grid * 100, visitors, out=np.full(visitors.shape, np.nan), where=visitors > 0)
+    
+    # Only show the hours that had any traffic
+    active_hours = np.flatnonzero(visitors.any(axis=0))
+    hours = np.arange(active_hours.min(), active_hours.max() + 1)
+    hour_labels = [f"{hour:02d}:00" for hour in hours]
+    
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        st.metric("Conversion Rate", f"{sales_grid.sum() / visitors.sum() * 100:.1f}%")
+    
+    with col2:
+        st.metric("Busiest Sales Hour", peak_cell(sales_grid))
+    
+    with col3:
+        st.metric("Most Turned Away", peak_cell(turned_away_grid))
+    
+    view = st.radio("Show", ["Sales", "Turned Away", "Conversion Rate (%)"], horizontal=True)
+    grid, scale = {
+        "Sales": (sales_grid, "Blues"),
+        "Turned Away": (turned_away_grid, "Reds"),
+        "Conversion Rate (%)": (conversion, "RdYlGn")
+    }[view]
+    
+    fig = px.imshow(
+        grid[:, hours],
+        x=hour_labels,
+        y=WEEKDAYS,
+        labels={'x': 'Hour', 'y': 'Weekday', 'color': view},
+        color_continuous_scale=scale,
+        aspect='auto',
+        text_auto='.0f'
+    )
+    st.plotly_chart(fig, use_container_width=True)
 
-def display_transaction_details(transactions):
-    """Display detailed transaction information"""
+def display_transaction_details(sales, start_date, end_date):
+    """Display detailed transaction information, one page at a time"""
     st.subheader("🧾 Transaction Details")
     
-    if not transactions:
+    if sales.empty:
         st.info("No transaction data for selected period.")
         return
     
-    # Create detailed transaction table
-    transaction_list = []
+    # Search, filter and sort controls
+    col1, col2, col3, col4 = st.columns([1, 2, 1, 1])
     
-    for trans_id, trans in transactions.items():
-        items_str = ", ".join([f"{item['name']} x{item['quantity']}" 
-                              for item in trans.get('items', [])])
-        item_count = len(trans.get('items', []))
-        total_quantity = sum(item.get('quantity', 0) for item in trans.get('items', []))
-        
-        confirmation_info = ""
-        if trans.get('payment_method') == 'Zelle' and trans.get('confirmation_number'):
-            confirmation_info = f" (Conf: {trans.get('confirmation_number')})"
-        
-        transaction_list.append({
-            'Transaction ID': trans.get('id', trans_id)[:8] + "...",
-            'Date': trans.get('date', ''),
-            'Time': trans.get('time', ''),
-            'Items': items_str,
-            'Item Count': item_count,
-            'Total Quantity': total_quantity,
-            'Total Amount': f"${trans.get('total', 0):.2f}",
-            'Payment Method': trans.get('payment_method', '') + confirmation_info,
-            'Customer Notes': trans.get('customer_notes', '')
-        })
+    with col1:
+        search_by = st.selectbox("Search by", list(SEARCH_FIELDS))
     
-    # Sort by date and time
-    transaction_list.sort(key=lambda x: f"{x['Date']} {x['Time']}", reverse=True)
+    with col2:
+        search = st.text_input("Search", placeholder="Start of an ID or confirmation number, or an item name")
     
-    if transaction_list:
-        df = pd.DataFrame(transaction_list)
-        st.dataframe(df, use_container_width=True)
-        
-        # Summary stats
-        st.subheader("Transaction Summary")
-        col1, col2, col3 = st.columns(3)
+    with col3:
+        payment_method = st.selectbox("Payment", ['All'] + sorted(sales['payment_method'].astype(str).unique()))
+    
+    with col4:
+        sort_order = st.selectbox("Sort", SORT_ORDERS)
+    
+    keys = find_transaction_keys(start_date, end_date, sort_order, payment_method, search_by, search)
+    if not keys:
+        st.info("No transactions match the search.")
+    else:
+        col1, col2 = st.columns([1, 3])
         
         with col1:
-            avg_items_per_transaction = sum(t['Item Count'] for t in transaction_list) / len(transaction_list)
-            st.metric("Avg Items per Transaction", f"{avg_items_per_transaction:.1f}")
+            page_size = st.selectbox("Rows per page", PAGE_SIZES)
         
         with col2:
-            avg_quantity_per_transaction = sum(t['Total Quantity'] for t in transaction_list) / len(transaction_list)
-            st.metric("Avg Quantity per Transaction", f"{avg_quantity_per_transaction:.1f}")
+            page_count = (len(keys) + page_size - 1) // page_size
+            page = st.number_input(f"Page (of {page_count})", min_value=1, value=1)
+        
+        # Only the visible page is read from storage
+        first = (min(page, page_count) - 1) * page_size
+        page_sales = load_transaction_page(keys[first:first + page_size])
+        st.caption(f"Showing {first + 1}–{first + len(page_sales)} of {len(keys)} transactions")
         
-        with col3:
-            total_items_sold = sum(t['Total Quantity'] for t in transaction_list)
-            st.metric("Total Items Sold", total_items_sold)
\ No newline at end of file
+        zelle = (page_sales['payment_method'].astype(str) == 'Zelle') & (page_sales['confirmation_number'] != '')
+        confirmation_info = (" (Conf: " + page_sales['confirmation_number'] + ")").where(zelle, '')
+        
+        df = pd.DataFrame({
+            'Transaction ID': page_sales.index.astype(str).str[:8] + "...",
+            'Date': page_sales['date'].astype(str).values,
+            'Time': page_sales['time'].values,
+            'Items': page_sales['items'].values,
+            'Item Count': page_sales['item_count'].values,
+            'Total Quantity': page_sales['quantity'].values,
+            'Total Amount': page_sales['total'].map(lambda total: f"${total:.2f}").values,
+            'Payment Method': (page_sales['payment_method'].astype(str) + confirmation_info).values,
+            'Customer Notes': page_sales['customer_notes'].values
+        })
+        st.dataframe(df, use_container_width=True, hide_index=True)
+    
+    # Summary stats
+    st.subheader("Transaction Summary")
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        avg_items_per_transaction = sales['item_count'].mean()
+        st.metric("Avg Items per Transaction", f"{avg_items_per_transaction:.1f}")
+    
+    with col2:
+        avg_quantity_per_transaction = sales['quantity'].mean()
+        st.metric("Avg Quantity per Transaction", f"{avg_quantity_per_transaction:.1f}")
+    
+    with col3:
+        total_items_sold = sales['quantity'].sum()
+        st.metric("Total Items Sold", int(total_items_sold))
@@ -0,0 +1,176 @@
+import functools
+import hashlib
+import importlib
+import os
+import streamlit as st
+from storage_common import add_rollup
+
+# Storage backends by name. Each module implements every function in
+# BACKEND_FUNCTIONS with the same signatures; it is imported only when chosen.
+BACKENDS = {
+    'json': 'local_storage',
+    'sqlite': 'sqlite_storage',
+    'firebase': 'firebase_config',
+    'memory': 'memory_storage',
+}
+
+# The backend protocol. Operations for commit_batch are documented on
+# local_storage.commit_batch.
+BACKEND_FUNCTIONS = (
+    'initialize_storage',   # ()
+    'read_data',            # (collection) -> {key: record}
+    'read_records',         # (collection, keys) -> {key: record}, batch read
+    'read_range',           # (collection, start_date, end_date, field='date') -> {key: record}
+    'range_keys',           # (collection, start_date, end_date, field='date') -> [keys] in field order
+    'count_data',           # (collection) -> int
+    'write_data',           # (collection, data) -> bool, replaces the collection
+    'push_data',            # (collection, data) -> new key or None
+    'update_data',          # (collection, key, data) -> bool, merges fields
+    'delete_data',          # (collection, key=None) -> bool
+    'commit_batch',         # (operations) -> [keys] or None, batch write
+    'lookup_index',         # (collection, field, value) -> [keys]
+    'lookup_prefix',        # (collection, field, prefix) -> [keys] whose value starts with prefix
+    'group_index',          # (collection, field, keys=None) -> {value: [keys]}
+    'read_rollups',         # (collection, start_date, end_date) -> {date: rollup}
+    'rebuild_rollups',      # (collection) -> bool, recomputes rollups from the records
+    'get_version',          # (collection) -> hashable token that changes with every write
+)
+
+# Results kept per cached page computation before the least recently used go
+CACHE_MAX_ENTRIES = 16
+
+_backends = {}
+
+def register_backend(name, module_name):
+    """Register a backend module under a name usable in POS_STORAGE_BACKEND"""
+    BACKENDS[name] = module_name
+    _backends.pop(name, None)
+
+def get_backend_name():
+    """Get the name of the configured backend"""
+    return os.getenv("POS_STORAGE_BACKEND", "json")
+
+def get_backend(name=None):
+    """Import and return a backend module, checking it implements the protocol"""
+    name = name or get_backend_name()
+    if name not in _backends:
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown storage backend: {name} (expected one of {', '.join(sorted(BACKENDS))})")
+        
+        module = importlib.import_module(BACKENDS[name])
+        missing = [function for function in BACKEND_FUNCTIONS if not callable(getattr(module, function, None))]
+        if missing:
+            raise TypeError(f"Storage backend {name} is missing: {', '.join(missing)}")
+        _backends[name] = module
+    return _backends[name]
+
+def initialize_storage():
+    """Initialize the configured backend"""
+    return get_backend().initialize_storage()
+
+def read_data(collection):
+    """Read every record in a collection"""
+    return get_backend().read_data(collection)
+
+def read_records(collection, keys):
+    """Read just the given records"""
+    return get_backend().read_records(collection, keys)
+
+def read_range(collection, start_date, end_date, field='date'):
+    """Read the records whose date (or timestamp) is within [start_date, end_date]"""
+    return get_backend().read_range(collection, start_date, end_date, field)
+
+def range_keys(collection, start_date, end_date, field='date'):
+    """Get the keys of the records within a date (or timestamp) range, in that field's order"""
+    return get_backend().range_keys(collection, start_date, end_date, field)
+
+def count_data(collection):
+    """Count the records in a collection"""
+    return get_backend().count_data(collection)
+
+def write_data(collection, data):
+    """Replace a whole collection"""
+    return get_backend().write_data(collection, data)
+
+def push_data(collection, data):
+    """Add a record under a new unique key"""
+    return get_backend().push_data(collection, data)
+
+def update_data(collection, key, data):
+    """Merge fields into one record"""
+    return get_backend().update_data(collection, key, data)
+
+def delete_data(collection, key=None):
+    """Delete one record, or the whole collection when key is None"""
+    return get_backend().delete_data(collection, key)
+
+def commit_batch(operations):
+    """Apply several operations across collections as one commit"""
+    return get_backend().commit_batch(operations)
+
+def lookup_index(collection, field, value):
+    """Get the keys of the records whose indexed field has value"""
+    return get_backend().lookup_index(collection, field, value)
+
+def lookup_prefix(collection, field, prefix):
+    """Get the keys of the records whose indexed field starts with prefix"""
+    return get_backend().lookup_prefix(collection, field, prefix)
+
+def group_index(collection, field, keys=None):
+    """Group record keys by an indexed field"""
+    return get_backend().group_index(collection, field, keys)
+
+def read_rollups(collection, start_date, end_date):
+    """Read a collection's per-day rollups (see storage_common.build_rollup)"""
+    return get_backend().read_rollups(collection, start_date, end_date)
+
+def rebuild_rollups(collection):
+    """Recompute a collection's rollups from its records"""
+    return get_backend().rebuild_rollups(collection)
+
+def get_version(collection):
+    """Get a token that changes whenever a collection does"""
+    return get_backend().get_version(collection)
+
+def cache_by_version(*collections, max_entries=CACHE_MAX_ENTRIES):
+    """Cache a page computation until a collection it reads changes
+    
+    Results are kept by st.cache_data under the call's arguments plus the
+    backend and the collections' current versions, so a write invalidates
+    exactly the results built from what it changed. Superseded results are
+    never hit again and fall out least recently used first past max_entries.
+    """
+    def decorator(function):
+        def compute(backend, version_digest, *args, **kwargs):
+            return function(*args, **kwargs)
+        # st.cache_data keeps one store per function name
+        compute.__module__ = function.__module__
+        compute.__qualname__ = f"{function.__qualname__}.cached"
+        compute = st.cache_data(max_entries=max_entries, show_spinner=False)(compute)
+        
+        @functools.wraps(function)
+        def cached(*args, **kwargs):
+            versions = tuple(get_version(collection) for collection in collections)
+            # A JSON version lists every day's file signature; one digest of it
+            # hashes far faster in st.cache_data than the nested tuples
+            digest = hashlib.sha1(repr(versions).encode()).hexdigest()
+            return compute(get_backend_name(), digest, *args, **kwargs)
+        cached.clear = compute.clear
+        return cached
+    return decorator
+
+def combine_rollups(rollups):
+    """Add up per-day rollups into one total for the whole range"""
+    total = {}
+    for rollup in rollups.values():
+        add_rollup(total, rollup)
+    return total
+
+if __name__ == "__main__":
+    # Recompute the rollups of the configured backend: python storage.py [collection ...]
+    import sys
+    from storage_common import ROLLUP_COLLECTIONS
+    initialize_storage()
+    for collection in sys.argv[1:] or ROLLUP_COLLECTIONS:
+        rebuild_rollups(collection)
+        print(f"Rebuilt rollups of {collection}")
@@ -0,0 +1,142 @@
+"""Record helpers shared by every storage backend: day partitioning, range
+bounds, sorted timelines, index grouping and per-day rollups. They work on
+records in hand and touch no storage themselves."""
+
+import bisect
+import re
+
+# Records are dated by their 'date' field; records without a valid one
+# belong to this day
+UNDATED_PARTITION = "undated"
+DATE_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+# Range reads on these fields can use a sorted (value, key) timeline
+TIMELINE_FIELDS = ('date', 'timestamp')
+
+# Fields with a secondary index in backends that keep one. item_id indexes
+# the ids of a transaction's items
+INDEXED_FIELDS = {
+    'transactions': ('date', 'payment_method', 'item_id', 'id', 'confirmation_number')
+}
+
+# Collections with per-day rollups: counts and totals for the day with an
+# hourly breakdown, so statistics read a few rows per day
+ROLLUP_COLLECTIONS = ('transactions', 'turned_away')
+
+def get_partition_name(record):
+    """Get the day partition a record belongs to"""
+    date = record.get('date') if isinstance(record, dict) else None
+    if isinstance(date, str) and DATE_PATTERN.match(date):
+        return date
+    return UNDATED_PARTITION
+
+def in_range(value, start, end):
+    """Check a field value against inclusive range bounds
+    
+    Bounds match on their own length, so date bounds cover whole days of
+    ISO timestamps.
+    """
+    return isinstance(value, str) and start <= value[:len(start)] and value[:len(end)] <= end
+
+def new_timeline():
+    """Empty timeline: (value, key) pairs in sorted order, and each key's value"""
+    return {'entries': [], 'values': {}}
+
+def timeline_set(timeline, key, value):
+    """Move a key to a new field value in a timeline; a non-string value drops it"""
+    entries = timeline['entries']
+    old = timeline['values'].pop(key, None)
+    if old is not None:
+        index = bisect.bisect_left(entries, (old, key))
+        if index < len(entries) and entries[index] == (old, key):
+            del entries[index]
+    if isinstance(value, str):
+        timeline['values'][key] = value
+        entry = (value, key)
+        # New records are usually the latest, so this is mostly an append
+        if not entries or entries[-1] <= entry:
+            entries.append(entry)
+        else:
+            bisect.insort(entries, entry)
+
+def timeline_range(timeline, start, end):
+    """Get the keys whose value is within [start, end], matching bounds as in_range does"""
+    entries = timeline['entries']
+    # A value no longer than end, or extending it, sorts before end + U+FFFF
+    low = bisect.bisect_left(entries, (start,))
+    high = bisect.bisect_left(entries, (end + "\uffff",), low)
+    return [key for _, key in entries[low:high]]
+
+def extract_index_fields(collection, record):
+    """Get the indexed field values of one record"""
+    fields = {}
+    for field in INDEXED_FIELDS[collection]:
+        if field == 'item_id':
+            values = [item.get('id') for item in record.get('items', []) if isinstance(item, dict)]
+        else:
+            values = [record.get(field)]
+        fields[field] = sorted({value for value in values if value is not None}, key=str)
+    return fields
+
+def group_records(collection, records, field):
+    """Group the keys of in-hand records by a field, for backends without an index"""
+    groups = {}
+    for key in sorted(records):
+        record = records[key]
+        if not isinstance(record, dict):
+            continue
+        if field in INDEXED_FIELDS.get(collection, ()):
+            values = extract_index_fields(collection, record)[field]
+        else:
+            values = [record[field]] if record.get(field) is not None else []
+        for value in values:
+            groups.setdefault(value, []).append(key)
+    return groups
+
+def build_rollup(collection, record):
+    """Get one record's contribution to its day's rollup"""
+    time_of_day = record.get('time') or str(record.get('timestamp', ''))[11:]
+    hour = time_of_day[:2] if time_of_day[:2].isdigit() else 'unknown'
+    rollup = {'count': 1}
+    hourly = {'count': 1}
+    
+    if collection == 'transactions':
+        rollup['revenue'] = hourly['revenue'] = record.get('total', 0)
+        rollup['payments'] = {record.get('payment_method') or 'Unknown': 1}
+        items = {}
+        for item in record.get('items', []):
+            if isinstance(item, dict):
+                quantity = item.get('quantity', 0)
+                totals = items.setdefault(str(item.get('id') or 'Unknown'), {'quantity': 0, 'revenue': 0})
+                totals['quantity'] += quantity
+                totals['revenue'] += item.get('price', 0) * quantity
+        rollup['items'] = items
+    elif collection == 'turned_away':
+        rollup['reasons'] = {record.get('reason') or 'Unknown': 1}
+    
+    rollup['hours'] = {hour: hourly}
+    return rollup
+
+def add_rollup(rollup, delta, sign=1):
+    """Add (or with sign=-1 take away) a delta in place, dropping totals that reach zero"""
+    for key, value in delta.items():
+        if isinstance(value, dict):
+            child = rollup.get(key)
+            child = add_rollup(child if isinstance(child, dict) else {}, value, sign)
+        else:
+            child = rollup.get(key, 0)
+            # Rounding keeps money sums from drifting as sales come and go
+            child = round((child if isinstance(child, (int, float)) else 0) + sign * value, 6)
+        if child:
+            rollup[key] = child
+        else:
+            rollup.pop(key, None)
+    return rollup
+
+def rollup_records(collection, records):
+    """Roll up in-hand records by day, for rebuilds and backends without stored rollups"""
+    rollups = {}
+    for record in records.values():
+        if isinstance(record, dict):
+            add_rollup(rollups.setdefault(get_partition_name(record), {}), build_rollup(collection, record))
+    return {day: rollup for day, rollup in rollups.items() if rollup}
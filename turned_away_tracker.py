@@ -1,5 +1,5 @@
 import streamlit as st
-from local_storage import push_data, read_data
+from storage import push_data, read_range, count_data
 from datetime import datetime
 import uuid
 
@@ -87,19 +87,16 @@ def display_recent_turned_away():
     """Display recent turned away entries"""
     st.subheader("📊 Recent Turned Away Entries")
     
-    turned_away_data = read_data('turned_away')
+    total_entries = count_data('turned_away')
     
-    if not turned_away_data:
+    if not total_entries:
         st.info("No turned away entries yet today.")
         return
     
-    # Convert to list and sort by timestamp (most recent first)
-    entries = list(turned_away_data.values())
-    entries.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
-    
-    # Filter for today's entries
+    # Load only today's partition, most recent first
     today = datetime.now().strftime('%Y-%m-%d')
-    today_entries = [entry for entry in entries if entry.get('date') == today]
+    today_entries = list(read_range('turned_away', today, today).values())
+    today_entries.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
     
     if today_entries:
         st.write(f"**Today's turned away count: {len(today_entries)}**")
@@ -114,7 +111,7 @@ def display_recent_turned_away():
         st.info("No turned away entries for today yet.")
     
     # Summary statistics
-    if turned_away_data:
+    if total_entries:
         st.divider()
         st.subheader("📈 Summary Statistics")
         
@@ -124,7 +121,7 @@ def display_recent_turned_away():
             st.metric("Today's Turned Away", len(today_entries))
         
         with col2:
-            st.metric("Total All Time", len(entries))
+            st.metric("Total All Time", total_entries)
         
         with col3:
             # Most common reason analysis
@@ -77,6 +77,13 @@ def validate_inventory_item(name, price, category):
     
     return errors
 
+def item_details(item_data):
+    """Get the inventory fields stored on each sold item, so reports never join the inventory"""
+    return {
+        'category': item_data.get('category') or 'Other',
+        'sku': item_data.get('sku', '')
+    }
+
 def format_item_display(item_data):
     """Format item data for display"""
     name = item_data.get('name', 'Unknown Item')